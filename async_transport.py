@@ -0,0 +1,267 @@
+"""Optional asyncio transport built on the vendored aiohttp.
+
+A dedicated thread runs an asyncio event loop that owns one long-lived
+`aiohttp.ClientSession`. Its `TCPConnector` keeps connections alive and caps
+them per proxy host, so any number of requests can be in flight at once
+without a worker thread each. The main thread hands coroutines to the loop
+with `submit`, which returns a thread-safe `concurrent.futures.Future`
+(see `JobEngine.submit_coroutine`).
+
+Like `transport`, nothing here touches bpy. aiohttp is imported lazily;
+`async_transport_available()` tells whether it can be used at all.
+
+Closing the transport cancels whatever still runs on its loop, so every
+future handed out by `submit` resolves. When the shared transport is
+rebuilt with a different per-host limit, the old one is only closed once
+its in-flight coroutines have finished (see `close_when_idle`).
+"""
+import asyncio
+import threading
+import time
+
+from .transport import USER_AGENT, ProxyHTTPError, _create_ssl_context, breaker_for, parse_retry_after
+
+
+DEFAULT_LIMIT_PER_HOST = 4
+KEEPALIVE_TIMEOUT = 60
+# a replaced transport is closed after this long even if requests still run
+DRAIN_TIMEOUT = 300.0
+
+
+def async_transport_available():
+    try:
+        import aiohttp  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+class AsyncProxyTransport:
+    """Event-loop thread plus the shared aiohttp session it owns."""
+
+    def __init__(self, limit_per_host=DEFAULT_LIMIT_PER_HOST, keepalive_timeout=KEEPALIVE_TIMEOUT):
+        import aiohttp
+
+        self._aiohttp = aiohttp
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'errors': 0, 'http_errors': 0, 'in_flight': 0, 'retries': 0}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='BlenderCopilotAsync', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._open_session(), self._loop).result(timeout=10)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _open_session(self):
+        connector = self._aiohttp.TCPConnector(
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ssl=_create_ssl_context(),
+        )
+        self._session = self._aiohttp.ClientSession(connector=connector, headers={'User-Agent': USER_AGENT})
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self._counters[name] += delta
+
+    def submit(self, coro):
+        """Schedule `coro` on the loop thread and return a concurrent.futures.Future."""
+        self._count('in_flight')
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        future.add_done_callback(lambda _f: self._count('in_flight', -1))
+        return future
+
+    def _timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+        # no total limit: a streamed answer may legitimately take minutes
+        return self._aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+    def error_cause(self, error):
+        """'connect' or 'read' for retryable transport errors of aiohttp, else None."""
+        aiohttp = self._aiohttp
+        if isinstance(error, aiohttp.ClientConnectorError):
+            return 'connect'
+        if isinstance(error, (asyncio.TimeoutError, aiohttp.ServerDisconnectedError, aiohttp.ClientPayloadError)):
+            return 'read'
+        return None
+
+    async def open(self, method, url, headers=None, json_body=None, timeout=30, retry=None):
+        """Send a request and return the aiohttp response with its body unread.
+
+        Use the response as an async context manager to release it. With a
+        `transport.RetryState` as `retry`, transient failures are retried on
+        the same URL as the state allows. Raises `ProxyHTTPError` for
+        statuses >= 400 and `CircuitOpenError` while the endpoint's breaker
+        is open. Loop thread only.
+        """
+        breaker = breaker_for(url)
+        while True:
+            breaker.allow()
+            self._count('requests')
+            try:
+                resp = await self._session.request(method, url, headers=headers, json=json_body,
+                                                   timeout=self._timeout(timeout))
+            except asyncio.CancelledError:
+                breaker.release_trial()
+                raise
+            except Exception as e:
+                self._count('errors')
+                breaker.record_failure()
+                if not await self._wait_for_retry(retry, self.error_cause(e), e):
+                    raise
+                continue
+            if resp.status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if resp.status < 400:
+                return resp
+            self._count('http_errors')
+            try:
+                body = await resp.text()
+            except Exception:
+                body = ''
+            resp.release()
+            error = ProxyHTTPError(url, resp.status, body, dict(resp.headers))
+            if not await self._wait_for_retry(retry, resp.status, error,
+                                              parse_retry_after(resp.headers.get('Retry-After'))):
+                raise error
+
+    async def _wait_for_retry(self, retry, cause, error, retry_after=None):
+        if retry is None:
+            return False
+        delay = retry.next_delay(cause, error, retry_after)
+        if delay is None:
+            return False
+        self._count('retries')
+        await asyncio.sleep(delay)
+        return True
+
+    async def fetch_text(self, method, url, headers=None, json_body=None, timeout=30):
+        resp = await self.open(method, url, headers=headers, json_body=json_body, timeout=timeout)
+        async with resp:
+            return await resp.text()
+
+    async def race(self, candidates, attempt):
+        """Async counterpart of `transport.race`: first non-None `await attempt(candidate)` wins.
+
+        Losing attempts are cancelled; a loser that already produced an
+        aiohttp response has it released. Returns (candidate, result, errors).
+        """
+        candidates = list(candidates)
+        tasks = {asyncio.ensure_future(attempt(candidate)): candidate for candidate in candidates}
+        errors = {}
+        winner = None
+        pending = set(tasks)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        errors[tasks[task]] = task.exception()
+                    elif task.result() is not None and winner is None:
+                        winner = task
+                    elif task.result() is not None and hasattr(task.result(), 'release'):
+                        task.result().release()
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(_release_result)
+        if winner is None:
+            return None, None, errors
+        return tasks[winner], winner.result(), errors
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({'limit_per_host': self.limit_per_host, 'backend': 'aiohttp'})
+        return counters
+
+    async def _close_session(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _shutdown(self):
+        # a task left pending when the loop stops would never resolve its future
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._close_session()
+
+    def close(self):
+        """Cancel running coroutines, close the session and stop the loop thread.
+
+        Safe to call from the main thread.
+        """
+        if not self._loop.is_running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(timeout=5)
+        except Exception as e:
+            print(f"BlenderCopilot: could not close async session cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def close_when_idle(self, timeout=DRAIN_TIMEOUT):
+        """`close` from a background thread once nothing submitted is in flight, or after `timeout` seconds."""
+        def drain():
+            deadline = time.monotonic() + timeout
+            while self.stats()['in_flight'] > 0 and time.monotonic() < deadline:
+                time.sleep(0.1)
+            self.close()
+
+        threading.Thread(target=drain, name='BlenderCopilotAsyncDrain', daemon=True).start()
+
+
+def _release_result(task):
+    if task.cancelled() or task.exception() is not None:
+        return
+    result = task.result()
+    if hasattr(result, 'release'):
+        result.release()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_async_transport(limit_per_host=None):
+    """Return the shared async transport, rebuilding it if a different per-host limit is requested."""
+    global _transport
+    with _transport_lock:
+        if _transport is None or (limit_per_host and limit_per_host != _transport.limit_per_host):
+            old = _transport
+            _transport = AsyncProxyTransport(limit_per_host or DEFAULT_LIMIT_PER_HOST)
+            if old is not None:
+                # requests already submitted to the old loop run to completion
+                old.close_when_idle()
+        return _transport
+
+
+def async_transport_stats():
+    transport = _transport
+    if transport is None:
+        return {}
+    return transport.stats()
+
+
+def close_async_transport():
+    global _transport
+    with _transport_lock:
+        transport, _transport = _transport, None
+    if transport is not None:
+        transport.close()
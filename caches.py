@@ -0,0 +1,385 @@
+"""In-memory caches with optional on-disk persistence for Blender Copilot.
+
+Cache files live in a `blender_copilot` folder inside Blender's user config
+directory so they survive add-on reloads and Blender restarts. All caches are
+thread-safe: they are read and written from both the main thread and the
+request engine's worker threads.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import bpy
+
+
+CACHE_DIR_NAME = 'blender_copilot'
+
+_cache_dir = None
+
+
+def get_cache_dir():
+    """Return (and create) the directory used for persisted caches."""
+    global _cache_dir
+    if _cache_dir:
+        return _cache_dir
+    path = None
+    try:
+        path = bpy.utils.user_resource('CONFIG', path=CACHE_DIR_NAME, create=True)
+    except TypeError:
+        # Blender < 2.90 names the argument `subdir`
+        try:
+            path = bpy.utils.user_resource('CONFIG', CACHE_DIR_NAME, create=True)
+        except Exception:
+            path = None
+    except Exception:
+        path = None
+    if not path:
+        path = os.path.join(os.path.expanduser('~'), '.cache', CACHE_DIR_NAME)
+    try:
+        os.makedirs(path, exist_ok=True)
+    except Exception as e:
+        print(f"BlenderCopilot: could not create cache dir {path}: {e}")
+    _cache_dir = path
+    return path
+
+
+def write_json_atomic(path, data):
+    """Write JSON next to `path` and rename it into place so readers never see half a file."""
+    tmp = f"{path}.tmp{threading.get_ident()}"
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def read_json(path, default=None):
+    try:
+        with open(path, 'r', encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return default
+    except Exception as e:
+        print(f"BlenderCopilot: ignoring unreadable cache file {path}: {e}")
+        return default
+
+
+class PersistentTTLCache:
+    """Small key/value store whose entries expire after `ttl` seconds.
+
+    Keys are strings; values must be JSON serialisable. Entries are loaded
+    lazily from `filename` in the cache dir and written back on every change.
+    Timestamps are wall-clock so ages stay meaningful across restarts.
+    """
+
+    def __init__(self, filename, ttl=24 * 3600):
+        self.filename = filename
+        self.ttl = ttl
+        self._entries = None
+        self._lock = threading.RLock()
+
+    @property
+    def path(self):
+        return os.path.join(get_cache_dir(), self.filename)
+
+    def _load(self):
+        if self._entries is None:
+            data = read_json(self.path, {})
+            self._entries = data if isinstance(data, dict) else {}
+        return self._entries
+
+    def _save(self):
+        try:
+            write_json_atomic(self.path, self._entries)
+        except Exception as e:
+            print(f"BlenderCopilot: could not persist {self.filename}: {e}")
+
+    def get_entry(self, key):
+        """Return (value, age_seconds) regardless of freshness, or (None, None)."""
+        with self._lock:
+            entry = self._load().get(key)
+        if not isinstance(entry, dict) or 'value' not in entry:
+            return None, None
+        return entry['value'], max(0.0, time.time() - entry.get('ts', 0))
+
+    def get(self, key, ttl=None):
+        """Return the value for `key` if it is younger than `ttl` (default: the cache TTL)."""
+        value, age = self.get_entry(key)
+        if age is None:
+            return None
+        max_age = self.ttl if ttl is None else ttl
+        if max_age and age > max_age:
+            return None
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._load()[key] = {'value': value, 'ts': time.time()}
+            self._save()
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._load().pop(key, None) is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+
+_endpoint_cache = PersistentTTLCache('endpoints.json')
+
+
+def endpoint_cache_key(base_url, path_prefix, model, kind):
+    """Key for the endpoint cache: one entry per (proxy, path prefix, model, endpoint kind)."""
+    return '|'.join((kind, base_url or '', path_prefix or '', model or ''))
+
+
+def get_cached_endpoint(base_url, path_prefix, model, kind, ttl=None):
+    return _endpoint_cache.get(endpoint_cache_key(base_url, path_prefix, model, kind), ttl)
+
+
+def remember_endpoint(base_url, path_prefix, model, kind, url):
+    # refreshing the timestamp on every success keeps a working endpoint cached
+    _endpoint_cache.set(endpoint_cache_key(base_url, path_prefix, model, kind), url)
+
+
+def forget_endpoint(base_url, path_prefix, model, kind):
+    _endpoint_cache.invalidate(endpoint_cache_key(base_url, path_prefix, model, kind))
+
+
+def clear_endpoint_cache():
+    _endpoint_cache.clear()
+
+
+_model_cache = PersistentTTLCache('models.json')
+_LAST_MODELS_KEY = '__last__'
+
+
+def model_cache_key(base_url, path_prefix, api_key):
+    """Key for the model catalogue: proxy URL plus a hash of the API key (never the key itself)."""
+    key_hash = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16] if api_key else ''
+    return '|'.join((base_url or '', path_prefix or '', key_hash))
+
+
+def get_cached_models(cache_key):
+    """Return (models, age_seconds) for the catalogue, stale or not; (None, None) if unknown."""
+    if not cache_key:
+        return None, None
+    models, age = _model_cache.get_entry(cache_key)
+    if not isinstance(models, list):
+        return None, None
+    return models, age
+
+
+def remember_models(cache_key, models):
+    if not cache_key or not models:
+        return
+    _model_cache.set(cache_key, list(models))
+    _model_cache.set(_LAST_MODELS_KEY, cache_key)
+
+
+def last_cached_models():
+    """Return the most recently fetched catalogue regardless of which proxy it came from."""
+    last_key, _age = _model_cache.get_entry(_LAST_MODELS_KEY)
+    models, _age = get_cached_models(last_key)
+    return models
+
+
+def clear_model_cache():
+    _model_cache.clear()
+
+
+class ResponseCache:
+    """LRU cache of generated code, bounded by total size and mirrored to disk.
+
+    Each entry is one small JSON file named after its key in `dirname`; file
+    modification times carry the LRU order across restarts. The in-memory
+    index only tracks key -> size, bodies are read from disk on a hit.
+    """
+
+    def __init__(self, dirname='responses', max_bytes=32 * 1024 * 1024):
+        self.dirname = dirname
+        self.hits = 0
+        self.misses = 0
+        self._max_bytes = max_bytes
+        self._index = None
+        self._bytes = 0
+        # the directory is only created by the first write
+        self._dir_ready = False
+        self._lock = threading.RLock()
+
+    @property
+    def path(self):
+        return os.path.join(get_cache_dir(), self.dirname)
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value):
+        """Change the size limit; a smaller one evicts right away. Safe from any thread."""
+        with self._lock:
+            if value == self._max_bytes:
+                return
+            self._max_bytes = value
+            if self._index is not None:
+                self._evict()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, f"{key}.json")
+
+    def _load(self):
+        if self._index is not None:
+            return self._index
+        from collections import OrderedDict
+
+        entries = []
+        try:
+            for name in os.listdir(self.path):
+                if not name.endswith('.json'):
+                    continue
+                st = os.stat(os.path.join(self.path, name))
+                entries.append((st.st_mtime, name[:-len('.json')], st.st_size))
+        except FileNotFoundError:
+            # nothing was stored yet
+            pass
+        except Exception as e:
+            print(f"BlenderCopilot: could not scan response cache: {e}")
+        entries.sort()
+        self._index = OrderedDict((key, size) for _mtime, key, size in entries)
+        self._bytes = sum(self._index.values())
+        return self._index
+
+    def get(self, key):
+        with self._lock:
+            index = self._load()
+            if key not in index:
+                self.misses += 1
+                return None
+            data = read_json(self._entry_path(key))
+            if not isinstance(data, dict) or not data.get('code'):
+                self._discard(key)
+                self.misses += 1
+                return None
+            index.move_to_end(key)
+            try:
+                os.utime(self._entry_path(key))
+            except Exception:
+                pass
+            self.hits += 1
+            return data['code']
+
+    def put(self, key, code, **meta):
+        if not key or not code or self._max_bytes <= 0:
+            return
+        with self._lock:
+            index = self._load()
+            record = dict(meta, code=code, ts=time.time())
+            try:
+                if not self._dir_ready:
+                    os.makedirs(self.path, exist_ok=True)
+                    self._dir_ready = True
+                write_json_atomic(self._entry_path(key), record)
+                size = os.path.getsize(self._entry_path(key))
+            except Exception as e:
+                print(f"BlenderCopilot: could not store cached response: {e}")
+                return
+            self._bytes += size - index.pop(key, 0)
+            index[key] = size
+            self._evict()
+
+    def _evict(self):
+        index = self._index
+        while index and self._bytes > self._max_bytes:
+            oldest = next(iter(index))
+            self._discard(oldest)
+
+    def _discard(self, key):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"BlenderCopilot: could not remove cached response {key}: {e}")
+
+    def discard(self, key):
+        with self._lock:
+            self._load()
+            self._discard(key)
+
+    def stats(self):
+        with self._lock:
+            index = self._load()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._load()):
+                self._discard(key)
+            self.hits = 0
+            self.misses = 0
+
+
+response_cache = ResponseCache()
+
+
+class SceneContextCache:
+    """Last scene context built per scene, reused while the scene digest and the options are unchanged.
+
+    Entries are (blocks, tokens): the context strings sent with a request and
+    their estimated token count. In memory only.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, scene, digest, options=()):
+        with self._lock:
+            entry = self._entries.get(scene)
+            if entry is not None and entry[0] == (digest, options):
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, scene, digest, options, blocks, tokens):
+        with self._lock:
+            self._entries[scene] = ((digest, options), (list(blocks), tokens))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+scene_context_cache = SceneContextCache()
+
+
+def response_cache_key(model, messages, scene_digest=''):
+    """Canonical hash of everything that determines a generation's answer.
+
+    `messages` already holds the system prompt, scene context, the packed
+    history and the user prompt, in order. `scene_digest` (see
+    `scene_index.scene_digest`) covers the scene state the messages only
+    summarise, such as exact transforms, so a cached script is not reused
+    after the scene changed.
+    """
+    canonical = json.dumps(
+        {'model': model or '', 'messages': messages, 'scene': scene_digest or ''},
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
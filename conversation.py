@@ -0,0 +1,391 @@
+"""Token-budgeted packing of the chat history into request messages.
+
+Instead of a fixed number of recent messages, `pack_messages` keeps the
+system prompt and the current request and then adds history newest-first
+while it fits the model's context budget. Token counts come from a local
+approximation of BPE tokenizers (no tokenizer package is needed in Blender's
+Python) and are cached per message text, so repacking a long session only
+counts the new messages.
+
+Earlier generated scripts can also be replaced by a short structural
+fingerprint (`code_fingerprint`), so long sessions do not re-send every
+listing verbatim.
+
+The layout is kept friendly to provider prompt caches, which discount and
+speed up requests that start with a long, byte-identical prefix: the
+system prompt comes first, then scene-context blocks, then the history,
+and the volatile request last, preceded by any context that depends on it
+(`layout_tail`). Old history is dropped in steps of `HISTORY_DROP_STEP`
+messages so the start of the history does not shift on every turn.
+Messages are sent in the form they keep as history, with one exception:
+with history compaction on, the latest script goes out in full and is
+replaced by its fingerprint once a newer script exists, so on the turn
+after each generation the shared prefix ends at that script.
+`PrefixTracker` reports how much of each request repeats the previous one,
+and where it stopped.
+
+Free of bpy: callers convert the chat history to message dicts first.
+"""
+import ast
+import hashlib
+import re
+import threading
+from collections import Counter, OrderedDict
+
+
+# max_tokens of every completion request; reserved out of the context window
+MAX_COMPLETION_TOKENS = 1500
+# role and separator tokens the chat format adds around each message
+MESSAGE_OVERHEAD = 4
+
+# Context windows (tokens) by model name prefix; the longest matching prefix wins.
+MODEL_CONTEXT_TOKENS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4': 8192,
+    'gpt-4-32k': 32768,
+    'gpt-4-turbo': 128000,
+    'gpt-4-1106': 128000,
+    'gpt-4-0125': 128000,
+    'gpt-4o': 128000,
+    'gpt-4.1': 1000000,
+    'o1': 128000,
+    'o3': 200000,
+    'o4': 200000,
+    # 400k window, of which at most 272k can be input
+    'gpt-5': 272000,
+    'claude': 200000,
+    'gemini': 1000000,
+    'grok': 131072,
+    'grok-4': 256000,
+    'grok-code-fast': 256000,
+    'mistral': 32768,
+    'llama': 8192,
+}
+# for models not in the table, e.g. local ones behind the proxy
+DEFAULT_CONTEXT_TOKENS = 8192
+# Old history is dropped in multiples of this many messages (two per turn),
+# so the packed history keeps the same start for a few turns in a row.
+HISTORY_DROP_STEP = 6
+
+# words, digit runs, whitespace runs, single other characters
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d+|\s+|[^\sA-Za-z\d]")
+
+
+class _BoundedCache:
+    """Small thread-safe LRU mapping for per-message derived values."""
+
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+_counts = _BoundedCache(4096)
+_fingerprints = _BoundedCache(512)
+
+
+def _count_pieces(text):
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        first = piece[0]
+        if first.isalpha():
+            # common words are one token, long identifiers split every few letters
+            tokens += (len(piece) + 5) // 6
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        elif first.isspace():
+            # a single space merges into the next word; indentation and
+            # newlines are grouped a few characters per token
+            if piece != ' ':
+                tokens += (len(piece) + 3) // 4
+        else:
+            tokens += 1
+    return tokens
+
+
+def estimate_tokens(text):
+    """Approximate number of tokens in `text`, erring slightly high for code."""
+    if not text:
+        return 0
+    key = (len(text), hash(text))
+    count = _counts.get(key)
+    if count is None:
+        count = _count_pieces(text)
+        _counts.put(key, count)
+    return count
+
+
+def message_tokens(message):
+    return estimate_tokens(message.get('content') or '') + MESSAGE_OVERHEAD
+
+
+def model_context_tokens(model):
+    """Context window of `model` in tokens, from `MODEL_CONTEXT_TOKENS`."""
+    name = (model or '').lower().split('/')[-1]
+    best = ''
+    for prefix in MODEL_CONTEXT_TOKENS:
+        if name.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return MODEL_CONTEXT_TOKENS[best] if best else DEFAULT_CONTEXT_TOKENS
+
+
+def context_budget(model, limit=None):
+    """Prompt tokens available for `model`: its window minus the completion, capped by `limit` (0/None = no cap)."""
+    budget = model_context_tokens(model) - MAX_COMPLETION_TOKENS
+    if limit:
+        budget = min(budget, int(limit))
+    return max(budget, 0)
+
+
+def _normalized(text):
+    # trailing whitespace and line endings are invisible but break byte equality
+    return '\n'.join(line.rstrip() for line in (text or '').replace('\r\n', '\n').split('\n')).strip()
+
+
+def layout_head(system_prompt, scene_blocks=None):
+    """Pinned leading messages: the system prompt, then scene context (if any), byte-stable."""
+    head = [{'role': 'system', 'content': _normalized(system_prompt)}]
+    blocks = [_normalized(block) for block in scene_blocks or () if block and block.strip()]
+    if blocks:
+        head.append({'role': 'system', 'content': '\n\n'.join(blocks)})
+    return head
+
+
+def layout_tail(request_blocks=None):
+    """Messages sent right before the request: context chosen for this prompt, which would break the prefix earlier."""
+    blocks = [_normalized(block) for block in request_blocks or () if block and block.strip()]
+    return [{'role': 'system', 'content': '\n\n'.join(blocks)}] if blocks else []
+
+
+def pack_messages(head, history, request_message, budget, drop_step=1, tail=()):
+    """Return (messages, report) with as much recent history as fits into `budget` tokens.
+
+    The `head` messages (see `layout_head`), the `tail` messages (see
+    `layout_tail`) and `request_message` are always included. History is added newest-first and stops at the first message
+    that does not fit, so the conversation stays contiguous; the number of
+    dropped messages is rounded up to a multiple of `drop_step`, and an
+    assistant answer whose question did not fit is dropped as well. `report`
+    holds the packed token estimate and how many history messages were kept
+    and dropped.
+    """
+    used = sum(message_tokens(message) for message in list(head) + list(tail)) + message_tokens(request_message)
+    fitting = 0
+    for message in reversed(history):
+        cost = message_tokens(message)
+        if used + cost > budget:
+            break
+        fitting += 1
+        used += cost
+    dropped = len(history) - fitting
+    if dropped and drop_step > 1:
+        dropped = min(len(history), -(-dropped // drop_step) * drop_step)
+    for message in history[len(history) - fitting:dropped]:
+        used -= message_tokens(message)
+    kept = history[dropped:]
+    while kept and kept[0].get('role') == 'assistant':
+        used -= message_tokens(kept[0])
+        kept = kept[1:]
+
+    report = {
+        'tokens': used,
+        'budget': budget,
+        'history': len(kept),
+        'dropped': len(history) - len(kept),
+    }
+    return list(head) + kept + list(tail) + [request_message], report
+
+
+def describe_packing(report):
+    """One-line summary of a `pack_messages` report for the panel."""
+    if not report:
+        return ''
+    summary = f"~{report['tokens']} of {report['budget']} tokens, {report['history']} history messages"
+    if report['dropped']:
+        summary += f" ({report['dropped']} older left out)"
+    if report.get('scene_tokens'):
+        summary += f", scene context ~{report['scene_tokens']} tokens"
+    if report.get('compacted'):
+        summary += f", {report['compacted']} earlier scripts summarised"
+    if report.get('prefix_tokens'):
+        summary += f", ~{report['prefix_tokens']} shared with the previous request"
+        if report.get('prefix_break'):
+            summary += f" (up to the {report['prefix_break']})"
+    return summary
+
+
+def _common_prefix_length(a, b):
+    limit = min(len(a), len(b))
+    index = 0
+    while index < limit and a[index] == b[index]:
+        index += 1
+    return index
+
+
+class PrefixTracker:
+    """Remembers the last request per key and measures the prefix the next one shares with it.
+
+    The key should identify where the provider's prompt cache lives, e.g.
+    proxy URL and model. Thread-safe.
+    """
+
+    def __init__(self):
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, messages):
+        """Record `messages` for `key`; return the prefix shared with the previous request for `key`.
+
+        The result holds `messages` (identical leading messages, which is
+        also the index of the first differing one), `bytes` (their UTF-8 size
+        plus the common start of the first differing message) and an
+        approximate `tokens` count of the same.
+        """
+        with self._lock:
+            previous = self._last.get(key) or []
+            self._last[key] = list(messages)
+        shared_messages = 0
+        shared_text = ''
+        for old, new in zip(previous, messages):
+            if old == new:
+                shared_messages += 1
+                shared_text += new.get('content') or ''
+                continue
+            if old.get('role') == new.get('role'):
+                old_content, new_content = old.get('content') or '', new.get('content') or ''
+                shared_text += new_content[:_common_prefix_length(old_content, new_content)]
+            break
+        return {
+            'messages': shared_messages,
+            'bytes': len(shared_text.encode('utf-8')),
+            'tokens': _count_pieces(shared_text) + MESSAGE_OVERHEAD * shared_messages if shared_text else 0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._last.clear()
+
+
+prefix_tracker = PrefixTracker()
+
+
+# entries listed per fingerprint line before summarising the rest
+FINGERPRINT_MAX_ITEMS = 8
+
+_OPS_RE = re.compile(r"bpy\.ops\.(\w+\.\w+)\s*\(")
+_DEF_RE = re.compile(r"^[ \t]*def[ \t]+(\w+)[ \t]*\(([^)\n]*)", re.MULTILINE)
+
+
+def _dotted(node):
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+        return '.'.join(reversed(parts))
+    return ''
+
+
+def _string(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.JoinedStr):
+        return ''.join(v.value if isinstance(v, ast.Constant) else '{}' for v in node.values)
+    return None
+
+
+class _ScriptVisitor(ast.NodeVisitor):
+    """Collects what a generated script defines, calls and creates."""
+
+    def __init__(self):
+        self.functions = []
+        self.operators = Counter()
+        self.created = {}
+        self.names = []
+
+    def visit_FunctionDef(self, node):
+        self.functions.append(f"{node.name}({', '.join(a.arg for a in node.args.args)})")
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        name = _dotted(node.func)
+        if name.startswith('bpy.ops.'):
+            self.operators[name[len('bpy.ops.'):]] += 1
+        elif name.startswith('bpy.data.') and name.endswith('.new'):
+            collection = name[len('bpy.data.'):-len('.new')]
+            label = _string(node.args[0]) if node.args else None
+            for keyword in node.keywords:
+                if keyword.arg == 'name':
+                    label = _string(keyword.value)
+            self.created.setdefault(collection, []).append(label if label is not None else '?')
+        self.generic_visit(node)
+
+    def visit_Assign(self, node):
+        value = _string(node.value)
+        if value is not None:
+            for target in node.targets:
+                if isinstance(target, ast.Attribute) and target.attr == 'name':
+                    self.names.append(value)
+        self.generic_visit(node)
+
+
+def _listing(items):
+    items = list(items)
+    shown = ', '.join(items[:FINGERPRINT_MAX_ITEMS])
+    if len(items) > FINGERPRINT_MAX_ITEMS:
+        shown += f", +{len(items) - FINGERPRINT_MAX_ITEMS} more"
+    return shown
+
+
+def _unique(values):
+    return list(dict.fromkeys(values))
+
+
+def code_fingerprint(code):
+    """Short structural summary of a generated script, to stand in for it in the history.
+
+    Lists the functions it defines, the bpy operators it calls, the data
+    blocks it creates and names it assigns, plus a content hash. Scripts that
+    do not parse fall back to a regex scan. Cached per script.
+    """
+    code = code or ''
+    digest = hashlib.sha1(code.encode('utf-8')).hexdigest()[:10]
+    cached = _fingerprints.get(digest)
+    if cached is not None:
+        return cached
+
+    visitor = _ScriptVisitor()
+    try:
+        visitor.visit(ast.parse(code))
+    except (SyntaxError, ValueError):
+        visitor.functions = [f"{name}({args.strip()})" for name, args in _DEF_RE.findall(code)]
+        visitor.operators = Counter(_OPS_RE.findall(code))
+
+    lines = [f"[Earlier script {digest} ({code.count(chr(10)) + 1} lines) omitted; what it did:]"]
+    if visitor.functions:
+        lines.append(f"functions: {_listing(_unique(visitor.functions))}")
+    if visitor.operators:
+        lines.append("operators: " + _listing(f"{op} x{count}" if count > 1 else op
+                                               for op, count in visitor.operators.items()))
+    if visitor.created:
+        lines.append("created: " + '; '.join(
+            f"{collection} {_listing(repr(n) for n in _unique(names))}" for collection, names in visitor.created.items()))
+    if visitor.names:
+        lines.append(f"named: {_listing(repr(n) for n in _unique(visitor.names))}")
+    fingerprint = '\n'.join(lines)
+    _fingerprints.put(digest, fingerprint)
+    return fingerprint
@@ -0,0 +1,401 @@
+"""Background request engine for Blender Copilot.
+
+All proxy I/O runs on a small worker thread pool so the Blender UI never blocks
+on a slow proxy. Finished jobs are handed back to the main thread by a
+dispatcher registered with `bpy.app.timers`; the dispatcher is the only place
+where job results touch bpy data (chat history, scene status props, exec).
+
+Worker functions receive the job as their first argument and must not access
+bpy. Everything they need has to be snapshotted on the main thread first
+(see `utilities.build_generation_request`).
+"""
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bpy
+
+
+JOB_QUEUED = 'QUEUED'
+JOB_RUNNING = 'RUNNING'
+JOB_DONE = 'DONE'
+JOB_FAILED = 'FAILED'
+JOB_CANCELLED = 'CANCELLED'
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+# How often the main-thread dispatcher polls while jobs are in flight (seconds)
+DISPATCH_INTERVAL = 0.1
+
+
+class CopilotJob:
+    """A unit of background work and its observable state.
+
+    `state`, `result` and `error` are written by the worker thread and read by
+    the dispatcher; `progress` is an optional callback the dispatcher invokes
+    on the main thread whenever the worker reported new partial output.
+    """
+
+    def __init__(self, job_id, kind, scene_name=None, on_complete=None, on_progress=None):
+        self.id = job_id
+        self.kind = kind
+        self.scene_name = scene_name
+        self.on_complete = on_complete
+        self.on_progress = on_progress
+        self.state = JOB_QUEUED
+        self.result = None
+        self.error = None
+        self.future = None
+        # identifies the request for caching/deduplication, set by the submitter
+        self.cache_key = None
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._partial = None
+        self._partial_dirty = False
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def cancel_event(self):
+        """The event `cancel` sets, for workers that check it between chunks of work."""
+        return self._cancel
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def report_partial(self, value):
+        """Called from the worker thread to publish partial output."""
+        with self._lock:
+            self._partial = value
+            self._partial_dirty = True
+
+    def take_partial(self):
+        """Return (changed, value) and clear the dirty flag. Main thread only."""
+        with self._lock:
+            changed = self._partial_dirty
+            self._partial_dirty = False
+            return changed, self._partial
+
+    @property
+    def elapsed(self):
+        end = self.finished_at or time.monotonic()
+        return end - (self.started_at or self.created_at)
+
+    def describe(self):
+        if self.state == JOB_RUNNING:
+            return f"Job {self.id}: running ({self.elapsed:.0f}s)"
+        return f"Job {self.id}: {self.state.lower()}"
+
+
+class JobEngine:
+    """Owns the worker pool and the bookkeeping for in-flight jobs."""
+
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='BlenderCopilot')
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, kind='generate', scene_name=None, on_complete=None, on_progress=None):
+        """Schedule `fn(job, *args)` on the worker pool and return the job."""
+        job = CopilotJob(next(self._ids), kind, scene_name=scene_name, on_complete=on_complete, on_progress=on_progress)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, fn, args)
+        job.future.add_done_callback(lambda _f: self._mark_cancelled(job))
+        ensure_dispatcher()
+        return job
+
+    def submit_coroutine(self, schedule, fn, *args, kind='generate', scene_name=None, on_complete=None,
+                         on_progress=None):
+        """Run `await fn(job, *args)` on an event loop instead of the worker pool.
+
+        `schedule(coro)` must hand the coroutine to a loop running in another
+        thread and return a concurrent.futures.Future, e.g.
+        `AsyncProxyTransport.submit`. The job is tracked and dispatched
+        exactly like one from `submit`; cancelling it cancels the task.
+        """
+        job = CopilotJob(next(self._ids), kind, scene_name=scene_name, on_complete=on_complete, on_progress=on_progress)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future = schedule(self._run_async(job, fn, args))
+        job.future.add_done_callback(lambda _f: self._mark_cancelled(job))
+        ensure_dispatcher()
+        return job
+
+    def _mark_cancelled(self, job):
+        # a future cancelled before it started never runs its body
+        if job.future.cancelled() and job.state in ACTIVE_STATES:
+            job.state = JOB_CANCELLED
+            job.finished_at = time.monotonic()
+
+    def _run(self, job, fn, args):
+        if job.cancelled:
+            job.state = JOB_CANCELLED
+            job.finished_at = time.monotonic()
+            return
+        job.state = JOB_RUNNING
+        job.started_at = time.monotonic()
+        try:
+            job.result = fn(job, *args)
+            job.state = JOB_CANCELLED if job.cancelled else JOB_DONE
+        except Exception as e:
+            job.error = e
+            job.state = JOB_FAILED
+            print(f"BlenderCopilot: job {job.id} ({job.kind}) failed: {e}")
+        finally:
+            job.finished_at = time.monotonic()
+
+    async def _run_async(self, job, fn, args):
+        if job.cancelled:
+            job.state = JOB_CANCELLED
+            job.finished_at = time.monotonic()
+            return
+        job.state = JOB_RUNNING
+        job.started_at = time.monotonic()
+        try:
+            job.result = await fn(job, *args)
+            job.state = JOB_CANCELLED if job.cancelled else JOB_DONE
+        except asyncio.CancelledError:
+            if job.cancelled:
+                job.state = JOB_CANCELLED
+            else:
+                # the transport shut down under the job: report it like any failure
+                job.error = ConnectionAbortedError("the async transport was closed")
+                job.state = JOB_FAILED
+                print(f"BlenderCopilot: job {job.id} ({job.kind}) failed: {job.error}")
+            raise
+        except Exception as e:
+            job.error = e
+            job.state = JOB_FAILED
+            print(f"BlenderCopilot: job {job.id} ({job.kind}) failed: {e}")
+        finally:
+            job.finished_at = time.monotonic()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, scene_name=None, kind=None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if scene_name is not None:
+            jobs = [j for j in jobs if j.scene_name == scene_name]
+        if kind is not None:
+            jobs = [j for j in jobs if j.kind == kind]
+        return jobs
+
+    def active_jobs(self, scene_name=None, kind=None):
+        return [j for j in self.jobs(scene_name, kind) if j.state in ACTIVE_STATES]
+
+    def cancel_all(self):
+        for job in self.jobs():
+            job.cancel()
+
+    def dispatch(self):
+        """Deliver progress and completed jobs on the main thread.
+
+        Returns True while there is still work in flight.
+        """
+        touched_scenes = set()
+        for job in self.jobs():
+            if job.on_progress is not None:
+                changed, value = job.take_partial()
+                if changed:
+                    try:
+                        job.on_progress(job, value)
+                    except Exception as e:
+                        print(f"BlenderCopilot: progress callback for job {job.id} failed: {e}")
+            if job.state in ACTIVE_STATES:
+                if job.scene_name:
+                    touched_scenes.add(job.scene_name)
+                continue
+
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            if job.scene_name:
+                touched_scenes.add(job.scene_name)
+            if job.on_complete is not None and job.state != JOB_CANCELLED:
+                try:
+                    job.on_complete(job)
+                except Exception as e:
+                    print(f"BlenderCopilot: completion callback for job {job.id} failed: {e}")
+
+        for scene_name in touched_scenes:
+            self._sync_scene_state(scene_name)
+        if touched_scenes:
+            tag_redraw_ui()
+        return bool(self.jobs())
+
+    def _sync_scene_state(self, scene_name):
+        scene = bpy.data.scenes.get(scene_name)
+        if scene is None:
+            return
+        active = self.active_jobs(scene_name)
+        try:
+            scene.copilot_button_pressed = bool(active)
+            scene.copilot_job_status = ", ".join(j.describe() for j in active)
+        except Exception:
+            pass
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.listeners = []
+        self.last_progress = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight block until it finishes and receive the same result (or
+    exception). Progress published by the running call is fanned out to every
+    caller's `on_progress`, and late joiners immediately receive the latest
+    value. Thread-safe; nothing is cached once the call has finished.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn, on_progress=None):
+        """Run `fn(publish)` once per in-flight key; return (result, shared)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            if on_progress is not None:
+                flight.listeners.append(on_progress)
+            last_progress = flight.last_progress
+
+        if not leader:
+            if on_progress is not None and last_progress is not None:
+                on_progress(last_progress)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        def publish(value):
+            with self._lock:
+                flight.last_progress = value
+                listeners = list(flight.listeners)
+            for listener in listeners:
+                try:
+                    listener(value)
+                except Exception:
+                    pass
+
+        try:
+            flight.result = fn(publish)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result, False
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._flights
+
+
+class Debouncer:
+    """Remember recent triggers so repeats within a short window can be ignored.
+
+    A trigger for `key` is a repeat when the previous one was less than
+    `window` seconds ago and carried the same `value` (or the new one carries
+    none, e.g. a second click after the input field was already cleared).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = {}
+
+    def should_ignore(self, key, window, value=''):
+        """Return True for a repeat; otherwise record the trigger and return False."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._seen.get(key)
+            if last is not None and now - last[0] < window and (not value or value == last[1]):
+                return True
+            if value:
+                self._seen[key] = (now, value)
+            return False
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = JobEngine()
+        return _engine
+
+
+def shutdown_engine():
+    global _engine
+    with _engine_lock:
+        engine, _engine = _engine, None
+    if engine is not None:
+        engine.shutdown()
+    try:
+        if bpy.app.timers.is_registered(_dispatch_timer):
+            bpy.app.timers.unregister(_dispatch_timer)
+    except Exception:
+        pass
+
+
+def _dispatch_timer():
+    engine = _engine
+    if engine is None:
+        return None
+    try:
+        busy = engine.dispatch()
+    except Exception as e:
+        print(f"BlenderCopilot: job dispatcher error: {e}")
+        busy = True
+    return DISPATCH_INTERVAL if busy else None
+
+
+def ensure_dispatcher():
+    """Make sure the main-thread dispatcher timer is running."""
+    try:
+        if not bpy.app.timers.is_registered(_dispatch_timer):
+            bpy.app.timers.register(_dispatch_timer, first_interval=DISPATCH_INTERVAL, persistent=True)
+    except Exception as e:
+        print(f"BlenderCopilot: could not register job dispatcher: {e}")
+
+
+def tag_redraw_ui():
+    """Ask every 3D View to redraw so the Copilot panel picks up new state."""
+    try:
+        for window in bpy.context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'VIEW_3D':
+                    area.tag_redraw()
+    except Exception:
+        pass
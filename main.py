@@ -21,6 +21,18 @@ except Exception:
     pass
 
 from .utilities import *
+from .engine import Debouncer, get_engine, shutdown_engine
+from .transport import close_http_client, describe_breaker, format_pool_stats, http_pool_stats, reset_breakers
+from .async_transport import async_transport_stats, close_async_transport
+from .caches import clear_endpoint_cache, clear_model_cache, response_cache, scene_context_cache
+from .retrieval import snippet_index
+from .proxy_pool import proxy_pool
+from .metrics import latency_stats
+from .conversation import describe_packing, estimate_tokens
+from .scene_index import register_handlers, scene_snapshot, scene_terms, unregister_handlers
+from .relevance import relevant_objects_block
+from .scene_summary import clear_summary_cache, scene_summary
+from .spatial import clear_spatial_cache, spatial_context
 
 bl_info = {
     "name": "Blender Copilot",
@@ -187,10 +199,28 @@ class Copilot_PT_Panel(bpy.types.Panel):
             last_mode = getattr(context.scene, 'copilot_last_proxy_mode', '')
             if last_mode:
                 proxy_box.label(text=f"Mode: {last_mode}")
+            last_context = getattr(context.scene, 'copilot_last_context', '')
+            if last_context:
+                proxy_box.label(text=f"Context: {last_context}")
             if last_url:
                 proxy_box.label(text=f"Last URL: {last_url}")
-            if last_err:
-                proxy_box.label(text=f"Last Error: {last_err}")
+            breaker = describe_breaker(last_url or proxy.get('url'))
+            if last_err or breaker not in ('', 'closed'):
+                row = proxy_box.row()
+                row.label(text=f"Last Error: {last_err}" if last_err else "Last Error: -")
+                if breaker:
+                    row.label(text=f"Circuit: {breaker}", icon='ERROR' if breaker.startswith('open') else 'NONE')
+            pool_summary = format_pool_stats(http_pool_stats())
+            if pool_summary:
+                proxy_box.label(text=pool_summary)
+            async_stats = async_transport_stats()
+            if async_stats:
+                proxy_box.label(text=f"Async transport: {async_stats['requests']} requests, "
+                                     f"{async_stats['in_flight']} in flight (max {async_stats['limit_per_host']}/host)")
+            if proxy.get('pool'):
+                proxy_box.label(text="Proxy pool (fastest first):")
+                for line in proxy_pool.describe(proxy_pool.ordered(proxy['pool'])):
+                    proxy_box.label(text=line)
         except Exception:
             pass
         
@@ -237,6 +267,9 @@ class Copilot_PT_Panel(bpy.types.Panel):
         else:
             row.label(text="Model property not found")
         row.operator("copilot.refresh_models", text="Refresh Models")
+        model_status = getattr(context.scene, 'copilot_model_status', '')
+        if model_status:
+            column.label(text=model_status)
 
         column.label(text="Enter your message:")
         if hasattr(context.scene, 'copilot_chat_input'):
@@ -245,10 +278,29 @@ class Copilot_PT_Panel(bpy.types.Panel):
             column.label(text="Input property not found")
 
         button_pressed = getattr(context.scene, 'copilot_button_pressed', False)
-        button_label = "Please wait...(this might take some time)" if button_pressed else "Execute"
+        button_label = "Send another" if button_pressed else "Execute"
         row = column.row(align=True)
-        row.operator("copilot.send_message", text=button_label)
+        send_op = row.operator("copilot.send_message", text=button_label)
+        send_op.bypass_cache = getattr(context.scene, 'copilot_bypass_cache', False)
         row.operator("copilot.clear_chat", text="Clear Chat")
+        suggestion = getattr(context.scene, 'copilot_suggestion_prompt', '')
+        if suggestion:
+            box = column.box()
+            box.label(text=f"Similar earlier prompt ({context.scene.copilot_suggestion_score:.0%}):", icon='INFO')
+            box.label(text=suggestion)
+            row = box.row(align=True)
+            row.operator("copilot.use_suggestion", text="Reuse its code")
+            ask_op = row.operator("copilot.send_message", text="Ask model")
+            ask_op.skip_retrieval = True
+
+        row = column.row(align=True)
+        if hasattr(context.scene, 'copilot_bypass_cache'):
+            row.prop(context.scene, "copilot_bypass_cache", text="Skip cache")
+        cache_stats = response_cache.stats()
+        row.label(text=f"Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        if button_pressed:
+            job_status = getattr(context.scene, 'copilot_job_status', '')
+            column.label(text=job_status or "Please wait...", icon='TIME')
 
         column.separator()
 class Copilot_OT_ConnectProxy(bpy.types.Operator):
@@ -257,57 +309,43 @@ class Copilot_OT_ConnectProxy(bpy.types.Operator):
     bl_options = {'REGISTER'}
 
     def execute(self, context):
-        # Try to fetch models using the current scene proxy config
-        result = fetch_models_from_proxy(context, __name__)
-        models = []
-        source = None
-        if result:
-            models, source = result
-        else:
-            # Fallback to add-on preferences (comma-separated list) if proxy returns nothing
-            try:
-                from .utilities import resolve_addon_key
-                key = resolve_addon_key(context.preferences, __name__)
-                if key and key in context.preferences.addons:
-                    prefs = context.preferences.addons[key].preferences
-                    model_list_str = getattr(prefs, 'copilot_model_list', '') or getattr(prefs, 'copilot_model', '')
-                else:
-                    model_list_str = ''
-            except Exception:
-                model_list_str = ''
+        # an explicit connect should not be refused by a breaker opened earlier
+        reset_breakers()
+        # Serve whatever is cached right away and ask the proxy in the background
+        models, age, job = request_model_refresh(context, __name__, force=True)
+        if job is not None:
+            if models:
+                self.report({'INFO'}, f"Showing {len(models)} cached models; refreshing from proxy (job {job.id})")
+            else:
+                self.report({'INFO'}, f"Fetching models from proxy (job {job.id})")
+            return {'FINISHED'}
 
-            if model_list_str:
-                models = [m.strip() for m in model_list_str.split(',') if m.strip()]
-                source = 'prefs-fallback'
-                self.report({'WARNING'}, f"No models from proxy; using preference fallback ({len(models)} models)")
+        # No proxy configured: fall back to add-on preferences (comma-separated list)
+        try:
+            from .utilities import resolve_addon_key
+            key = resolve_addon_key(context.preferences, __name__)
+            if key and key in context.preferences.addons:
+                prefs = context.preferences.addons[key].preferences
+                model_list_str = getattr(prefs, 'copilot_model_list', '') or getattr(prefs, 'copilot_model', '')
             else:
-                # Hard-coded fallback list
-                models = ['gpt-4.1', 'gpt-5-mini', 'gpt-5', 'grok-code-fast-1']
-                source = 'hardcoded-fallback'
-                self.report({'WARNING'}, f"No models from proxy or prefs; using hard-coded fallback ({len(models)} models)")
-        items = [(m, m, '') for m in models]
+                model_list_str = ''
+        except Exception:
+            model_list_str = ''
+
+        if model_list_str:
+            models = [m.strip() for m in model_list_str.split(',') if m.strip()]
+            self.report({'WARNING'}, f"No proxy configured; using preference fallback ({len(models)} models)")
+        else:
+            # Hard-coded fallback list
+            models = ['gpt-4.1', 'gpt-5-mini', 'gpt-5', 'grok-code-fast-1']
+            self.report({'WARNING'}, f"No proxy or prefs; using hard-coded fallback ({len(models)} models)")
+        set_model_items(models)
+        # Set current scene model to first item so UI shows a default selection
         try:
-            bpy.types.Scene.copilot_model = bpy.props.EnumProperty(
-                name="AI Model",
-                description="Select the AI model to use",
-                items=lambda self, context: items,
-                default=0
-            )
-            # Set current scene model to first item so UI shows a default selection
-            try:
-                context.scene.copilot_model = models[0]
-            except Exception:
-                pass
-            # Force a UI redraw so the enum change becomes immediately visible
-            try:
-                bpy.ops.wm.redraw_timer(type='DRAW_WIN_SWAP', iterations=1)
-            except Exception:
-                pass
-            self.report({'INFO'}, f"Loaded {len(models)} models (source: {source})")
-            return {'FINISHED'}
-        except Exception as e:
-            self.report({'ERROR'}, f"Failed to set model list: {e}")
-            return {'CANCELLED'}
+            context.scene.copilot_model = models[0]
+        except Exception:
+            pass
+        return {'FINISHED'}
 
 
 class Copilot_OT_ClearChat(bpy.types.Operator):
@@ -322,9 +360,169 @@ class Copilot_OT_ClearChat(bpy.types.Operator):
             return {'CANCELLED'}
             
         context.scene.copilot_chat_history.clear()
+        _clear_suggestion(context.scene)
         return {'FINISHED'}
 
 
+def _exec_context_override():
+    """Find a window/3D View pair so generated code can use view-dependent operators from a timer."""
+    try:
+        for window in bpy.context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'VIEW_3D':
+                    return {'window': window, 'area': area}
+    except Exception:
+        pass
+    return None
+
+
+def _run_generation_job(job, request):
+    """Worker-thread side of a generation job. Must not touch bpy."""
+    status = {}
+    on_text = job.report_partial if request.get('stream') else None
+    code = run_generation_request(request, status, on_text=on_text)
+    return {'code': code, 'status': status, 'prompt': request.get('prompt'), 'model': request.get('model')}
+
+
+async def _run_generation_job_async(job, request, transport):
+    """Event-loop side of a generation job on the async transport. Must not touch bpy."""
+    status = {}
+    on_text = job.report_partial if request.get('stream') else None
+    code = await run_generation_request_async(request, transport, status, on_text=on_text, cancel=job.cancel_event)
+    return {'code': code, 'status': status, 'prompt': request.get('prompt'), 'model': request.get('model')}
+
+
+def _streaming_message(scene, job):
+    """Return the assistant message this job is streaming into, if it is still there."""
+    index = getattr(job, 'stream_message_index', None)
+    if index is None or index >= len(scene.copilot_chat_history):
+        return None
+    message = scene.copilot_chat_history[index]
+    if message.type != 'assistant' or message.content != getattr(job, 'stream_message_text', None):
+        # the user deleted or reordered messages while we were streaming
+        return None
+    return message
+
+
+def _show_generation_progress(job, text):
+    """Main-thread side of streaming: mirror the tokens received so far into the chat history."""
+    scene = bpy.data.scenes.get(job.scene_name) if job.scene_name else None
+    if scene is None or not text:
+        return
+    message = _streaming_message(scene, job)
+    if message is None:
+        message = scene.copilot_chat_history.add()
+        message.type = 'assistant'
+        job.stream_message_index = len(scene.copilot_chat_history) - 1
+    message.content = text
+    job.stream_message_text = message.content
+
+
+def _apply_generation_job(job):
+    """Main-thread side of a generation job: record the answer and run it."""
+    scene = bpy.data.scenes.get(job.scene_name) if job.scene_name else None
+    if scene is None:
+        print(f"BlenderCopilot: scene for job {job.id} no longer exists; dropping result")
+        return
+
+    result = job.result or {}
+    apply_proxy_status(scene, result.get('status'))
+    if job.error is not None:
+        scene.copilot_last_proxy_error = str(job.error)
+        # a half-streamed answer is not code; keep it out of the history
+        if _streaming_message(scene, job) is not None:
+            scene.copilot_chat_history.remove(job.stream_message_index)
+        return
+
+    blender_code = result.get('code')
+    message = _streaming_message(scene, job)
+    if not blender_code:
+        if message is not None:
+            scene.copilot_chat_history.remove(job.stream_message_index)
+        return
+
+    # Replace the raw streamed text with the extracted code
+    if message is None:
+        message = scene.copilot_chat_history.add()
+        message.type = 'assistant'
+    message.content = blender_code
+
+    error = _execute_generated_code(scene, blender_code)
+    if error is not None:
+        print(f"BlenderCopilot: error executing generated code from job {job.id}: {error}")
+        # don't serve broken code again for the same request
+        if job.cache_key:
+            response_cache.discard(job.cache_key)
+        return
+    message.ok = True
+
+    # remember working code so near-identical prompts can skip the model
+    if result.get('prompt'):
+        snippet_index.add(result['prompt'], blender_code, model=result.get('model') or '')
+
+
+def _execute_generated_code(scene, blender_code):
+    """Run generated code on the main thread; return the exception or None."""
+    global_namespace = globals().copy()
+
+    try:
+        override = _exec_context_override()
+        if override and hasattr(bpy.context, 'temp_override'):
+            with bpy.context.temp_override(**override):
+                exec(blender_code, global_namespace)
+        else:
+            exec(blender_code, global_namespace)
+    except Exception as e:
+        scene.copilot_last_proxy_error = f"Error executing generated code: {e}"
+        return e
+    return None
+
+
+def _use_snippet(scene, prompt, code):
+    """Answer `prompt` with previously generated code, without contacting the model."""
+    message = scene.copilot_chat_history.add()
+    message.type = 'user'
+    message.content = prompt
+    message = scene.copilot_chat_history.add()
+    message.type = 'assistant'
+    message.content = code
+    scene.copilot_chat_input = ""
+    _clear_suggestion(scene)
+    error = _execute_generated_code(scene, code)
+    message.ok = error is None
+    return error
+
+
+def _clear_suggestion(scene):
+    try:
+        scene.copilot_suggestion_prompt = ""
+        scene.copilot_suggestion_code = ""
+        scene.copilot_suggestion_score = 0.0
+    except Exception:
+        pass
+
+
+_history_indexed = set()
+
+
+def _find_snippet(context, prompt):
+    """Return (similarity, record) for an earlier answer to a near-identical prompt, or None."""
+    mode = get_copilot_option(context, __name__, 'copilot_retrieval_mode', 'SUGGEST')
+    if mode == 'OFF':
+        return None
+    scene = context.scene
+    # harvest pairs from chat histories saved in .blend files, once per file and scene per session
+    history_key = (bpy.data.filepath, scene.name)
+    if history_key not in _history_indexed:
+        _history_indexed.add(history_key)
+        snippet_index.add_chat_history(scene.copilot_chat_history)
+    threshold = get_copilot_option(context, __name__, 'copilot_retrieval_threshold', 0.85)
+    return snippet_index.best_match(prompt, threshold)
+
+
+_send_debouncer = Debouncer()
+
+
 class Copilot_OT_Execute(bpy.types.Operator):
     bl_idname = "copilot.send_message"
     bl_label = "Send Message"
@@ -335,6 +533,16 @@ class Copilot_OT_Execute(bpy.types.Operator):
         description="Enter the natural language command",
         default="",
     )
+    bypass_cache = bpy.props.BoolProperty(
+        name="Bypass Cache",
+        description="Always ask the model, even if this exact request was answered before",
+        default=False,
+    )
+    skip_retrieval = bpy.props.BoolProperty(
+        name="Skip Retrieval",
+        description="Ask the model even if a similar prompt was answered before",
+        default=False,
+    )
 
     def execute(self, context):
         global system_prompt
@@ -349,56 +557,105 @@ class Copilot_OT_Execute(bpy.types.Operator):
             self.report({'ERROR'}, "Chat history property not found. Please reload the addon.")
             return {'CANCELLED'}
 
-        context.scene.copilot_button_pressed = True
-        bpy.ops.wm.redraw_timer(type='DRAW_WIN_SWAP', iterations=1)
+        prompt = context.scene.copilot_chat_input
+        # double clicks, repeated menu entries and scripts firing twice
+        window = get_copilot_option(context, __name__, 'copilot_debounce_ms', 500) / 1000.0
+        if window > 0 and _send_debouncer.should_ignore(context.scene.name, window, prompt.strip()):
+            self.report({'INFO'}, "Ignored repeated send")
+            return {'CANCELLED'}
+        if not prompt.strip():
+            self.report({'WARNING'}, "Enter a message first")
+            return {'CANCELLED'}
 
         ## add context to system prompt
-        # Get the minimal scene data
-        scene_data = {
-            "objects": []
-        }
-
-        for obj in bpy.context.scene.objects:
-            scene_data["objects"].append({
-                "name": obj.name,
-                "type": obj.type,
-                # "location": list(obj.location),
-                # "rotation_euler": list(obj.rotation_euler),
-                # "scale": list(obj.scale),
-            })
-
-            if len(scene_data["objects"]) == 0:
-                scene_data = None
-            # if scene_data:
-            #     system_prompt = system_prompt + """Below is the minimal scene context.\n""" + json.dumps(scene_data)
-
-            blender_code = generate_blender_code(context.scene.copilot_chat_input, context.scene.copilot_chat_history, context,
-                                                 system_prompt, __name__)
-
-            message = context.scene.copilot_chat_history.add()
-            message.type = 'user'
-            message.content = context.scene.copilot_chat_input
-
-            # Clear the chat input field
-            context.scene.copilot_chat_input = ""
-
-            if blender_code:
-                message = context.scene.copilot_chat_history.add()
-                message.type = 'assistant'
-                message.content = blender_code
-
-                global_namespace = globals().copy()
-
-                try:
-                    exec(blender_code, global_namespace)
-                except Exception as e:
-                    self.report({'ERROR'}, f"Error executing generated code: {e}")
-                    context.scene.copilot_button_pressed = False
+        # Minimal scene data from the incrementally maintained scene index;
+        # only the first request after loading a file walks the whole scene
+        scene_data = scene_snapshot(context.scene)
+        if len(scene_data.objects) == 0:
+            scene_data = None
+        scene_digest = scene_data.digest if scene_data is not None else ''
+        summary_bytes = get_copilot_option(context, __name__, 'copilot_scene_summary_bytes', 4000)
+        send_layout = bool(get_copilot_option(context, __name__, 'copilot_scene_layout', True))
+        # an unchanged digest means the context built last time is still exact
+        scene_context = scene_context_cache.get(context.scene.name, scene_digest, (summary_bytes, send_layout))
+        if scene_context is None:
+            scene_blocks = []
+            if scene_data is not None and summary_bytes:
+                scene_blocks.append(scene_summary(scene_data, summary_bytes))
+            if scene_data is not None and send_layout:
+                scene_blocks.append(spatial_context(context.scene, scene_data))
+            scene_tokens = sum(estimate_tokens(block) for block in scene_blocks)
+            scene_context_cache.put(context.scene.name, scene_digest, (summary_bytes, send_layout),
+                                    scene_blocks, scene_tokens)
+        else:
+            scene_blocks, scene_tokens = scene_context
+        # the objects this prompt is about go right before it, not into the cached prefix
+        request_blocks = []
+        relevant = get_copilot_option(context, __name__, 'copilot_scene_objects', 20)
+        if scene_data is not None and relevant:
+            request_blocks.append(relevant_objects_block(scene_terms(context.scene), prompt, relevant))
+
+        _clear_suggestion(context.scene)
+        match = None if (self.skip_retrieval or self.bypass_cache) else _find_snippet(context, prompt)
+        if match is not None:
+            similarity, snippet = match
+            mode = get_copilot_option(context, __name__, 'copilot_retrieval_mode', 'SUGGEST')
+            if mode == 'AUTO':
+                error = _use_snippet(context.scene, prompt, snippet['code'])
+                if error is not None:
+                    self.report({'ERROR'}, f"Error executing reused code: {error}")
                     return {'CANCELLED'}
-
-            context.scene.copilot_button_pressed = False
+                self.report({'INFO'}, f"Reused code from a similar earlier prompt (similarity {similarity:.2f})")
+                return {'FINISHED'}
+            # offer the snippet and let the user decide
+            context.scene.copilot_suggestion_prompt = snippet['prompt']
+            context.scene.copilot_suggestion_code = snippet['code']
+            context.scene.copilot_suggestion_score = similarity
+            self.report({'INFO'}, "Found a similar earlier prompt: reuse its code or ask the model")
             return {'FINISHED'}
 
+        # Snapshot everything the worker needs before mutating the history
+        request = build_generation_request(prompt, context.scene.copilot_chat_history, context,
+                                           system_prompt, __name__, bypass_cache=self.bypass_cache,
+                                           scene_blocks=scene_blocks, request_blocks=request_blocks,
+                                           scene_digest=scene_digest, scene_tokens=scene_tokens)
+
+        context.scene.copilot_last_context = describe_packing(request.get('context'))
+
+        message = context.scene.copilot_chat_history.add()
+        message.type = 'user'
+        message.content = prompt
+
+        # Clear the chat input field
+        context.scene.copilot_chat_input = ""
+
+        job = submit_proxy_job(request, _run_generation_job, _run_generation_job_async, kind='generate',
+                               scene_name=context.scene.name, on_complete=_apply_generation_job,
+                               on_progress=_show_generation_progress)
+        job.cache_key = request.get('cache_key')
+        context.scene.copilot_button_pressed = True
+        context.scene.copilot_job_status = job.describe()
+        self.report({'INFO'}, f"Copilot job {job.id} submitted")
+        return {'FINISHED'}
+
+
+class Copilot_OT_UseSuggestion(bpy.types.Operator):
+    bl_idname = "copilot.use_suggestion"
+    bl_label = "Reuse Earlier Code"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        scene = context.scene
+        code = getattr(scene, 'copilot_suggestion_code', '')
+        if not code:
+            self.report({'WARNING'}, "No suggestion to reuse")
+            return {'CANCELLED'}
+        error = _use_snippet(scene, scene.copilot_chat_input, code)
+        if error is not None:
+            self.report({'ERROR'}, f"Error executing reused code: {error}")
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
 
 class Copilot_OT_RefreshModels(bpy.types.Operator):
     bl_idname = "copilot.refresh_models"
@@ -406,35 +663,29 @@ class Copilot_OT_RefreshModels(bpy.types.Operator):
     bl_options = {'REGISTER'}
 
     def execute(self, context):
-        # Fetch models from proxy (may return fallback list and source)
-        result = fetch_models_from_proxy(context, __name__)
-        if not result:
+        # Serve the cached catalogue now; the proxy answer replaces it when it arrives
+        models, age, job = request_model_refresh(context, __name__, force=True)
+        if job is None and not models:
             self.report({'WARNING'}, "No models available")
             return {'CANCELLED'}
+        if job is not None:
+            self.report({'INFO'}, f"Refreshing models from proxy (job {job.id})")
+        return {'FINISHED'}
 
-        models, source = result
-
-        # Build enum items
-        items = [(m, m, '') for m in models]
 
-        # Dynamically replace the EnumProperty on Scene
-        try:
-            bpy.types.Scene.copilot_model = bpy.props.EnumProperty(
-                name="AI Model",
-                description="Select the AI model to use",
-                items=lambda self, context: items,
-                default=0  # Use integer index when items is a function
-            )
-            # Select first model by default on the scene
-            try:
-                context.scene.copilot_model = models[0]
-            except Exception:
-                pass
-            self.report({'INFO'}, f"Loaded {len(models)} models (source: {source})")
-            return {'FINISHED'}
-        except Exception as e:
-            self.report({'ERROR'}, f"Failed to set model list: {e}")
-            return {'CANCELLED'}
+def _report_proxy_test(job):
+    """Main-thread completion of a connection test started by Copilot_OT_TestProxy."""
+    scene = bpy.data.scenes.get(job.scene_name) if job.scene_name else None
+    if scene is None:
+        return
+    scene.copilot_last_proxy_mode = 'fetch-models'
+    if job.error is not None:
+        scene.copilot_last_proxy_error = f"❌ Proxy connection failed: {job.error}"
+    elif job.result:
+        scene.copilot_last_proxy_error = ''
+        print(f"BlenderCopilot: ✅ Proxy connection successful! Found {len(job.result)} models; {http_pool_stats()}")
+    else:
+        scene.copilot_last_proxy_error = "⚠️ Proxy connection failed - no models returned"
 
 
 class Copilot_OT_TestProxy(bpy.types.Operator):
@@ -448,17 +699,25 @@ class Copilot_OT_TestProxy(bpy.types.Operator):
             self.report({'ERROR'}, "Proxy not configured. Please set IP and port first.")
             return {'CANCELLED'}
 
-        try:
-            # Try to fetch models as a connection test
-            result = fetch_models_from_proxy(context, __name__, timeout=5)
-            if result:
-                models, source = result
-                self.report({'INFO'}, f"✅ Proxy connection successful! Found {len(models)} models from {source}")
-            else:
-                self.report({'WARNING'}, "⚠️ Proxy connection failed - no models returned")
-        except Exception as e:
-            self.report({'ERROR'}, f"❌ Proxy connection failed: {str(e)}")
+        # Fetch models as a connection test; the result lands in the panel's proxy status
+        _models, _age, job = request_model_refresh(context, __name__, force=True, on_done=_report_proxy_test)
+        if job is not None:
+            self.report({'INFO'}, f"Testing proxy connection (job {job.id})")
+        return {'FINISHED'}
+
+
+class Copilot_OT_ClearCaches(bpy.types.Operator):
+    bl_idname = "copilot.clear_caches"
+    bl_label = "Clear Copilot Caches"
+    bl_options = {'REGISTER'}
 
+    def execute(self, context):
+        clear_endpoint_cache()
+        clear_model_cache()
+        response_cache.clear()
+        scene_context_cache.clear()
+        snippet_index.clear()
+        self.report({'INFO'}, "Copilot caches cleared")
         return {'FINISHED'}
 
 
@@ -490,6 +749,17 @@ class CopilotAddonPreferences(bpy.types.AddonPreferences):
         description="Optional path prefix for your proxy (e.g. /openai/v1)",
         default="",
     )
+    copilot_proxy_pool = bpy.props.StringProperty(
+        name="Additional proxies",
+        description="Comma-separated list of more proxy instances (host:port or URL); requests go to the fastest healthy one",
+        default="",
+    )
+    copilot_health_interval = bpy.props.IntProperty(
+        name="Health probe interval (s)",
+        description="How often every proxy in the pool is probed in the background",
+        default=30,
+        min=5,
+    )
     copilot_model = bpy.props.StringProperty(
         name="Default Model",
         description="Default model id to request from the proxy (optional)",
@@ -500,6 +770,154 @@ class CopilotAddonPreferences(bpy.types.AddonPreferences):
         description="Comma-separated model ids to use if the proxy does not expose models (e.g. gpt-5-mini,grok-code)",
         default="gpt-4.1,gpt-5-mini,gpt-5,grok-code-fast-1",
     )
+    copilot_pool_maxsize = bpy.props.IntProperty(
+        name="Connections per proxy",
+        description="Maximum number of kept-alive connections per proxy host",
+        default=4,
+        min=1,
+        max=32,
+    )
+    copilot_endpoint_cache_ttl = bpy.props.IntProperty(
+        name="Endpoint cache TTL (s)",
+        description="How long a discovered proxy endpoint is trusted before probing again (0 = forever)",
+        default=24 * 3600,
+        min=0,
+    )
+    copilot_response_cache_mb = bpy.props.IntProperty(
+        name="Response cache (MB)",
+        description="Disk space for remembered answers to identical requests (0 = off)",
+        default=32,
+        min=0,
+    )
+    copilot_debounce_ms = bpy.props.IntProperty(
+        name="Ignore repeats within (ms)",
+        description="Ignore a second send of the same prompt that arrives this soon after the first (0 = off)",
+        default=500,
+        min=0,
+        max=5000,
+    )
+    copilot_retrieval_mode = bpy.props.EnumProperty(
+        name="Reuse earlier code",
+        description="What to do when a new prompt closely matches one answered before",
+        items=[
+            ('OFF', "Off", "Always ask the model"),
+            ('SUGGEST', "Suggest", "Offer the earlier code and let me choose"),
+            ('AUTO', "Automatic", "Run the earlier code without asking the model"),
+        ],
+        default='SUGGEST',
+    )
+    copilot_retrieval_threshold = bpy.props.FloatProperty(
+        name="Similarity threshold",
+        description="How similar (0-1) a prompt must be to an earlier one to reuse its code",
+        default=0.85,
+        min=0.5,
+        max=1.0,
+    )
+    copilot_model_cache_ttl = bpy.props.IntProperty(
+        name="Model list TTL (s)",
+        description="Age after which the cached model list is refreshed in the background (0 = never)",
+        default=3600,
+        min=0,
+    )
+    copilot_race_discovery = bpy.props.BoolProperty(
+        name="Race endpoint discovery",
+        description="When no endpoint is cached, send a one-token request to all candidate proxy endpoints at once and generate on the first that answers",
+        default=True,
+    )
+    copilot_async_transport = bpy.props.BoolProperty(
+        name="Async transport (aiohttp)",
+        description="Run proxy requests on one asyncio event loop with a shared aiohttp session instead of a thread each",
+        default=False,
+    )
+    copilot_context_tokens = bpy.props.IntProperty(
+        name="Context budget (tokens)",
+        description="Most prompt tokens to send; older chat history is left out beyond this (0 = the model's full context window)",
+        default=8000,
+        min=0,
+    )
+    copilot_compact_history = bpy.props.BoolProperty(
+        name="Compact earlier code",
+        description="Send only the latest generated script in full and summarise earlier ones (functions, operators, created data) to keep requests small",
+        default=True,
+    )
+    copilot_scene_layout = bpy.props.BoolProperty(
+        name="Send scene layout",
+        description="Summarise where the scene's objects are (extents, clusters, grids) and send it with each request",
+        default=True,
+    )
+    copilot_scene_summary_bytes = bpy.props.IntProperty(
+        name="Scene summary size (bytes)",
+        description="Most bytes of the scene summary (collections and groups of alike objects) sent with each request (0 = no summary)",
+        default=4000,
+        min=0,
+        max=65536,
+    )
+    copilot_scene_objects = bpy.props.IntProperty(
+        name="Relevant objects",
+        description="Most scene objects listed by name with each request, picked by how well they match the prompt; the rest are only counted (0 = none)",
+        default=20,
+        min=0,
+        max=200,
+    )
+    copilot_max_retries = bpy.props.IntProperty(
+        name="Max retries",
+        description="How often a request is retried after a connection error, rate limit (429) or overloaded proxy (502-504)",
+        default=3,
+        min=0,
+        max=10,
+    )
+    copilot_retry_budget = bpy.props.FloatProperty(
+        name="Retry budget (s)",
+        description="No retry is started that would end more than this long after the request began",
+        default=30.0,
+        min=0.0,
+        max=300.0,
+    )
+    copilot_hedge = bpy.props.BoolProperty(
+        name="Hedge slow requests",
+        description="If the proxy has not started answering after the usual delay, send a second request and keep whichever finishes first",
+        default=False,
+    )
+    copilot_hedge_model = bpy.props.StringProperty(
+        name="Hedge model",
+        description="Model for the second request (empty = same model)",
+        default="",
+    )
+    copilot_hedge_proxy_url = bpy.props.StringProperty(
+        name="Hedge proxy URL",
+        description="Proxy for the second request, e.g. http://host:port (empty = same proxy)",
+        default="",
+    )
+    copilot_hedge_percentile = bpy.props.IntProperty(
+        name="Hedge after percentile",
+        description="Send the second request once the wait exceeds this percentile of recent time-to-first-byte",
+        default=95,
+        min=50,
+        max=99,
+        subtype='PERCENTAGE',
+    )
+    copilot_hedge_delay = bpy.props.FloatProperty(
+        name="Hedge delay (s)",
+        description="Wait used until enough requests have been timed to compute the percentile",
+        default=10.0,
+        min=1.0,
+        max=120.0,
+    )
+    copilot_stream = bpy.props.BoolProperty(
+        name="Stream responses",
+        description="Request streamed completions and show tokens in the chat as they arrive",
+        default=True,
+    )
+    copilot_stop_at_first_block = bpy.props.BoolProperty(
+        name="Stop at first code block",
+        description="Close a streamed response as soon as the first fenced code block is complete",
+        default=True,
+    )
+    copilot_stop_sequences = bpy.props.BoolProperty(
+        name="Send stop sequences",
+        description="Also ask the model to stop at a closing code fence (may cut off replies that use untagged fences)",
+        default=False,
+    )
 
     def draw(self, context):
         layout = self.layout
@@ -507,8 +925,71 @@ class CopilotAddonPreferences(bpy.types.AddonPreferences):
         layout.prop(self, "copilot_proxy_ip")
         layout.prop(self, "copilot_proxy_port")
         layout.prop(self, "copilot_proxy_api_key")
+        row = layout.row()
+        row.prop(self, "copilot_proxy_pool")
+        row.prop(self, "copilot_health_interval")
         layout.prop(self, "copilot_model")
         layout.prop(self, "copilot_model_list")
+        layout.prop(self, "copilot_model_cache_ttl")
+        layout.prop(self, "copilot_pool_maxsize")
+        row = layout.row()
+        row.prop(self, "copilot_endpoint_cache_ttl")
+        row.operator("copilot.clear_caches", text="Clear Caches")
+        layout.prop(self, "copilot_race_discovery")
+        layout.prop(self, "copilot_async_transport")
+        row = layout.row()
+        row.prop(self, "copilot_max_retries")
+        row.prop(self, "copilot_retry_budget")
+        layout.prop(self, "copilot_response_cache_mb")
+        layout.prop(self, "copilot_debounce_ms")
+        row = layout.row()
+        row.prop(self, "copilot_context_tokens")
+        row.prop(self, "copilot_compact_history")
+        layout.prop(self, "copilot_scene_summary_bytes")
+        row = layout.row()
+        row.prop(self, "copilot_scene_layout")
+        row.prop(self, "copilot_scene_objects")
+        row = layout.row()
+        row.prop(self, "copilot_retrieval_mode")
+        row.prop(self, "copilot_retrieval_threshold")
+        layout.prop(self, "copilot_hedge")
+        if self.copilot_hedge:
+            row = layout.row()
+            row.prop(self, "copilot_hedge_model")
+            row.prop(self, "copilot_hedge_proxy_url")
+            row = layout.row()
+            row.prop(self, "copilot_hedge_percentile")
+            row.prop(self, "copilot_hedge_delay")
+        layout.prop(self, "copilot_stream")
+        layout.prop(self, "copilot_stop_at_first_block")
+        layout.prop(self, "copilot_stop_sequences")
+
+
+def _refresh_models_after_startup():
+    try:
+        request_model_refresh(bpy.context, __name__)
+    except Exception as e:
+        print(f"BlenderCopilot: background model refresh skipped: {e}")
+    return None
+
+
+def _probe_proxy_pool():
+    """Timer: probe every proxy of the pool in the background, then reschedule."""
+    try:
+        context = bpy.context
+        proxy = get_copilot_proxy_settings(context, __name__)
+        interval = get_copilot_option(context, __name__, 'copilot_health_interval', 30)
+    except Exception:
+        return 30.0
+    if proxy.get('pool') and not get_engine().active_jobs(kind='health'):
+        request = {
+            'pool': proxy['pool'],
+            'path': normalize_proxy_path(proxy.get('path')),
+            'key': proxy.get('key') or '',
+            'pool_maxsize': get_copilot_option(context, __name__, 'copilot_pool_maxsize', None),
+        }
+        get_engine().submit(run_health_probes, request, kind='health')
+    return float(interval or 30)
 
 
 def register():
@@ -516,14 +997,14 @@ def register():
     init_props()
     
     # Ensure clean state by unregistering first
-    for cls in (CopilotAddonPreferences, Copilot_OT_Execute, Copilot_OT_RefreshModels, Copilot_OT_TestProxy, Copilot_OT_ConnectProxy, Copilot_PT_Panel, Copilot_OT_ClearChat, Copilot_OT_ShowCode, Copilot_OT_DeleteMessage):
+    for cls in (CopilotAddonPreferences, Copilot_OT_Execute, Copilot_OT_RefreshModels, Copilot_OT_TestProxy, Copilot_OT_ConnectProxy, Copilot_PT_Panel, Copilot_OT_ClearChat, Copilot_OT_ShowCode, Copilot_OT_DeleteMessage, Copilot_OT_ClearCaches, Copilot_OT_UseSuggestion):
         try:
             bpy.utils.unregister_class(cls)
         except Exception:
             pass  # ignore if not registered
 
     # Now register all classes
-    for cls in (CopilotAddonPreferences, Copilot_OT_Execute, Copilot_OT_RefreshModels, Copilot_OT_TestProxy, Copilot_OT_ConnectProxy, Copilot_PT_Panel, Copilot_OT_ClearChat, Copilot_OT_ShowCode, Copilot_OT_DeleteMessage):
+    for cls in (CopilotAddonPreferences, Copilot_OT_Execute, Copilot_OT_RefreshModels, Copilot_OT_TestProxy, Copilot_OT_ConnectProxy, Copilot_PT_Panel, Copilot_OT_ClearChat, Copilot_OT_ShowCode, Copilot_OT_DeleteMessage, Copilot_OT_ClearCaches, Copilot_OT_UseSuggestion):
         try:
             bpy.utils.register_class(cls)
         except (ValueError, RuntimeError) as e:
@@ -532,6 +1013,18 @@ def register():
             else:
                 print(f"register_class failed for {cls.__name__}: {e}")
 
+    # Show the last known model catalogue immediately, then revalidate it once
+    # Blender has finished starting up and a scene is available
+    load_cached_model_items()
+    try:
+        if not bpy.app.timers.is_registered(_refresh_models_after_startup):
+            bpy.app.timers.register(_refresh_models_after_startup, first_interval=1.0)
+        if not bpy.app.timers.is_registered(_probe_proxy_pool):
+            bpy.app.timers.register(_probe_proxy_pool, first_interval=2.0, persistent=True)
+    except Exception:
+        pass
+    register_handlers()
+
     # Handle menu function
     try:
         bpy.types.VIEW3D_MT_mesh_add.remove(menu_func)
@@ -544,7 +1037,7 @@ def register():
 
 
 def unregister():
-    for cls in (CopilotAddonPreferences, Copilot_OT_Execute, Copilot_OT_RefreshModels, Copilot_OT_TestProxy, Copilot_OT_ConnectProxy, Copilot_PT_Panel, Copilot_OT_ClearChat, Copilot_OT_ShowCode, Copilot_OT_DeleteMessage):
+    for cls in (CopilotAddonPreferences, Copilot_OT_Execute, Copilot_OT_RefreshModels, Copilot_OT_TestProxy, Copilot_OT_ConnectProxy, Copilot_PT_Panel, Copilot_OT_ClearChat, Copilot_OT_ShowCode, Copilot_OT_DeleteMessage, Copilot_OT_ClearCaches, Copilot_OT_UseSuggestion):
         try:
             bpy.utils.unregister_class(cls)
         except Exception as e:
@@ -555,6 +1048,19 @@ def unregister():
         bpy.types.VIEW3D_MT_mesh_add.remove(menu_func)
     except Exception:
         pass
+    try:
+        if bpy.app.timers.is_registered(_probe_proxy_pool):
+            bpy.app.timers.unregister(_probe_proxy_pool)
+    except Exception:
+        pass
+    unregister_handlers()
+    clear_spatial_cache()
+    clear_summary_cache()
+    scene_context_cache.clear()
+    shutdown_engine()
+    latency_stats.flush()
+    close_http_client()
+    close_async_transport()
     clear_props()
 
 
@@ -0,0 +1,165 @@
+"""Latency instrumentation for proxy requests.
+
+Latencies are kept as histograms per (proxy, model) and metric:
+
+- `connect`: round trip of a cheap request to the proxy (health probes and
+  model listing), keyed with an empty model. Dominated by connection setup.
+- `ttfb`: time until the first streamed token of a generation arrived.
+- `body`: time until the whole body of a non-streamed generation arrived
+  (also when the proxy ignored `stream: true`).
+- `total`: time until a generation finished.
+
+`ProxyClient` and the probes record into `latency_stats`. Features that adapt
+to the proxy's behaviour read percentiles from it: request hedging, and the
+connect/read timeouts returned by `adaptive_timeout`. The histograms are
+persisted in the cache dir so a fresh Blender session starts with what
+earlier ones learned. Thread-safe.
+"""
+import bisect
+import os
+import threading
+import time
+
+from .caches import get_cache_dir, read_json, write_json_atomic
+
+
+def latency_key(base_url, model):
+    return f"{base_url or ''}|{model or ''}"
+
+
+# Upper bounds (seconds) of the histogram buckets; the last bucket is open.
+BUCKETS = (0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1, 1.5, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 300)
+# Once a histogram holds this many samples all counts are halved, so old
+# behaviour fades out and the proxy's current behaviour dominates.
+DECAY_AT = 200
+SAVE_INTERVAL = 10.0
+
+
+class LatencyHistograms:
+    """Bucketed latency samples per key and metric, persisted as JSON."""
+
+    def __init__(self, filename='latency.json'):
+        self.filename = filename
+        self._hists = None
+        self._dirty = False
+        self._saved_at = 0.0
+        self._lock = threading.RLock()
+
+    @property
+    def path(self):
+        return os.path.join(get_cache_dir(), self.filename)
+
+    def _load(self):
+        if self._hists is None:
+            data = read_json(self.path, {})
+            self._hists = {}
+            if isinstance(data, dict):
+                for name, counts in data.items():
+                    if isinstance(counts, list) and len(counts) == len(BUCKETS) + 1:
+                        self._hists[name] = [float(c) for c in counts]
+        return self._hists
+
+    def record(self, key, **samples):
+        """Add one sample per metric, e.g. `record(key, ttfb=1.2, total=4.0)`. None values are skipped."""
+        with self._lock:
+            hists = self._load()
+            for metric, value in samples.items():
+                if value is None:
+                    continue
+                counts = hists.setdefault(f"{key}#{metric}", [0.0] * (len(BUCKETS) + 1))
+                counts[bisect.bisect_left(BUCKETS, value)] += 1
+                if sum(counts) >= DECAY_AT:
+                    counts[:] = [c / 2 for c in counts]
+            self._dirty = True
+            if time.monotonic() - self._saved_at > SAVE_INTERVAL:
+                self._save()
+
+    def _save(self):
+        try:
+            write_json_atomic(self.path, self._hists)
+            self._dirty = False
+        except Exception as e:
+            print(f"BlenderCopilot: could not persist latency histograms: {e}")
+        self._saved_at = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if self._dirty and self._hists is not None:
+                self._save()
+
+    def percentile(self, key, metric, pct, min_samples=5):
+        """Upper bound of the bucket holding the `pct` percentile, or None with fewer than `min_samples`.
+
+        The open last bucket reports twice the largest bound.
+        """
+        with self._lock:
+            counts = list(self._load().get(f"{key}#{metric}", ()))
+        total = sum(counts)
+        if not counts or total < min_samples:
+            return None
+        target = pct / 100.0 * total
+        seen = 0.0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= target:
+                return BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1] * 2
+        return BUCKETS[-1] * 2
+
+    def count(self, key, metric):
+        with self._lock:
+            return sum(self._load().get(f"{key}#{metric}", ()))
+
+    def clear(self):
+        with self._lock:
+            self._hists = {}
+            self._save()
+
+
+latency_stats = LatencyHistograms()
+
+
+# (floor, ceiling, default) in seconds. Defaults apply until enough samples
+# exist; the connect default is short because a reachable proxy answers a
+# TCP handshake quickly whatever the model.
+TIMEOUT_LIMITS = {
+    'chat': {'connect': (2.0, 10.0, 10.0), 'read': (15.0, 300.0, 60.0)},
+    # non-streamed chat: the read timeout has to cover the whole completion
+    'completion': {'connect': (2.0, 10.0, 10.0), 'read': (30.0, 300.0, 120.0)},
+    'models': {'connect': (1.0, 10.0, 10.0), 'read': (3.0, 30.0, 10.0)},
+}
+# headroom multiplied onto the observed p99
+TIMEOUT_HEADROOM = 3.0
+
+
+def _clamp(value, floor, ceiling):
+    return max(floor, min(ceiling, value))
+
+
+def adaptive_timeout(base_url, model=None, kind='chat'):
+    """Return a (connect, read) timeout tuple learned from recent latency to `base_url`.
+
+    Connect timeouts come from the proxy's `connect` histogram. Streamed
+    chat (`kind='chat'`) read timeouts come from the model's time to first
+    token, since urllib3's read timeout bounds the wait for each chunk and
+    the first one is the longest; if the proxy has answered with whole
+    bodies before (it may ignore `stream: true`), the larger `body` time
+    wins. Non-streamed chat (`kind='completion'`) uses the `body` time
+    alone. Model listing read timeouts also use the `connect` histogram.
+    """
+    limits = TIMEOUT_LIMITS[kind]
+    connect_floor, connect_ceiling, connect_default = limits['connect']
+    read_floor, read_ceiling, read_default = limits['read']
+
+    rtt = latency_stats.percentile(latency_key(base_url, ''), 'connect', 99)
+    connect = connect_default if rtt is None else _clamp(rtt * TIMEOUT_HEADROOM, connect_floor, connect_ceiling)
+    if kind in ('chat', 'completion'):
+        key = latency_key(base_url, model)
+        body = latency_stats.percentile(key, 'body', 99)
+        observed = body
+        if kind == 'chat':
+            ttfb = latency_stats.percentile(key, 'ttfb', 99)
+            observed = ttfb if body is None else max(body, ttfb or 0)
+    else:
+        observed = rtt
+    read = read_default if observed is None else _clamp(observed * TIMEOUT_HEADROOM, read_floor, read_ceiling)
+    return connect, read
@@ -0,0 +1,141 @@
+"""Health and latency bookkeeping for a pool of interchangeable proxies.
+
+When several copilot-proxy instances are configured, each endpoint is probed
+in the background (see `utilities.probe_proxy`) and keeps an exponentially
+weighted moving average of its latency, fed by those probes and by the time
+to the response headers of the streamed requests it served
+(`ProxyClient.pool_latency`). Requests go to the fastest healthy endpoint.
+An endpoint that fails several times in a row is ejected for a cooldown
+that doubles on every repeated ejection; a successful probe or request
+brings it back.
+
+Thread-safe and free of bpy, like the transports.
+"""
+import threading
+import time
+
+
+EWMA_ALPHA = 0.3
+EJECT_AFTER_FAILURES = 3
+EJECT_COOLDOWN = 30.0
+MAX_EJECT_COOLDOWN = 600.0
+
+
+def parse_proxy_list(text):
+    """Split a comma/whitespace separated list of proxies into base URLs (http:// added when missing)."""
+    urls = []
+    for item in (text or '').replace('\n', ',').replace(' ', ',').split(','):
+        item = item.strip().rstrip('/')
+        if not item:
+            continue
+        if not item.startswith(('http://', 'https://')):
+            item = f"http://{item}"
+        if item not in urls:
+            urls.append(item)
+    return urls
+
+
+class EndpointHealth:
+    """What the pool knows about one proxy endpoint."""
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.last_probe = None
+        self.last_error = ''
+
+    @property
+    def ejected(self):
+        return time.monotonic() < self.ejected_until
+
+    def describe(self):
+        if self.ejected:
+            return f"{self.url}: ejected for {self.ejected_until - time.monotonic():.0f}s"
+        if self.failures:
+            return f"{self.url}: failing ({self.failures}x)"
+        if self.latency is None:
+            return f"{self.url}: no latency yet"
+        return f"{self.url}: {self.latency * 1000:.0f} ms"
+
+
+class ProxyPool:
+    """Routes requests to the fastest healthy endpoint among the configured ones."""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _get(self, url):
+        endpoint = self._endpoints.get(url)
+        if endpoint is None:
+            endpoint = self._endpoints[url] = EndpointHealth(url)
+        return endpoint
+
+    def record_success(self, url, latency=None):
+        with self._lock:
+            endpoint = self._get(url)
+            endpoint.failures = 0
+            endpoint.ejections = 0
+            endpoint.ejected_until = 0.0
+            endpoint.last_error = ''
+            if latency is not None:
+                if endpoint.latency is None:
+                    endpoint.latency = latency
+                else:
+                    endpoint.latency = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * endpoint.latency
+
+    def record_failure(self, url, error=''):
+        with self._lock:
+            endpoint = self._get(url)
+            endpoint.failures += 1
+            endpoint.last_error = str(error)
+            if endpoint.failures >= EJECT_AFTER_FAILURES and not endpoint.ejected:
+                cooldown = min(EJECT_COOLDOWN * (2 ** endpoint.ejections), MAX_EJECT_COOLDOWN)
+                endpoint.ejections += 1
+                endpoint.ejected_until = time.monotonic() + cooldown
+                print(f"BlenderCopilot: ejecting proxy {url} for {cooldown:.0f}s after {endpoint.failures} failures")
+
+    def record_probe(self, url, latency=None, error=None):
+        with self._lock:
+            self._get(url).last_probe = time.time()
+        if error is None:
+            self.record_success(url, latency)
+        else:
+            self.record_failure(url, error)
+
+    def ordered(self, urls):
+        """Return `urls` best first: healthy by EWMA latency, then failing, then ejected ones.
+
+        Endpoints without a latency yet sort after measured ones of the same
+        health, keeping their configured order.
+
+        Ejected endpoints stay in the list as a last resort so that a request
+        is still attempted when every endpoint is currently ejected.
+        """
+        with self._lock:
+            endpoints = [self._get(url) for url in urls]
+
+        def rank(item):
+            position, endpoint = item
+            return (endpoint.ejected, endpoint.failures > 0, endpoint.latency is None, endpoint.latency or 0.0,
+                    position)
+
+        return [endpoint.url for _position, endpoint in sorted(enumerate(endpoints), key=rank)]
+
+    def best(self, urls):
+        ordered = self.ordered(urls)
+        return ordered[0] if ordered else ''
+
+    def describe(self, urls):
+        with self._lock:
+            return [self._get(url).describe() for url in urls]
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+proxy_pool = ProxyPool()
@@ -0,0 +1,226 @@
+"""Selection of the scene objects that matter for a prompt.
+
+Listing every object name does not fit the context budget of a big scene.
+`TermIndex` is an inverted index from name, type, data, collection and
+material terms to object records; `SceneIndex` keeps it current with the
+depsgraph updates it already receives. `rank` scores objects against the
+user's prompt with field-weighted IDF, and `relevant_objects_block` lists
+the top objects, their parents and the materials they use, and summarises
+everything else as counts per type.
+
+Free of bpy: it works on `scene_index.ObjectRecord` tuples.
+"""
+import functools
+import heapq
+import math
+import re
+from collections import Counter
+
+
+# per-field weight of a matching term; the best field of an object counts
+FIELD_WEIGHTS = {
+    'full_name': 4.0,
+    'name': 3.0,
+    'type': 2.0,
+    'materials': 1.5,
+    'collections': 1.0,
+    'data': 1.0,
+}
+DEFAULT_RELEVANT_OBJECTS = 20
+# objects scoring below this fraction of the best match are not listed
+RELATIVE_CUTOFF = 0.2
+# not worth looking up in the index
+STOPWORDS = frozenset("""
+a an and add all any are as at be by can change create delete each every for from give have in into is it its
+make me move my new object objects of on one or please put remove scene set so some that the them then there
+these this to two up use with without would
+""".split())
+# prompt words that mean an object type
+TYPE_SYNONYMS = {
+    'lamp': 'light',
+    'sun': 'light',
+    'spot': 'light',
+    'cam': 'camera',
+    'text': 'font',
+    'rig': 'armature',
+    'bone': 'armature',
+    'skeleton': 'armature',
+    'metaball': 'meta',
+    'pencil': 'gpencil',
+}
+
+_WORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+_RAW_RE = re.compile(r"[\w.\-]+")
+# Blender's duplicate suffix, e.g. '.001'
+_SUFFIX_RE = re.compile(r"\.\d+$")
+
+
+def _stem(word):
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+        if word.endswith('ie'):
+            word = word[:-2] + 'y'
+        elif word.endswith(('xe', 'she', 'che')):
+            word = word[:-1]
+    return word
+
+
+def name_terms(text):
+    """Lowercased, singular word parts of a name: 'WoodenChairs.002' -> ('wooden', 'chair')."""
+    return _base_terms(_SUFFIX_RE.sub('', text or ''))
+
+
+@functools.lru_cache(maxsize=4096)
+def _base_terms(text):
+    # duplicates share their base name, so this is mostly cache hits
+    return tuple(_stem(word.lower()) for word in _WORD_RE.findall(text) if len(word) > 1 and not word.isdigit())
+
+
+def query_terms(prompt):
+    """Index terms to look up for `prompt`: whole names as written plus their word parts."""
+    terms = []
+    for raw in _RAW_RE.findall(prompt or ''):
+        raw = raw.strip('.-').lower()
+        if not raw or raw in STOPWORDS:
+            continue
+        terms.append('=' + raw)
+        for word in name_terms(raw):
+            if word not in STOPWORDS:
+                terms.append(TYPE_SYNONYMS.get(word, word))
+    return list(dict.fromkeys(terms))
+
+
+def record_terms(record):
+    """{term: weight} for one `ObjectRecord`; the exact name is indexed as '=name'."""
+    weights = {}
+
+    def add(terms, field):
+        weight = FIELD_WEIGHTS[field]
+        for term in terms:
+            if weights.get(term, 0.0) < weight:
+                weights[term] = weight
+
+    add(('=' + record.name.lower(),), 'full_name')
+    add(name_terms(record.name), 'name')
+    add((record.type.lower(),), 'type')
+    for material in record.materials:
+        add(name_terms(material), 'materials')
+    for collection in record.collections:
+        add(name_terms(collection), 'collections')
+    add(name_terms(record.data or record.instance), 'data')
+    return weights
+
+
+class TermIndex:
+    """Inverted index of object records, updated one record at a time. Not thread-safe (main thread)."""
+
+    def __init__(self):
+        self.records = {}
+        self.by_name = {}
+        self.type_counts = Counter()
+        self._postings = {}
+        self._terms = {}
+
+    def add(self, key, record):
+        """Index `record` under `key`, replacing what was indexed for `key` before."""
+        if key in self.records:
+            self.remove(key)
+        self.records[key] = record
+        self.by_name[record.name] = key
+        self.type_counts[record.type] += 1
+        weights = record_terms(record)
+        self._terms[key] = weights
+        for term, weight in weights.items():
+            self._postings.setdefault(term, {})[key] = weight
+
+    def remove(self, key):
+        record = self.records.pop(key, None)
+        if record is None:
+            return
+        if self.by_name.get(record.name) == key:
+            del self.by_name[record.name]
+        self.type_counts[record.type] -= 1
+        if not self.type_counts[record.type]:
+            del self.type_counts[record.type]
+        for term in self._terms.pop(key, ()):
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self._postings[term]
+
+    def rank(self, prompt, limit=DEFAULT_RELEVANT_OBJECTS):
+        """Top `limit` (key, score) pairs for `prompt`, best first; ties go by name.
+
+        Objects scoring below `RELATIVE_CUTOFF` of the best one are left out.
+        """
+        total = len(self.records)
+        scores = {}
+        for term in query_terms(prompt):
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1.0 + total / len(posting))
+            for key, weight in posting.items():
+                scores[key] = scores.get(key, 0.0) + weight * idf
+        if not scores:
+            return []
+        floor = max(scores.values()) * RELATIVE_CUTOFF
+        return heapq.nsmallest(limit, ((key, score) for key, score in scores.items() if score >= floor),
+                               key=lambda item: (-round(item[1], 6), self.records[item[0]].name))
+
+    def __len__(self):
+        return len(self.records)
+
+
+def _describe(record, note=''):
+    parts = [f"- {record.name} {record.type}"]
+    if note:
+        parts.append(f"({note})")
+    details = []
+    if record.parent:
+        details.append(f"parent {record.parent}")
+    if record.collections:
+        details.append(f"in {', '.join(record.collections)}")
+    if record.materials:
+        details.append(f"materials {', '.join(record.materials)}")
+    line = ' '.join(parts)
+    return f"{line}, {', '.join(details)}" if details else line
+
+
+def relevant_objects_block(terms, prompt, limit=DEFAULT_RELEVANT_OBJECTS):
+    """Text block with the objects of `terms` (a `TermIndex`) most relevant to `prompt`.
+
+    Lists the top `limit` objects and, if not already listed, their
+    parents; then the materials they use and the counts per type of the
+    objects left out. Empty for an empty scene.
+    """
+    total = len(terms)
+    if not total:
+        return ''
+    ranked = [key for key, _score in terms.rank(prompt, limit)]
+    listed = list(ranked)
+    lines = [_describe(terms.records[key]) for key in ranked]
+    for key in ranked:
+        parent = terms.by_name.get(terms.records[key].parent)
+        while parent is not None and parent not in listed:
+            listed.append(parent)
+            record = terms.records[parent]
+            lines.append(_describe(record, 'parent'))
+            parent = terms.by_name.get(record.parent)
+
+    if lines:
+        out = [f"Scene objects relevant to the request ({len(listed)} of {total}):"] + lines
+        materials = list(dict.fromkeys(m for key in listed for m in terms.records[key].materials))
+        if materials:
+            out.append(f"Materials used by these: {', '.join(materials)}")
+    else:
+        out = [f"No object names match the request; the scene has {total} objects."]
+    rest = Counter(terms.type_counts)
+    for key in listed:
+        rest[terms.records[key].type] -= 1
+    rest = sorted(((count, kind) for kind, count in rest.items() if count > 0), key=lambda item: (-item[0], item[1]))
+    if rest:
+        label = 'Other objects' if lines else 'Objects'
+        out.append(f"{label}: {', '.join(f'{count} {kind}' for count, kind in rest)}")
+    return '\n'.join(out)
@@ -0,0 +1,236 @@
+"""Local retrieval of previously generated code for near-duplicate prompts.
+
+Every prompt whose generated code ran successfully is added to a small
+inverted index. Before asking the model, the Execute operator looks for an
+earlier prompt that says essentially the same thing and can reuse its code in
+milliseconds instead of waiting seconds for the proxy.
+
+Candidates are ranked with BM25 over the inverted index; the best ones are
+then scored with TF-IDF cosine similarity, which is symmetric and bounded to
+[0, 1] and therefore usable with a fixed threshold (BM25 scores are not).
+The index is persisted as an append-only JSON-lines file in the cache dir, so
+each new snippet costs one appended line.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+
+from .caches import get_cache_dir
+
+
+# Words that carry no meaning for matching Blender requests. Numbers and
+# colours are deliberately kept: "10 cubes" and "5 cubes" need different code.
+STOPWORDS = frozenset((
+    'a', 'an', 'the', 'please', 'can', 'could', 'you', 'me', 'i', 'my', 'for', 'of',
+    'to', 'in', 'on', 'it', 'is', 'be', 'with', 'that', 'this', 'some', 'make', 'create', 'add',
+))
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall((text or '').lower()) if t not in STOPWORDS]
+
+
+def normalize_prompt(text):
+    return ' '.join(tokenize(text))
+
+
+class SnippetIndex:
+    """Inverted index over (prompt, code) pairs of successful generations."""
+
+    def __init__(self, filename='snippets.jsonl'):
+        self.filename = filename
+        self._docs = None
+        self._next_id = 0
+        self._by_prompt = {}
+        self._postings = {}
+        self._doc_len = {}
+        self._total_len = 0
+        self._lock = threading.RLock()
+
+    @property
+    def path(self):
+        return os.path.join(get_cache_dir(), self.filename)
+
+    def _load(self):
+        if self._docs is not None:
+            return
+        self._docs = {}
+        lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fh:
+                for line in fh:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                    except Exception:
+                        continue
+                    if isinstance(record, dict) and record.get('prompt') and record.get('code'):
+                        self._insert(record)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"BlenderCopilot: could not load snippet index: {e}")
+        if lines > 2 * len(self._docs) + 16:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the log without superseded records."""
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as fh:
+                for doc_id in sorted(self._docs):
+                    fh.write(json.dumps(self._docs[doc_id]) + '\n')
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"BlenderCopilot: could not compact snippet index: {e}")
+
+    def _insert(self, record):
+        """Add or replace a document in memory. Later records for the same prompt win."""
+        key = normalize_prompt(record['prompt'])
+        if not key:
+            return False
+        old_id = self._by_prompt.get(key)
+        if old_id is not None:
+            if self._docs[old_id]['code'] == record['code']:
+                return False
+            self._remove(old_id)
+        doc_id = self._next_id
+        self._next_id += 1
+        terms = tokenize(record['prompt'])
+        self._docs[doc_id] = record
+        self._by_prompt[key] = doc_id
+        self._doc_len[doc_id] = len(terms)
+        self._total_len += len(terms)
+        for term in terms:
+            bucket = self._postings.setdefault(term, {})
+            bucket[doc_id] = bucket.get(doc_id, 0) + 1
+        return True
+
+    def _remove(self, doc_id):
+        record = self._docs.pop(doc_id)
+        self._by_prompt.pop(normalize_prompt(record['prompt']), None)
+        self._total_len -= self._doc_len.pop(doc_id, 0)
+        for term in set(tokenize(record['prompt'])):
+            bucket = self._postings.get(term)
+            if bucket is not None:
+                bucket.pop(doc_id, None)
+                if not bucket:
+                    del self._postings[term]
+
+    def add(self, prompt, code, **meta):
+        """Index a successful generation and append it to the on-disk log."""
+        if not prompt or not code or not code.strip():
+            return
+        record = dict(meta, prompt=prompt, code=code, ts=time.time())
+        with self._lock:
+            self._load()
+            if not self._insert(record):
+                return
+            try:
+                with open(self.path, 'a', encoding='utf-8') as fh:
+                    fh.write(json.dumps(record) + '\n')
+            except Exception as e:
+                print(f"BlenderCopilot: could not persist snippet: {e}")
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._docs)
+
+    def _idf(self, term):
+        n = len(self._docs)
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _bm25_candidates(self, terms, limit):
+        avg_len = (self._total_len / len(self._docs)) if self._docs else 0
+        scores = {}
+        for term in set(terms):
+            bucket = self._postings.get(term)
+            if not bucket:
+                continue
+            idf = self._idf(term)
+            for doc_id, tf in bucket.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[doc_id] / (avg_len or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+    def _tfidf(self, terms):
+        vector = {}
+        for term in terms:
+            vector[term] = vector.get(term, 0) + 1
+        return {t: (1 + math.log(c)) * self._idf(t) for t, c in vector.items()}
+
+    def _cosine(self, a, b):
+        dot = sum(w * b.get(t, 0.0) for t, w in a.items())
+        na = math.sqrt(sum(w * w for w in a.values()))
+        nb = math.sqrt(sum(w * w for w in b.values()))
+        if not na or not nb:
+            return 0.0
+        return dot / (na * nb)
+
+    def search(self, query, limit=3):
+        """Return up to `limit` (similarity, record) pairs, best first."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            self._load()
+            if not self._docs:
+                return []
+            query_vec = self._tfidf(terms)
+            results = []
+            for doc_id in self._bm25_candidates(terms, limit * 4):
+                record = self._docs[doc_id]
+                similarity = self._cosine(query_vec, self._tfidf(tokenize(record['prompt'])))
+                results.append((similarity, record))
+        results.sort(key=lambda r: r[0], reverse=True)
+        return results[:limit]
+
+    def best_match(self, query, threshold):
+        """Return (similarity, record) for the best snippet at or above `threshold`, else None."""
+        results = self.search(query, limit=1)
+        if results and results[0][0] >= threshold:
+            return results[0]
+        return None
+
+    def add_chat_history(self, chat_history):
+        """Index (user prompt, assistant code) pairs already present in a chat history.
+
+        Only answers marked `ok` (their code ran without an error) are
+        indexed; failed or partial answers are skipped.
+        """
+        previous = None
+        for message in chat_history:
+            if getattr(message, 'type', '') == 'assistant' and previous is not None:
+                if getattr(message, 'ok', False):
+                    self.add(previous, message.content, source='history')
+                previous = None
+            elif getattr(message, 'type', '') == 'user':
+                previous = message.content
+
+    def clear(self):
+        with self._lock:
+            self._docs = {}
+            self._next_id = 0
+            self._by_prompt = {}
+            self._postings = {}
+            self._doc_len = {}
+            self._total_len = 0
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"BlenderCopilot: could not remove snippet index: {e}")
+
+
+snippet_index = SnippetIndex()
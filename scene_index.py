@@ -0,0 +1,284 @@
+"""Incrementally maintained index of the objects in each scene.
+
+Building scene context by walking `scene.objects` on every request costs
+O(scene), which is far too slow for scenes with tens of thousands of
+objects. A `SceneIndex` walks the scene once, the first time a snapshot is
+asked for, and is then patched from `bpy.app.handlers.depsgraph_update_post`
+with only the objects the depsgraph reports as changed. Reported objects
+that are not in `scene.objects` (e.g. members of an instanced collection)
+are skipped. Removals are found by a membership sweep that only runs when
+the object count went down.
+Loading a file, undo and redo replace the bpy data wholesale, so they drop
+every index and the next snapshot rebuilds it.
+
+Records are immutable `ObjectRecord` tuples keyed by the object's
+`session_uid`, which survives renames. `snapshot` hands out a read-only view
+that stays valid while later updates are applied (copy on write), so it can
+be passed to worker threads. Everything else here runs on the main thread.
+
+Each index also owns a `relevance.TermIndex` over its records for picking
+the objects a prompt is about. It is built the first time it is asked for
+and from then on patched together with the records.
+
+`digest` identifies the scene state the prompt context is built from: the
+records plus every object's world matrix and local bounding box, which
+together give the positions and dimensions the layout block reports. It is
+the sum of per-object hashes, so an update only subtracts the changed
+objects' old hashes and adds their new ones. Object hashes do not include the `session_uid`, so the
+same scene gives the same digest in every session.
+"""
+import array
+import hashlib
+import itertools
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+import bpy
+from bpy.app.handlers import persistent
+
+from .relevance import TermIndex
+
+
+ObjectRecord = namedtuple('ObjectRecord', 'name type parent data collections materials instance')
+
+SceneSnapshot = namedtuple('SceneSnapshot', 'scene version layout_version digest objects')
+
+# Versions are unique across indexes, so a cache keyed by version can not
+# mistake a rebuilt index (after loading a file) for the one it replaced.
+_versions = itertools.count(1)
+
+
+def object_key(obj):
+    """Stable identity of an object for this session (survives renames)."""
+    return getattr(obj, 'session_uid', None) or obj.as_pointer()
+
+
+def object_record(obj):
+    data = obj.data
+    return ObjectRecord(
+        name=obj.name,
+        type=obj.type,
+        parent=obj.parent.name if obj.parent is not None else '',
+        data=data.name if data is not None else '',
+        collections=tuple(c.name for c in obj.users_collection),
+        materials=tuple(slot.material.name for slot in obj.material_slots if slot.material is not None),
+        instance=obj.instance_collection.name
+        if obj.instance_type == 'COLLECTION' and obj.instance_collection is not None else '',
+    )
+
+
+_DIGEST_MASK = (1 << 64) - 1
+
+
+def placement_bytes(obj):
+    """`obj.matrix_world` (column-major) then `obj.bound_box` as float32 bytes, like `foreach_get` gives them."""
+    matrix = obj.matrix_world
+    values = [matrix[row][col] for col in range(4) for row in range(4)]
+    values.extend(value for corner in obj.bound_box for value in corner)
+    return array.array('f', values).tobytes()
+
+
+def _object_hash(record, placement):
+    digest = hashlib.blake2b(repr(record).encode('utf-8') + placement, digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _transform_only(update):
+    return update.is_updated_transform and not update.is_updated_geometry and not update.is_updated_shading
+
+
+class SceneIndex:
+    """Object records of one scene, kept current from depsgraph updates."""
+
+    def __init__(self, scene_name):
+        self.scene_name = scene_name
+        self.version = 0
+        # also changes on transform-only updates, which leave `version` alone
+        self.layout_version = 0
+        self.built_at = None
+        self._records = {}
+        # a snapshot shares `_records`; the next change copies it first
+        self._shared = False
+        self._terms = None
+        self._hashes = {}
+        self._digest = 0
+
+    def _writable(self):
+        if self._shared:
+            self._records = dict(self._records)
+            self._shared = False
+        return self._records
+
+    def rebuild(self, scene):
+        start = time.perf_counter()
+        objects = scene.objects
+        # bulk reads instead of a matrix_world and bound_box access per object
+        matrices = array.array('f', bytes(64 * len(objects)))
+        objects.foreach_get('matrix_world', matrices)
+        matrices = matrices.tobytes()
+        corners = array.array('f', bytes(96 * len(objects)))
+        objects.foreach_get('bound_box', corners)
+        corners = corners.tobytes()
+        self._records = {}
+        self._hashes = {}
+        self._digest = 0
+        for index, obj in enumerate(objects):
+            key = object_key(obj)
+            record = self._records[key] = object_record(obj)
+            self._rehash(key, record, matrices[index * 64:index * 64 + 64] + corners[index * 96:index * 96 + 96])
+        self._shared = False
+        self._terms = None
+        self.version = next(_versions)
+        self.built_at = time.monotonic()
+        print(f"BlenderCopilot: indexed {len(self._records)} objects of {scene.name} "
+              f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def apply_updates(self, scene, depsgraph):
+        """Patch the records for the objects in `depsgraph.updates`. Returns the number of changed records."""
+        changed = 0
+        membership = False
+        for update in depsgraph.updates:
+            target = getattr(update.id, 'original', update.id)
+            if isinstance(target, bpy.types.Object):
+                if target.name not in scene.objects:
+                    # not part of the scene, so `rebuild` would not list it either
+                    continue
+                self.layout_version = next(_versions)
+                key = object_key(target)
+                old = self._records.get(key)
+                if old is not None and _transform_only(update) and old.name == target.name and \
+                        old.parent == (target.parent.name if target.parent is not None else ''):
+                    # moving objects around (e.g. while dragging) leaves the record as is
+                    record = old
+                else:
+                    record = object_record(target)
+                    if old != record:
+                        self._writable()[key] = record
+                        if self._terms is not None:
+                            self._terms.add(key, record)
+                        changed += 1
+                self._rehash(key, record, placement_bytes(target))
+            elif isinstance(target, (bpy.types.Scene, bpy.types.Collection)):
+                # objects were linked, unlinked or deleted
+                membership = True
+        if membership and len(scene.objects) < len(self._records):
+            changed += self._sweep(scene)
+        if changed:
+            self.version = next(_versions)
+        return changed
+
+    def _sweep(self, scene):
+        present = {object_key(obj) for obj in scene.objects}
+        gone = [key for key in self._records if key not in present]
+        records = self._writable()
+        for key in gone:
+            del records[key]
+            self._digest = (self._digest - self._hashes.pop(key, 0)) & _DIGEST_MASK
+            if self._terms is not None:
+                self._terms.remove(key)
+        return len(gone)
+
+    def _rehash(self, key, record, placement):
+        new = _object_hash(record, placement)
+        self._digest = (self._digest - self._hashes.get(key, 0) + new) & _DIGEST_MASK
+        self._hashes[key] = new
+
+    @property
+    def digest(self):
+        """Hex digest of the records, world matrices and bounding boxes; equal scenes give equal digests."""
+        return f"{len(self._records):x}-{self._digest:016x}"
+
+    def term_index(self):
+        """The `TermIndex` of the records, built on first use."""
+        if self._terms is None:
+            start = time.perf_counter()
+            self._terms = TermIndex()
+            for key, record in self._records.items():
+                self._terms.add(key, record)
+            print(f"BlenderCopilot: indexed the names of {len(self._terms)} objects of {self.scene_name} "
+                  f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return self._terms
+
+    def snapshot(self):
+        self._shared = True
+        return SceneSnapshot(self.scene_name, self.version, self.layout_version, self.digest,
+                             MappingProxyType(self._records))
+
+    def __len__(self):
+        return len(self._records)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _index_for(scene):
+    with _indexes_lock:
+        index = _indexes.get(scene.name_full)
+        if index is None:
+            index = _indexes[scene.name_full] = SceneIndex(scene.name_full)
+            index.rebuild(scene)
+    return index
+
+
+def scene_snapshot(scene):
+    """Return a `SceneSnapshot` of `scene`, building its index on first use. Main thread only."""
+    return _index_for(scene).snapshot()
+
+
+def scene_terms(scene):
+    """Return the `relevance.TermIndex` of `scene`'s objects, current as of the last update. Main thread only."""
+    return _index_for(scene).term_index()
+
+
+def scene_digest(scene):
+    """Digest of `scene`'s objects (see `SceneIndex.digest`), for cache keys and change checks. Main thread only."""
+    return _index_for(scene).digest
+
+
+def invalidate_scene_indexes():
+    with _indexes_lock:
+        _indexes.clear()
+
+
+@persistent
+def _on_depsgraph_update(scene, depsgraph):
+    index = _indexes.get(scene.name_full)
+    if index is None:
+        # nobody has asked for this scene yet; it is indexed on first use
+        return
+    try:
+        index.apply_updates(scene, depsgraph)
+    except Exception as e:
+        print(f"BlenderCopilot: scene index update failed, rebuilding on next use: {e}")
+        invalidate_scene_indexes()
+
+
+@persistent
+def _on_data_replaced(*_args):
+    invalidate_scene_indexes()
+
+
+_HANDLERS = (
+    ('depsgraph_update_post', _on_depsgraph_update),
+    ('load_post', _on_data_replaced),
+    ('undo_post', _on_data_replaced),
+    ('redo_post', _on_data_replaced),
+)
+
+
+def register_handlers():
+    for name, handler in _HANDLERS:
+        handlers = getattr(bpy.app.handlers, name, None)
+        if handlers is not None and handler not in handlers:
+            handlers.append(handler)
+
+
+def unregister_handlers():
+    for name, handler in _HANDLERS:
+        handlers = getattr(bpy.app.handlers, name, None)
+        if handlers is not None and handler in handlers:
+            handlers.remove(handler)
+    invalidate_scene_indexes()
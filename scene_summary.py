@@ -0,0 +1,146 @@
+"""Compact, deterministic summary of what a scene contains.
+
+A flat object list of a scene with thousands of linked duplicates or
+collection instances would not fit any prompt. `summarise_scene` groups the
+records of a `scene_index.SceneSnapshot` by collection, then within each
+collection by type, mesh (or other) data, materials and instanced
+collection, so 500 duplicates of a cube become one line:
+
+    - Cube.001-Cube.500: 500 MESH, sharing mesh 'Cube', material 'Red'
+
+The text is cut to a byte budget at line boundaries, larger groups first,
+with a final line counting what was left out. Everything is sorted by
+stable keys, so an unchanged scene always gives the same bytes and the
+block can sit in the cached prompt prefix.
+
+Free of bpy: it only reads snapshot records.
+"""
+import re
+import threading
+from collections import Counter
+
+
+DEFAULT_SUMMARY_BYTES = 4000
+# names listed per group before showing a range or "+N more"
+GROUP_NAMES = 3
+# kept free for the line saying what did not fit
+OMISSION_BYTES = 80
+
+_SUFFIX_RE = re.compile(r"\.\d+$")
+
+
+def base_name(name):
+    """`name` without Blender's duplicate suffix: 'Cube.012' -> 'Cube'."""
+    return _SUFFIX_RE.sub('', name or '')
+
+
+def _quoted(values):
+    return ', '.join(f"'{v}'" for v in values)
+
+
+def _names(names):
+    names = sorted(names)
+    if len(names) <= GROUP_NAMES:
+        return ', '.join(names)
+    if len({base_name(n) for n in names}) == 1:
+        return f"{names[0]}-{names[-1]}"
+    return f"{', '.join(names[:GROUP_NAMES - 1])}, +{len(names) - GROUP_NAMES + 1} more"
+
+
+def _data_label(kind):
+    return 'mesh' if kind == 'MESH' else 'data'
+
+
+def _group_line(kind, records):
+    """One summary line for records of the same type, data family, materials and instance."""
+    first = records[0]
+    count = len(records)
+    details = []
+    data = sorted({r.data for r in records if r.data})
+    if data and count == 1:
+        if data[0] != first.name:
+            details.append(f"{_data_label(kind)} '{data[0]}'")
+    elif len(data) == 1:
+        details.append(f"sharing {_data_label(kind)} '{data[0]}'")
+    elif data:
+        details.append(f"{len(data)} copies of {_data_label(kind)} '{base_name(data[0])}'")
+    if first.instance:
+        details.append(f"instancing collection '{first.instance}'")
+    if first.materials:
+        label = 'material' if len(first.materials) == 1 else 'materials'
+        details.append(f"{label} {_quoted(first.materials)}")
+    parents = {r.parent for r in records}
+    if len(parents) == 1 and first.parent:
+        details.append(f"parented to '{first.parent}'")
+    what = kind if count == 1 else f"{count} {kind}"
+    return f"- {_names([r.name for r in records])}: {', '.join([what] + details)}"
+
+
+def summarise_scene(snapshot, max_bytes=DEFAULT_SUMMARY_BYTES):
+    """Nested text summary of `snapshot` (collections, then groups of alike objects) within `max_bytes`."""
+    records = list(snapshot.objects.values())
+    if not records:
+        return ''
+    types = Counter(r.type for r in records)
+    header = (f"Scene '{snapshot.scene}': {len(records)} objects "
+              f"({', '.join(f'{n} {t}' for t, n in sorted(types.items(), key=lambda i: (-i[1], i[0])))})")
+
+    collections = {}
+    for record in records:
+        collection = record.collections[0] if record.collections else ''
+        key = (record.type, base_name(record.data) if record.data else base_name(record.name),
+               record.materials, record.instance)
+        collections.setdefault(collection, {}).setdefault(key, []).append(record)
+
+    sections = []
+    for collection, groups in collections.items():
+        size = sum(len(g) for g in groups.values())
+        ordered = sorted(groups.items(), key=lambda item: (-len(item[1]), item[0]))
+        title = f"Collection '{collection}'" if collection else "Not in a collection"
+        sections.append((size, collection, f"{title} ({size} objects):",
+                         [(len(g), _group_line(key[0], g)) for key, g in ordered]))
+    sections.sort(key=lambda section: (-section[0], section[1]))
+
+    lines = [header]
+    used = len(header.encode('utf-8'))
+    left_objects = left_groups = 0
+    full = False
+    for size, _name, title, groups in sections:
+        # a collection title is only worth its bytes together with its first group
+        pending = [title]
+        for count, line in groups:
+            pending.append('  ' + line)
+            cost = sum(len(text.encode('utf-8')) + 1 for text in pending)
+            if not full and used + cost + OMISSION_BYTES <= max_bytes:
+                lines.extend(pending)
+                used += cost
+                pending = []
+            else:
+                full = True
+                left_objects += count
+                left_groups += 1
+    if left_groups:
+        lines.append(f"... {left_objects} more objects in {left_groups} groups not listed")
+    return '\n'.join(lines)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def scene_summary(snapshot, max_bytes=DEFAULT_SUMMARY_BYTES):
+    """`summarise_scene`, cached per scene until the snapshot's records change."""
+    key = (snapshot.version, max_bytes)
+    with _cache_lock:
+        cached = _cache.get(snapshot.scene)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    text = summarise_scene(snapshot, max_bytes)
+    with _cache_lock:
+        _cache[snapshot.scene] = (key, text)
+    return text
+
+
+def clear_summary_cache():
+    with _cache_lock:
+        _cache.clear()
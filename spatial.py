@@ -0,0 +1,252 @@
+"""Bulk extraction and numeric summary of where the objects of a scene are.
+
+Reading `obj.location`, `obj.dimensions` and friends one object at a time
+costs seconds on large scenes. `extract_transforms` instead pulls world
+matrices, dimensions and local bounding boxes of a whole object collection
+with `foreach_get` into flat arrays (numpy when available, `array` otherwise),
+and `summarise_spatial` reduces them to a few numbers the model can use:
+overall extents, a typical object size, clusters of nearby objects and
+whether a cluster is laid out on a regular grid.
+
+Without numpy, bounds ignore rotation (location +/- dimensions / 2) and the
+summary is computed in plain Python, which is slower but still linear.
+`spatial_context` caches the rendered block per scene index layout version,
+so an unchanged scene costs nothing on the next request.
+"""
+import array
+import math
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # Blender bundles numpy; other Pythons may not
+    np = None
+
+
+TransformArrays = namedtuple('TransformArrays', 'uids locations bounds_min bounds_max dimensions')
+
+# at most this many cells per axis when binning objects into clusters
+CLUSTER_CELLS = 32
+MAX_CLUSTERS = 6
+# clusters this small are listed by object name
+NAMED_CLUSTER_SIZE = 3
+# coordinates are compared and reported at this many decimals
+PRECISION = 3
+
+
+def _buffer(typecode, size):
+    if np is not None:
+        return np.zeros(size, dtype=np.float32 if typecode == 'f' else np.int32)
+    return array.array(typecode, bytes(array.array(typecode).itemsize * size))
+
+
+def extract_transforms(objects):
+    """Return `TransformArrays` for a bpy object collection (e.g. `scene.objects`) using `foreach_get`."""
+    count = len(objects)
+    uids = _buffer('i', count)
+    matrices = _buffer('f', count * 16)
+    dimensions = _buffer('f', count * 3)
+    try:
+        objects.foreach_get('session_uid', uids)
+    except Exception:
+        uids = None
+    objects.foreach_get('matrix_world', matrices)
+    objects.foreach_get('dimensions', dimensions)
+
+    if np is None:
+        # matrices come column-major: the translation is at 12..14
+        locations = [(matrices[i * 16 + 12], matrices[i * 16 + 13], matrices[i * 16 + 14]) for i in range(count)]
+        sizes = [tuple(dimensions[i * 3:i * 3 + 3]) for i in range(count)]
+        bounds_min = [tuple(l - d / 2 for l, d in zip(loc, size)) for loc, size in zip(locations, sizes)]
+        bounds_max = [tuple(l + d / 2 for l, d in zip(loc, size)) for loc, size in zip(locations, sizes)]
+        return TransformArrays(list(uids) if uids is not None else None, locations, bounds_min, bounds_max, sizes)
+
+    corners = _buffer('f', count * 24)
+    objects.foreach_get('bound_box', corners)
+    matrices = matrices.reshape(count, 4, 4)
+    corners = np.concatenate([corners.reshape(count, 8, 3), np.ones((count, 8, 1), dtype=np.float32)], axis=2)
+    # row vectors times the column-major matrix = world-space corners
+    world = np.einsum('nki,nij->nkj', corners, matrices)[:, :, :3]
+    return TransformArrays(uids, matrices[:, 3, :3].copy(), world.min(axis=1), world.max(axis=1),
+                           dimensions.reshape(count, 3))
+
+
+def _round(values):
+    return tuple(round(float(v), PRECISION) for v in values)
+
+
+def _axis_lattice(values):
+    """(count, spacing) when `values` sit on a regular 1D lattice, else None."""
+    unique = sorted(set(round(float(v), PRECISION) for v in values))
+    if len(unique) == 1:
+        return 1, 0.0
+    steps = [b - a for a, b in zip(unique, unique[1:])]
+    step = steps[0]
+    if step <= 0 or any(abs(s - step) > max(0.01 * step, 10 ** -PRECISION) for s in steps):
+        return None
+    return len(unique), step
+
+
+def detect_grid(locations):
+    """Return {'counts', 'spacing', 'origin'} if `locations` fill a regular (at least 90% full) grid, else None."""
+    if len(locations) < 4:
+        return None
+    axes = []
+    for axis in range(3):
+        lattice = _axis_lattice([loc[axis] for loc in locations])
+        if lattice is None:
+            return None
+        axes.append(lattice)
+    cells = axes[0][0] * axes[1][0] * axes[2][0]
+    if cells < 4 or not 0.9 * cells <= len(locations) <= cells:
+        return None
+    return {
+        'counts': tuple(a[0] for a in axes),
+        'spacing': tuple(round(a[1], PRECISION) for a in axes),
+        'origin': _round(min(loc[axis] for loc in locations) for axis in range(3)),
+        'filled': len(locations),
+    }
+
+
+def _components(cells):
+    """Connected components (26-neighbourhood) of occupied integer cells; returns {cell: component}."""
+    component = {}
+    label = 0
+    for start in cells:
+        if start in component:
+            continue
+        component[start] = label
+        stack = [start]
+        while stack:
+            x, y, z = stack.pop()
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for dz in (-1, 0, 1):
+                        neighbour = (x + dx, y + dy, z + dz)
+                        if neighbour in cells and neighbour not in component:
+                            component[neighbour] = label
+                            stack.append(neighbour)
+        label += 1
+    return component
+
+
+def summarise_spatial(arrays, max_clusters=MAX_CLUSTERS):
+    """Reduce `TransformArrays` to extents, typical size, clusters and grids (plain data)."""
+    locations = [tuple(loc) for loc in arrays.locations] if np is None else arrays.locations
+    count = len(locations)
+    if not count:
+        return {'count': 0}
+    if np is not None:
+        low, high = arrays.bounds_min.min(axis=0), arrays.bounds_max.max(axis=0)
+        typical = float(np.median(arrays.dimensions.max(axis=1)))
+    else:
+        low = [min(b[axis] for b in arrays.bounds_min) for axis in range(3)]
+        high = [max(b[axis] for b in arrays.bounds_max) for axis in range(3)]
+        typical = sorted(max(d) for d in arrays.dimensions)[count // 2]
+
+    extent = max(float(h - l) for l, h in zip(low, high))
+    cell = max(extent / CLUSTER_CELLS, typical * 1.5, 10 ** -PRECISION)
+    if np is not None:
+        binned = np.floor((locations - low) / cell).astype(np.int64)
+        unique, inverse = np.unique(binned, axis=0, return_inverse=True)
+        component = _components({tuple(int(v) for v in c): None for c in unique})
+        labels = np.array([component[tuple(int(v) for v in c)] for c in unique])[inverse.reshape(-1)]
+        order = np.argsort(-np.bincount(labels), kind='stable')
+        members = [np.nonzero(labels == label)[0] for label in order[:max_clusters]]
+        cluster_count = len(order)
+    else:
+        binned = [tuple(int(math.floor((loc[axis] - low[axis]) / cell)) for axis in range(3)) for loc in locations]
+        component = _components(dict.fromkeys(binned))
+        groups = {}
+        for index, key in enumerate(binned):
+            groups.setdefault(component[key], []).append(index)
+        ordered = sorted(groups.values(), key=len, reverse=True)
+        members = ordered[:max_clusters]
+        cluster_count = len(ordered)
+
+    clusters = []
+    for indices in members:
+        if np is not None:
+            c_low, c_high = arrays.bounds_min[indices].min(axis=0), arrays.bounds_max[indices].max(axis=0)
+            c_locations = [tuple(float(v) for v in loc) for loc in locations[indices]]
+        else:
+            c_low = [min(arrays.bounds_min[i][axis] for i in indices) for axis in range(3)]
+            c_high = [max(arrays.bounds_max[i][axis] for i in indices) for axis in range(3)]
+            c_locations = [locations[i] for i in indices]
+        clusters.append({
+            'count': len(indices),
+            'center': _round((float(l) + float(h)) / 2 for l, h in zip(c_low, c_high)),
+            'size': _round(float(h) - float(l) for l, h in zip(c_low, c_high)),
+            'grid': detect_grid(c_locations),
+            'uids': [int(arrays.uids[i]) for i in indices[:NAMED_CLUSTER_SIZE]] if arrays.uids is not None else [],
+        })
+    return {
+        'count': count,
+        'min': _round(low),
+        'max': _round(high),
+        'typical_size': round(typical, PRECISION),
+        'clusters': clusters,
+        'cluster_count': cluster_count,
+    }
+
+
+def _vector(values):
+    return f"({', '.join(f'{v:g}' for v in values)})"
+
+
+def format_spatial_summary(summary, name_of=None):
+    """Render `summarise_spatial` output as a short text block; `name_of(uid)` labels small clusters."""
+    if not summary.get('count'):
+        return ''
+    lines = [f"Spatial layout (world units): {summary['count']} objects between {_vector(summary['min'])} "
+             f"and {_vector(summary['max'])}; typical object size {summary['typical_size']:g}."]
+    extra = summary['cluster_count'] - len(summary['clusters'])
+    lines.append(f"Clusters ({summary['cluster_count']}, largest first):")
+    for cluster in summary['clusters']:
+        noun = 'object' if cluster['count'] == 1 else 'objects'
+        line = (f"- {cluster['count']} {noun} around {_vector(cluster['center'])}, "
+                f"spanning {' x '.join(f'{v:g}' for v in cluster['size'])}")
+        grid = cluster['grid']
+        if grid is not None:
+            line += (f"; grid {' x '.join(str(c) for c in grid['counts'])} with spacing "
+                     f"{_vector(grid['spacing'])} from {_vector(grid['origin'])}")
+        if cluster['count'] <= NAMED_CLUSTER_SIZE and name_of is not None and cluster['uids']:
+            names = [name_of(uid) for uid in cluster['uids']]
+            line += f": {', '.join(n for n in names if n)}"
+        lines.append(line)
+    if extra > 0:
+        lines.append(f"- {extra} smaller clusters not listed")
+    return '\n'.join(lines)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def spatial_context(scene, snapshot):
+    """Spatial summary block for `scene`, recomputed only when its layout changed. Main thread only.
+
+    `snapshot` is the scene's current `scene_index.SceneSnapshot`, whose
+    `layout_version` changes whenever objects move, change or come and go.
+    """
+    key = (snapshot.version, snapshot.layout_version)
+    with _cache_lock:
+        cached = _cache.get(snapshot.scene)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    start = time.perf_counter()
+    summary = summarise_spatial(extract_transforms(scene.objects))
+    records = snapshot.objects
+    block = format_spatial_summary(summary, lambda uid: records[uid].name if uid in records else '')
+    print(f"BlenderCopilot: summarised placement of {summary['count']} objects in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    with _cache_lock:
+        _cache[snapshot.scene] = (key, block)
+    return block
+
+
+def clear_spatial_cache():
+    with _cache_lock:
+        _cache.clear()
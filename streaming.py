@@ -0,0 +1,130 @@
+"""Incremental parsing of Server-Sent-Events chat completion streams.
+
+OpenAI-compatible proxies answer `stream: true` requests with a
+`text/event-stream` body made of `data: {...}` frames and a final
+`data: [DONE]`. These helpers turn the raw response lines into text tokens
+without waiting for the body to finish.
+"""
+import json
+
+
+class SSEDecoder:
+    """Line-at-a-time SSE decoder, usable from both sync and async readers.
+
+    `feed` takes one raw line (bytes or str) and returns the data payload of
+    the event it completes, or None. Multi-line `data:` fields are joined with
+    a newline as required by the SSE spec; comments and other fields are
+    ignored. Call `flush` at end of stream for an unterminated last event.
+    """
+
+    def __init__(self):
+        self._data = []
+
+    def feed(self, raw):
+        line = raw.decode('utf-8', 'replace') if isinstance(raw, bytes) else raw
+        line = line.rstrip('\r\n')
+        if not line:
+            return self.flush()
+        if line.startswith(':'):
+            return None
+        field, _, value = line.partition(':')
+        if value.startswith(' '):
+            value = value[1:]
+        if field == 'data':
+            self._data.append(value)
+        return None
+
+    def flush(self):
+        if not self._data:
+            return None
+        data, self._data = '\n'.join(self._data), []
+        return data
+
+
+def iter_sse_data(lines):
+    """Yield the data payload of each SSE event from an iterable of raw lines."""
+    decoder = SSEDecoder()
+    for raw in lines:
+        data = decoder.feed(raw)
+        if data is not None:
+            yield data
+    data = decoder.flush()
+    if data is not None:
+        yield data
+
+
+def delta_text(chunk):
+    """Return the text carried by one streamed chunk (chat or legacy completions shape)."""
+    try:
+        choices = chunk.get('choices')
+        if not choices:
+            return ''
+        first = choices[0]
+        delta = first.get('delta') or first.get('message') or {}
+        if isinstance(delta, dict) and delta.get('content'):
+            return delta['content']
+        return first.get('text') or ''
+    except Exception:
+        return ''
+
+
+def event_text(data):
+    """Return the text token carried by one SSE data payload, or None for `[DONE]`."""
+    if data.strip() == '[DONE]':
+        return None
+    try:
+        chunk = json.loads(data)
+    except Exception:
+        return ''
+    return delta_text(chunk) if isinstance(chunk, dict) else ''
+
+
+def iter_completion_tokens(lines):
+    """Yield text tokens from an SSE completion stream until `[DONE]`."""
+    for data in iter_sse_data(lines):
+        token = event_text(data)
+        if token is None:
+            return
+        if token:
+            yield token
+
+
+FENCE = '```'
+
+
+class CodeFenceDetector:
+    """Watch a token stream for the end of the first fenced code block.
+
+    Feed tokens as they arrive; `feed` returns True once an opening fence
+    and its matching closing fence have both been seen. `text` then holds
+    everything received up to and including the closing fence, which is all
+    `extract_code_block` needs.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._scan_from = 0
+        self._open_at = None
+        self.closed = False
+        self.text = ''
+
+    def feed(self, token):
+        if self.closed:
+            return True
+        self._buffer += token
+        # back up a little so fences split across tokens are still found
+        start = max(self._scan_from - len(FENCE) + 1, 0)
+        if self._open_at is None:
+            index = self._buffer.find(FENCE, start)
+            if index < 0:
+                self._scan_from = len(self._buffer)
+                return False
+            self._open_at = index
+            start = index + len(FENCE)
+        close = self._buffer.find(FENCE, max(start, self._open_at + len(FENCE)))
+        if close < 0:
+            self._scan_from = len(self._buffer)
+            return False
+        self.closed = True
+        self.text = self._buffer[:close + len(FENCE)]
+        return True
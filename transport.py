@@ -0,0 +1,575 @@
+"""Pooled keep-alive HTTP transport for proxy requests.
+
+Every proxy call (chat completions, model listing, probes) goes through one
+process-wide client built on the vendored urllib3 `PoolManager`, which keeps
+an `HTTPConnectionPool` per proxy host. Connections are reused across requests
+and candidate paths, and https proxies share a single `SSLContext`, so TCP and
+TLS setup is paid once per connection instead of once per call.
+
+Every request also passes through a per-endpoint circuit breaker, so a proxy
+that is down costs a few milliseconds per request instead of a full timeout
+per candidate path. Callers that pass a `RetryState` get transient failures
+(connection errors, 429 and 502-504 answers) retried on the same URL with
+jittered exponential backoff or the proxy's Retry-After.
+
+The client never touches bpy and is safe to use from worker threads.
+"""
+import json
+import random
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+
+USER_AGENT = 'BlenderCopilot/1.0'
+DEFAULT_POOL_MAXSIZE = 4
+
+
+class ProxyHTTPError(Exception):
+    """Raised for HTTP error statuses (>= 400) returned by the proxy."""
+
+    def __init__(self, url, status, body='', headers=None):
+        super().__init__(f"HTTP Error {status} for {url}")
+        self.url = url
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class CircuitOpenError(Exception):
+    """Raised without contacting the proxy while its circuit breaker is open."""
+
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"{endpoint} is unavailable (circuit open, retrying in {retry_in:.0f}s)")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half-open'
+
+# consecutive failures that open a breaker, and how long it then stays open
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_COOLDOWN = 15.0
+BREAKER_MAX_COOLDOWN = 300.0
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker for one proxy endpoint (scheme://host:port).
+
+    Closed: requests flow; connection errors, timeouts and 5xx answers count
+    as failures and `failure_threshold` in a row open the breaker. Open:
+    `allow` raises `CircuitOpenError` at once until the cooldown has passed.
+    Half-open: a single trial request is let through; success closes the
+    breaker, failure opens it again with a doubled cooldown.
+    """
+
+    def __init__(self, endpoint, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return BREAKER_CLOSED
+        if now - self.opened_at < self.cooldown:
+            return BREAKER_OPEN
+        return BREAKER_HALF_OPEN
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def allow(self):
+        """Return if a request may be sent now, else raise `CircuitOpenError`."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(now)
+            if state == BREAKER_CLOSED:
+                return
+            if state == BREAKER_HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_in = max(0.0, self.opened_at + self.cooldown - now)
+        raise CircuitOpenError(self.endpoint, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print(f"BlenderCopilot: circuit for {self.endpoint} closed again")
+            self.failures = 0
+            self.opened_at = None
+            self.cooldown = self.base_cooldown
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Forget a half-open trial that was abandoned without an outcome."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        now = time.monotonic()
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight:
+                # the trial request failed: open again for longer
+                self._trial_in_flight = False
+                self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+                self.opened_at = now
+            elif self.opened_at is None and self.failures >= self.failure_threshold:
+                self.opened_at = now
+            else:
+                return
+            cooldown = self.cooldown
+        print(f"BlenderCopilot: circuit for {self.endpoint} open for {cooldown:.0f}s after {self.failures} failures")
+
+    def describe(self):
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(now)
+            if state == BREAKER_OPEN:
+                return f"open, retry in {self.opened_at + self.cooldown - now:.0f}s"
+            if state == BREAKER_CLOSED and self.failures:
+                return f"closed ({self.failures} failures)"
+            return state
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def endpoint_of(url):
+    """scheme://host:port of `url`; the unit a circuit breaker covers."""
+    parts = urlsplit(url or '')
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+def breaker_for(url):
+    endpoint = endpoint_of(url)
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+
+def describe_breaker(url):
+    """Short breaker state for `url` for the panel ('' if it never saw a request)."""
+    if not url:
+        return ''
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint_of(url))
+    return breaker.describe() if breaker is not None else ''
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+# Statuses retried on the same URL after a pause: rate limits and an
+# overloaded or restarting upstream. 404/405 mean a wrong path and other 4xx
+# a request the proxy will never accept, so those fail at once.
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+
+def parse_retry_after(value):
+    """Seconds asked for by a Retry-After header (delay or HTTP date), or None when absent or invalid."""
+    if not value:
+        return None
+    from urllib3.util.retry import Retry
+    try:
+        return float(Retry(0).parse_retry_after(str(value)))
+    except Exception:
+        return None
+
+
+class RetryPolicy:
+    """Retry limits for proxy requests; `start()` returns the state for one request.
+
+    `total` caps the retries of a request, `connect` and `read` those after
+    transport errors before and after the request was sent. A read error
+    means the proxy may already be generating, so resending would pay for
+    the completion twice: read retries are off unless a caller opts in with
+    `read=n` (only safe for idempotent requests). Waits grow
+    exponentially from `backoff_factor` up to `max_backoff` with full jitter,
+    unless the proxy sent Retry-After. No retry is made that would end more
+    than `budget` seconds after the request started.
+    """
+
+    def __init__(self, total=3, connect=2, read=0, backoff_factor=0.5, max_backoff=8.0, budget=30.0):
+        self.total = total
+        self.connect = connect
+        self.read = read
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.budget = budget
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build a policy from the plain `{'total': n, 'budget': seconds}` dict snapshotted into requests."""
+        settings = settings or {}
+        policy = cls()
+        if settings.get('total') is not None:
+            policy.total = int(settings['total'])
+        if settings.get('budget') is not None:
+            policy.budget = float(settings['budget'])
+        return policy
+
+    def start(self, cancel=None):
+        return RetryState(self, cancel)
+
+
+class RetryState:
+    """Retries made so far by one logical request, possibly across several URLs.
+
+    A `cancel` event cuts waits short. Not thread-safe: one state per request.
+    """
+
+    def __init__(self, policy, cancel=None):
+        self.policy = policy
+        self.cancel = cancel
+        self.started_at = time.monotonic()
+        self.retries = 0
+        self.waited = 0.0
+        # retries per cause: 'connect', 'read' or an HTTP status
+        self.causes = {}
+
+    def next_delay(self, cause, error, retry_after=None):
+        """Seconds to wait before retrying after `error`, or None to give up.
+
+        Records the retry when one is granted.
+        """
+        policy = self.policy
+        if cause is None or self.retries >= policy.total:
+            return None
+        if self.cancel is not None and self.cancel.is_set():
+            return None
+        limit = {'connect': policy.connect, 'read': policy.read}.get(cause)
+        if limit is None and cause not in RETRY_STATUSES:
+            return None
+        if limit is not None and self.causes.get(cause, 0) >= limit:
+            return None
+        if retry_after is None:
+            retry_after = random.uniform(0, min(policy.max_backoff, policy.backoff_factor * 2 ** self.retries))
+        if time.monotonic() + retry_after - self.started_at > policy.budget:
+            print(f"BlenderCopilot: not retrying {error}: a {retry_after:.1f}s wait exceeds the retry budget")
+            return None
+        self.retries += 1
+        self.waited += retry_after
+        self.causes[cause] = self.causes.get(cause, 0) + 1
+        print(f"BlenderCopilot: {error}; retry {self.retries} in {retry_after:.1f}s")
+        return retry_after
+
+    def sleep(self, delay):
+        """Wait `delay` seconds; returns False if the request was cancelled meanwhile."""
+        if self.cancel is not None:
+            return not self.cancel.wait(delay)
+        time.sleep(delay)
+        return True
+
+    def describe(self):
+        causes = ', '.join(f"{cause} x{count}" for cause, count in self.causes.items())
+        return f"{self.retries} retries ({causes}), waited {self.waited:.1f}s"
+
+
+class ProxyResponse:
+    """Thin wrapper over a urllib3 response that knows how to hand its connection back."""
+
+    def __init__(self, raw, url):
+        self._raw = raw
+        self.url = url
+        self.status = raw.status
+        self.headers = raw.headers
+        self._consumed = False
+
+    def read(self):
+        data = self._raw.data if self._raw.data is not None else self._raw.read()
+        self._consumed = True
+        return data
+
+    def text(self):
+        return self.read().decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text())
+
+    def iter_lines(self):
+        """Yield lines (bytes) as soon as they arrive, decoded if the body was compressed."""
+        encoding = (self.headers.get('Content-Encoding') or 'identity').strip().lower()
+        fp = getattr(self._raw, '_fp', None)
+        if self._raw.chunked or encoding != 'identity' or fp is None:
+            # urllib3 decodes gzip/deflate; read_chunked yields each chunk as it is received
+            yield from self._raw
+        else:
+            # urllib3's non-chunked stream() waits for 64KB blocks; the
+            # underlying http.client response can hand out complete lines
+            while True:
+                line = fp.readline()
+                if not line:
+                    break
+                yield line
+        self._consumed = True
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    def close(self):
+        """Release the connection; partially read bodies close it instead of reusing it."""
+        try:
+            if not self._consumed:
+                self._raw.close()
+            self._raw.release_conn()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _create_ssl_context():
+    try:
+        import certifi
+        return ssl.create_default_context(cafile=certifi.where())
+    except Exception:
+        return ssl.create_default_context()
+
+
+class PooledHTTPClient:
+    """Process-wide HTTP client with per-host keep-alive connection pools."""
+
+    def __init__(self, maxsize=DEFAULT_POOL_MAXSIZE):
+        import urllib3
+
+        self._urllib3 = urllib3
+        self.maxsize = maxsize
+        self.ssl_context = _create_ssl_context()
+        self._manager = urllib3.PoolManager(
+            num_pools=16,
+            maxsize=maxsize,
+            block=False,
+            retries=False,
+            ssl_context=self.ssl_context,
+            headers={'User-Agent': USER_AGENT},
+        )
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'errors': 0, 'http_errors': 0, 'streams': 0, 'retries': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def error_cause(self, error):
+        """'connect' or 'read' for retryable transport errors of urllib3, else None."""
+        exceptions = self._urllib3.exceptions
+        # NewConnectionError (refused, unresolvable) is a ConnectTimeoutError
+        if isinstance(error, exceptions.ConnectTimeoutError):
+            return 'connect'
+        if isinstance(error, (exceptions.ReadTimeoutError, exceptions.ProtocolError)):
+            return 'read'
+        return None
+
+    def request(self, method, url, headers=None, body=None, json_body=None, timeout=30, stream=False, retry=None):
+        """Send a request and return a `ProxyResponse`.
+
+        `timeout` is either a total number of seconds or a (connect, read)
+        tuple. With `stream=True` the body is left unread so callers can
+        iterate lines; use the response as a context manager to release it.
+        With a `RetryState` as `retry`, transient failures are retried on the
+        same URL as the state allows.
+        Raises `ProxyHTTPError` for statuses >= 400, and `CircuitOpenError`
+        without sending anything while the endpoint's breaker is open.
+        """
+        request_headers = {'User-Agent': USER_AGENT}
+        if stream:
+            # a compressed body arrives in compressed blocks, so tokens would
+            # only show once a whole block is in; ask the proxy not to
+            request_headers['Accept-Encoding'] = 'identity'
+        request_headers.update(headers or {})
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            request_headers.setdefault('Content-Type', 'application/json')
+
+        if isinstance(timeout, tuple):
+            timeout = self._urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        else:
+            timeout = self._urllib3.Timeout(connect=timeout, read=timeout)
+
+        breaker = breaker_for(url)
+        while True:
+            breaker.allow()
+            self._count('requests')
+            if stream:
+                self._count('streams')
+            try:
+                raw = self._manager.request(
+                    method, url, body=body, headers=request_headers, timeout=timeout,
+                    preload_content=not stream, redirect=True,
+                )
+            except Exception as e:
+                self._count('errors')
+                breaker.record_failure()
+                if not self._wait_for_retry(retry, self.error_cause(e), e):
+                    raise
+                continue
+
+            if raw.status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            response = ProxyResponse(raw, url)
+            if raw.status < 400:
+                return response
+            self._count('http_errors')
+            try:
+                error_body = response.text()
+            except Exception:
+                error_body = ''
+            response.close()
+            error = ProxyHTTPError(url, raw.status, error_body, dict(raw.headers))
+            if not self._wait_for_retry(retry, raw.status, error, parse_retry_after(raw.headers.get('Retry-After'))):
+                raise error
+
+    def _wait_for_retry(self, retry, cause, error, retry_after=None):
+        if retry is None:
+            return False
+        delay = retry.next_delay(cause, error, retry_after)
+        if delay is None:
+            return False
+        self._count('retries')
+        return retry.sleep(delay)
+
+    def stats(self):
+        """Return counters and per-host pool state for debugging."""
+        pools = []
+        try:
+            for key in list(self._manager.pools.keys()):
+                pool = self._manager.pools.get(key)
+                if pool is None:
+                    continue
+                pools.append({
+                    'host': f"{pool.scheme}://{pool.host}:{pool.port}",
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'idle': pool.pool.qsize() if pool.pool is not None else 0,
+                })
+        except Exception:
+            pass
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({'maxsize': self.maxsize, 'pools': pools})
+        return counters
+
+    def clear(self):
+        self._manager.clear()
+
+
+def race(candidates, attempt, on_loser=None, max_workers=8):
+    """Run `attempt(candidate)` for all candidates concurrently and keep the first usable result.
+
+    A result is usable when `attempt` returns something other than None
+    without raising. Attempts that have not started yet are cancelled; ones
+    already in flight cannot be interrupted, so their results are handed to
+    `on_loser` (e.g. to close a response) whenever they finish.
+
+    Returns (winning_candidate, result, errors) where `errors` maps the
+    candidates that raised to their exception. The candidate is None when no
+    attempt succeeded.
+    """
+    candidates = list(candidates)
+    if not candidates:
+        return None, None, {}
+
+    def dispose(future):
+        if on_loser is None or future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        if result is not None:
+            try:
+                on_loser(result)
+            except Exception:
+                pass
+
+    executor = ThreadPoolExecutor(max_workers=min(len(candidates), max_workers),
+                                  thread_name_prefix='BlenderCopilotRace')
+    futures = {executor.submit(attempt, candidate): candidate for candidate in candidates}
+    errors = {}
+    winner = None
+    try:
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+                continue
+            if result is not None:
+                winner = future
+                break
+    finally:
+        for future in futures:
+            if future is not winner:
+                future.cancel()
+                future.add_done_callback(dispose)
+        executor.shutdown(wait=False)
+
+    if winner is None:
+        return None, None, errors
+    return futures[winner], winner.result(), errors
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client(maxsize=None):
+    """Return the shared client, rebuilding it if a different pool size is requested."""
+    global _client
+    with _client_lock:
+        if _client is None or (maxsize and maxsize != _client.maxsize):
+            old = _client
+            _client = PooledHTTPClient(maxsize or DEFAULT_POOL_MAXSIZE)
+            if old is not None:
+                # only drops idle connections: a response still being read keeps
+                # its own and closes it when released, so in-flight calls finish
+                old.clear()
+        return _client
+
+
+def http_pool_stats():
+    client = _client
+    if client is None:
+        return {}
+    return client.stats()
+
+
+def format_pool_stats(stats):
+    """One-line summary of `http_pool_stats()` for the panel."""
+    if not stats:
+        return ''
+    opened = sum(p['connections_opened'] for p in stats.get('pools', []))
+    summary = f"HTTP pool: {stats.get('requests', 0)} requests over {opened} connections (max {stats.get('maxsize')}/host)"
+    if stats.get('retries'):
+        summary += f", {stats['retries']} retries"
+    return summary
+
+
+def close_http_client():
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.clear()
@@ -1,13 +1,58 @@
+import asyncio
 import bpy
 import re
 import os
 import sys
-
-
-def wrap_prompt(prompt):
-    wrapped = f"""Can you please write Blender code for me that accomplishes the following task: \n
-    {prompt}?Do not respond with anything that is not Python code. Do not provide explanations. Don't use bpy.context.active_object. Color requires an alpha channel ex: red = (1,0,0,1). """
-    return wrapped
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .streaming import CodeFenceDetector, SSEDecoder, delta_text, event_text, iter_completion_tokens
+from .transport import (
+    RETRY_STATUSES,
+    CircuitOpenError,
+    ProxyHTTPError,
+    RetryPolicy,
+    breaker_for,
+    describe_breaker,
+    endpoint_of,
+    get_http_client,
+    parse_retry_after,
+    race,
+)
+from .async_transport import async_transport_available, get_async_transport
+from .engine import SingleFlight
+from .conversation import (
+    HISTORY_DROP_STEP,
+    MAX_COMPLETION_TOKENS,
+    code_fingerprint,
+    context_budget,
+    layout_head,
+    layout_tail,
+    pack_messages,
+    prefix_tracker,
+)
+from .metrics import adaptive_timeout, latency_key, latency_stats
+from .proxy_pool import parse_proxy_list, proxy_pool
+from .caches import (
+    forget_endpoint,
+    get_cached_endpoint,
+    get_cached_models,
+    last_cached_models,
+    model_cache_key,
+    remember_endpoint,
+    remember_models,
+    response_cache,
+    response_cache_key,
+)
+
+
+# Rules for every request. They live in the system message rather than being
+# wrapped around each prompt, so a prompt is sent with the same bytes as the
+# current request and later as history, and prefix caches keep matching.
+PROMPT_RULES = """Every user message is a task: write Blender Python code that accomplishes it.
+Do not respond with anything that is not Python code. Do not provide explanations.
+Don't use bpy.context.active_object. Color requires an alpha channel ex: red = (1,0,0,1)."""
 
 
 def get_api_key(context, addon_name):
@@ -42,6 +87,7 @@ def get_copilot_proxy_settings(context, addon_name):
     proxy_key = ''
     proxy_model = ''
     proxy_path = ''
+    extra_proxies = []
 
     if addon_prefs:
         # Construct URL from separate IP and port fields
@@ -58,6 +104,7 @@ def get_copilot_proxy_settings(context, addon_name):
         proxy_key = getattr(addon_prefs, 'copilot_proxy_api_key', '')
         proxy_model = getattr(addon_prefs, 'copilot_model', '')
         proxy_path = getattr(addon_prefs, 'copilot_proxy_path', '')
+        extra_proxies = parse_proxy_list(getattr(addon_prefs, 'copilot_proxy_pool', ''))
 
     else:
         # If addon preferences are not available, fall back to scene-level properties
@@ -85,107 +132,348 @@ def get_copilot_proxy_settings(context, addon_name):
     proxy_model = proxy_model or os.environ.get('COPILOT_MODEL') or ''
     proxy_path = proxy_path or os.environ.get('COPILOT_PROXY_PATH') or ''
 
+    # Several interchangeable proxies: the main one plus the extra list
+    extra_proxies = extra_proxies or parse_proxy_list(os.environ.get('COPILOT_PROXY_POOL', ''))
+    pool = _dedupe(([proxy_url.rstrip('/')] if proxy_url else []) + extra_proxies) if extra_proxies else []
+
     return {
         'url': proxy_url,
         'key': proxy_key,
         'model': proxy_model,
         'path': proxy_path,
+        'pool': pool,
         'ip': locals().get('proxy_ip', ''),
         'port': locals().get('proxy_port', ''),
     }
 
 
-def fetch_models_from_proxy(context, addon_name, timeout=10):
-    """Query the proxy for available models and return a list of model ids.
+def get_copilot_option(context, addon_name, name, default=None):
+    """Return an add-on option from preferences, then scene props, then `default`."""
+    key = resolve_addon_key(context.preferences, addon_name)
+    if key:
+        try:
+            addon_prefs = context.preferences.addons[key].preferences
+            if hasattr(addon_prefs, name):
+                return getattr(addon_prefs, name)
+        except Exception:
+            pass
+    try:
+        if hasattr(context.scene, name):
+            return getattr(context.scene, name)
+    except Exception:
+        pass
+    return default
+
+
+def normalize_proxy_path(proxy_path):
+    """Return the optional proxy path prefix as '/prefix' (no trailing slash) or ''."""
+    proxy_path = (proxy_path or '').strip()
+    if proxy_path and not proxy_path.startswith('/'):
+        proxy_path = '/' + proxy_path
+    return proxy_path.rstrip('/')
+
+
+def _join_endpoint(base_url, path):
+    # avoid duplicating version segments (e.g., base_url endswith '/v1' and path startswith '/v1')
+    if base_url.endswith('/v1') and path.startswith('/v1'):
+        return base_url + path[len('/v1'):]
+    return base_url + path
+
+
+def _dedupe(items):
+    seen = set()
+    out = []
+    for item in items:
+        if item not in seen:
+            out.append(item)
+            seen.add(item)
+    return out
+
+
+def model_candidate_urls(base_url, proxy_path=''):
+    """Model-list URLs to probe, with the optional proxy path first."""
+    candidates = []
+    if proxy_path:
+        candidates += [f"{base_url}{proxy_path}/v1/models", f"{base_url}{proxy_path}/models"]
+    candidates += [f"{base_url}/v1/models", f"{base_url}/models"]
+    return _dedupe(candidates)
+
+
+def chat_candidate_urls(base_url, proxy_path='', model=None):
+    """Chat completion URLs to probe, with the optional proxy path first."""
+    candidate_paths = [
+        '/v1/chat/completions',
+        '/chat/completions',
+        '/v1/completions',
+        '/completions',
+        f'/{model}/chat/completions' if model else None,
+        f'/{model}/completions' if model else None,
+    ]
+
+    # Filter out None entries
+    candidate_paths = [p for p in candidate_paths if p]
+
+    prefixes = [f"{base_url}{proxy_path}", base_url] if proxy_path else [base_url]
+    return _dedupe(_join_endpoint(prefix, path) for prefix in prefixes for path in candidate_paths)
+
+
+def chat_probe_payload(model):
+    """Smallest chat request that tells whether an endpoint serves `model`; raced during discovery.
+
+    Aliased routes of one proxy would each start (and bill) the real
+    generation, and closing the losing connections does not stop the work
+    upstream, so only this one-token request is sent to every candidate.
+    """
+    return {'model': model, 'messages': [{'role': 'user', 'content': 'ping'}], 'max_tokens': 1}
+
+
+def parse_models_body(body):
+    """Return the model ids listed in a models endpoint response body (possibly empty)."""
+    import ast
+    import json
+
+    try:
+        data = json.loads(body)
+    except Exception:
+        # maybe it's a plain list of strings
+        try:
+            parsed = ast.literal_eval(body)
+            if isinstance(parsed, list):
+                return [str(x) for x in parsed]
+        except Exception:
+            pass
+        return []
+
+    models = []
+    # OpenAI-style: {'data':[{'id': 'gpt-4'}, ...]}
+    if isinstance(data, dict) and 'data' in data and isinstance(data['data'], list):
+        for item in data['data']:
+            if isinstance(item, dict) and 'id' in item:
+                models.append(str(item['id']))
+        if models:
+            return models
+
+    # simple object with 'models' key or direct mapping
+    if isinstance(data, dict):
+        # try keys that may list models
+        for key in ('models', 'available_models'):
+            if key in data and isinstance(data[key], list):
+                models = [str(x) if not isinstance(x, dict) else str(x.get('id', '')) for x in data[key]]
+                models = [m for m in models if m]
+                break
+    return models
+
+
+def build_models_request(context, addon_name, timeout=None):
+    """Snapshot the proxy settings needed to list models. Main thread only."""
+    proxy = get_copilot_proxy_settings(context, addon_name)
+    base = (proxy.get('url') or '').rstrip('/')
+    proxy_path = normalize_proxy_path(proxy.get('path'))
+    api_key = proxy.get('key') or ''
+    return {
+        'url': base,
+        'path': proxy_path,
+        'key': api_key,
+        'cache_key': model_cache_key(base, proxy_path, api_key),
+        'timeout': timeout,
+        'pool_maxsize': get_copilot_option(context, addon_name, 'copilot_pool_maxsize', None),
+        'endpoint_ttl': get_copilot_option(context, addon_name, 'copilot_endpoint_cache_ttl', None),
+        'race_discovery': bool(get_copilot_option(context, addon_name, 'copilot_race_discovery', True)),
+        'async_transport': bool(get_copilot_option(context, addon_name, 'copilot_async_transport', False)),
+    }
+
+
+# Model listing is cheap and runs in the background: retry briefly only
+MODELS_RETRY_POLICY = RetryPolicy(total=2, read=0, budget=10.0)
+
+
+def run_models_request(request):
+    """Query the proxy for available model ids. Safe to call from a worker thread.
 
     Tries common endpoints used by OpenAI-compatible proxies:
     - {base}/v1/models  (OpenAI format: {'data':[{'id': ...}, ...]})
     - {base}/models     (simple list or OpenAI-like)
 
-    Returns a list of strings (model ids) or empty list on failure.
-    Does not require an API key; if the proxy requires one the addon prefs or env var will be used.
+    Returns a de-duplicated list of model ids, empty on failure. Successful
+    answers are stored in the model cache.
     """
-    proxy = get_copilot_proxy_settings(context, addon_name)
-    base = proxy.get('url')
-    api_key = proxy.get('key')
+    base = request.get('url')
     if not base:
         return []
+    proxy_path = request.get('path') or ''
+    api_key = request.get('key')
+    timeout = request.get('timeout') or adaptive_timeout(base, kind='models')
 
-    # normalize base URL
-    base = base.rstrip('/')
-    proxy_path = (proxy.get('path') or '').strip()
-    if proxy_path and not proxy_path.startswith('/'):
-        proxy_path = '/' + proxy_path
-    proxy_path = proxy_path.rstrip('/')
+    client = get_http_client(request.get('pool_maxsize'))
+    headers = {}
+    if api_key:
+        headers['Authorization'] = f"Bearer {api_key}"
 
-    import json
-    from urllib import request, error
+    cached_url = get_cached_endpoint(base, proxy_path, '', 'models', request.get('endpoint_ttl'))
+    candidates = model_candidate_urls(base, proxy_path)
+    if cached_url:
+        # go straight to the endpoint that worked last time; probe the rest only if it fails
+        candidates = [cached_url] + [u for u in candidates if u != cached_url]
 
-    headers = {
-        'User-Agent': 'BlenderCopilot/1.0'
-    }
+    def probe(url, retry=None):
+        start = time.monotonic()
+        with client.request('GET', url, headers=headers, timeout=timeout, retry=retry) as resp:
+            latency_stats.record(latency_key(base, ''), connect=time.monotonic() - start)
+            return parse_models_body(resp.text()) or None
+
+    models = []
+    if not cached_url and request.get('race_discovery'):
+        # nothing known yet: probe every candidate at once and keep the first answer
+        url, models, _errors = race(candidates, probe)
+        models = models or []
+        if models:
+            remember_endpoint(base, proxy_path, '', 'models', url)
+    else:
+        retry = MODELS_RETRY_POLICY.start()
+        for url in candidates:
+            try:
+                models = probe(url, retry) or []
+            except ProxyHTTPError as he:
+                models = []
+                if he.status in RETRY_STATUSES:
+                    # rate limited or overloaded: other paths would only add load
+                    break
+            except Exception:
+                models = []
+            if models:
+                remember_endpoint(base, proxy_path, '', 'models', url)
+                break
+            if url == cached_url:
+                forget_endpoint(base, proxy_path, '', 'models')
+
+    # dedupe while preserving order
+    models = _dedupe(models)
+    if models:
+        remember_models(request.get('cache_key'), models)
+    return models
+
+
+async def run_models_request_async(request, transport):
+    """Same as `run_models_request`, on the event loop of an `AsyncProxyTransport`."""
+    base = request.get('url')
+    if not base:
+        return []
+    proxy_path = request.get('path') or ''
+    api_key = request.get('key')
+    timeout = request.get('timeout') or adaptive_timeout(base, kind='models')
+
+    headers = {}
     if api_key:
         headers['Authorization'] = f"Bearer {api_key}"
 
-    # Try with the optional proxy path first, then without
-    candidates = []
-    if proxy_path:
-        candidates += [f"{base}{proxy_path}/v1/models", f"{base}{proxy_path}/models", f"{base}{proxy_path}/v1/models"]
-    candidates += [f"{base}/v1/models", f"{base}/models"]
+    cached_url = get_cached_endpoint(base, proxy_path, '', 'models', request.get('endpoint_ttl'))
+    candidates = model_candidate_urls(base, proxy_path)
+    if cached_url:
+        candidates = [cached_url] + [u for u in candidates if u != cached_url]
+
+    async def probe(url, retry=None):
+        start = time.monotonic()
+        resp = await transport.open('GET', url, headers=headers, timeout=timeout, retry=retry)
+        latency_stats.record(latency_key(base, ''), connect=time.monotonic() - start)
+        async with resp:
+            return parse_models_body(await resp.text()) or None
 
     models = []
-    for url in candidates:
+    if not cached_url and request.get('race_discovery'):
+        url, models, _errors = await transport.race(candidates, probe)
+        models = models or []
+        if models:
+            remember_endpoint(base, proxy_path, '', 'models', url)
+    else:
+        retry = MODELS_RETRY_POLICY.start()
+        for url in candidates:
+            try:
+                models = await probe(url, retry) or []
+            except ProxyHTTPError as he:
+                models = []
+                if he.status in RETRY_STATUSES:
+                    break
+            except Exception:
+                models = []
+            if models:
+                remember_endpoint(base, proxy_path, '', 'models', url)
+                break
+            if url == cached_url:
+                forget_endpoint(base, proxy_path, '', 'models')
+
+    models = _dedupe(models)
+    if models:
+        remember_models(request.get('cache_key'), models)
+    return models
+
+
+def submit_proxy_job(request, run, run_async, **job_options):
+    """Submit a proxy job to the background engine.
+
+    With the 'async transport' preference on (and aiohttp importable) the job
+    runs as `await run_async(job, request, transport)` on the aiohttp event
+    loop; otherwise as `run(job, request)` on the worker pool.
+    `job_options` are passed on to the engine (kind, scene_name, callbacks).
+    """
+    from .engine import get_engine
+
+    engine = get_engine()
+    if request.get('async_transport') and async_transport_available():
         try:
-            req = request.Request(url, headers=headers, method='GET')
-            with request.urlopen(req, timeout=timeout) as resp:
-                body = resp.read().decode('utf-8')
-                try:
-                    data = json.loads(body)
-                except Exception:
-                    # maybe it's a plain list of strings
-                    try:
-                        parsed = eval(body)
-                        if isinstance(parsed, list):
-                            models = [str(x) for x in parsed]
-                            break
-                    except Exception:
-                        continue
-
-                # OpenAI-style: {'data':[{'id': 'gpt-4'}, ...]}
-                if isinstance(data, dict) and 'data' in data and isinstance(data['data'], list):
-                    for item in data['data']:
-                        if isinstance(item, dict) and 'id' in item:
-                            models.append(str(item['id']))
-                    if models:
-                        break
-
-                # simple object with 'models' key or direct mapping
-                if isinstance(data, dict):
-                    # try keys that may list models
-                    for key in ('models', 'available_models'):
-                        if key in data and isinstance(data[key], list):
-                            models = [str(x) if not isinstance(x, dict) else str(x.get('id', '')) for x in data[key]]
-                            models = [m for m in models if m]
-                            break
-                    if models:
-                        break
-
-        except error.HTTPError:
-            continue
-        except Exception:
-            continue
+            transport = get_async_transport(request.get('pool_maxsize'))
+        except Exception as e:
+            print(f"BlenderCopilot: async transport unavailable, using worker threads: {e}")
+        else:
+            return engine.submit_coroutine(transport.submit, run_async, request, transport, **job_options)
+    return engine.submit(run, request, **job_options)
 
-    # dedupe while preserving order
-    seen = set()
-    out = []
-    for m in models:
-        if m not in seen:
-            out.append(m)
-            seen.add(m)
-    if out:
-        return out, 'proxy'
-
-    # If proxy didn't return models, check for a manual list in addon preferences or environment
+
+def probe_proxy(url, proxy_path='', api_key='', timeout=None, pool_maxsize=None):
+    """Health probe for one proxy: GET its models endpoint and return the latency in seconds.
+
+    Uses the models endpoint discovered by `run_models_request` when known.
+    Any answer below 500 counts as alive, since some proxies do not list
+    models. Raises when the proxy is unreachable or failing. The latency is
+    also recorded as a `connect` sample for adaptive timeouts.
+    """
+    client = get_http_client(pool_maxsize)
+    headers = {'Authorization': f"Bearer {api_key}"} if api_key else {}
+    target = get_cached_endpoint(url, proxy_path, '', 'models') or model_candidate_urls(url, proxy_path)[0]
+    start = time.monotonic()
+    try:
+        with client.request('GET', target, headers=headers, timeout=timeout or adaptive_timeout(url, kind='models')) as resp:
+            resp.read()
+    except ProxyHTTPError as e:
+        if e.status >= 500:
+            raise
+    latency = time.monotonic() - start
+    latency_stats.record(latency_key(url, ''), connect=latency)
+    return latency
+
+
+def run_health_probes(job, request):
+    """Probe every endpoint of a proxy pool concurrently and update `proxy_pool`. Worker thread only."""
+    urls = request.get('pool') or []
+
+    def probe(url):
+        try:
+            latency = probe_proxy(url, request.get('path') or '', request.get('key') or '',
+                                  request.get('timeout'), request.get('pool_maxsize'))
+        except Exception as e:
+            proxy_pool.record_probe(url, error=e)
+            return url, None
+        proxy_pool.record_probe(url, latency)
+        return url, latency
+
+    if not urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(urls), 8), thread_name_prefix='BlenderCopilotProbe') as executor:
+        return dict(executor.map(probe, urls))
+
+
+def fallback_model_list(context, addon_name):
+    """Return (models, source) to use when the proxy does not list any models."""
+    # check for a manual list in addon preferences or environment
     preferences = context.preferences
     key = resolve_addon_key(preferences, addon_name)
     manual = ''
@@ -206,12 +494,145 @@ def fetch_models_from_proxy(context, addon_name, timeout=10):
     return default_models, 'defaults'
 
 
+def fetch_models_from_proxy(context, addon_name, timeout=None):
+    """Query the proxy for available models and return (model ids, source).
+
+    Blocks until the proxy answers; prefer `request_model_refresh`, which
+    serves the cached catalogue and refreshes it in the background.
+    Does not require an API key; if the proxy requires one the addon prefs or env var will be used.
+    Returns an empty list if no proxy is configured.
+    """
+    request = build_models_request(context, addon_name, timeout)
+    if not request['url']:
+        return []
+
+    models = run_models_request(request)
+    if models:
+        return models, 'proxy'
+    return fallback_model_list(context, addon_name)
+
+
 def _default_model_items(self, context):
     return [
        ("gpt-5-mini", "GPT-5 Mini (smaller, cheaper)", "Use GPT-5 Mini"),
        ("grok-code", "Grok Code (specialized for code)", "Use Grok Code"),
        ("gpt-4o", "GPT-4o (optimized for chat)", "Use GPT-4o"),
     ]
+
+
+# Blender keeps only borrowed references to dynamic enum strings, so the
+# current items must stay alive at module level.
+_model_items = []
+
+
+def model_enum_items(self, context):
+    return _model_items or _default_model_items(self, context)
+
+
+def set_model_items(models):
+    """Replace the entries of the AI Model dropdown."""
+    global _model_items
+    _model_items = [(m, m, '') for m in models]
+
+
+def load_cached_model_items():
+    """Populate the dropdown from the most recently cached catalogue, if any."""
+    models = last_cached_models()
+    if models:
+        set_model_items(models)
+    return models
+
+
+def _run_models_job(job, request):
+    return run_models_request(request)
+
+
+async def _run_models_job_async(job, request, transport):
+    return await run_models_request_async(request, transport)
+
+
+def request_model_refresh(context, addon_name, force=False, on_done=None, timeout=None):
+    """Serve the cached model catalogue now and refresh it in the background when stale.
+
+    Stale-while-revalidate: a cached list is shown immediately even when it
+    is older than the TTL; a background job then asks the proxy and swaps in
+    the fresh list. `force` refreshes regardless of age. `on_done(job)` runs
+    on the main thread after the refresh job completes.
+
+    Returns (models, age_seconds, job) where job is None if no refresh was needed.
+    """
+    from .engine import get_engine
+
+    request = build_models_request(context, addon_name, timeout)
+    scene = context.scene
+    models, age = get_cached_models(request['cache_key'])
+    if models:
+        set_model_items(models)
+    if not request['url']:
+        return models, age, None
+
+    ttl = get_copilot_option(context, addon_name, 'copilot_model_cache_ttl', 3600)
+    if models and not force and (not ttl or age < ttl):
+        _set_model_status(scene, f"{len(models)} models (cached {_format_age(age)} ago)")
+        return models, age, None
+
+    # avoid piling up refreshes for the same proxy
+    for job in get_engine().active_jobs(kind='models'):
+        if job.cache_key == request['cache_key']:
+            return models, age, job
+
+    def apply(job):
+        _apply_models_job(job, addon_name, on_done)
+
+    job = submit_proxy_job(request, _run_models_job, _run_models_job_async, kind='models', scene_name=scene.name,
+                           on_complete=apply)
+    job.cache_key = request['cache_key']
+    _set_model_status(scene, "Refreshing models...")
+    return models, age, job
+
+
+def _apply_models_job(job, addon_name, on_done=None):
+    scene = bpy.data.scenes.get(job.scene_name) if job.scene_name else None
+    models = job.result or []
+    if models:
+        source = 'proxy'
+    elif _model_items:
+        # keep serving the stale catalogue rather than replacing it with guesses
+        models, source = [m[0] for m in _model_items], 'stale cache'
+    else:
+        models, source = fallback_model_list(bpy.context, addon_name)
+
+    set_model_items(models)
+    if scene is not None:
+        try:
+            if models and scene.copilot_model not in models:
+                scene.copilot_model = models[0]
+        except Exception:
+            pass
+        _set_model_status(scene, f"{len(models)} models ({source})")
+    if on_done is not None:
+        on_done(job)
+
+
+def _set_model_status(scene, text):
+    try:
+        scene.copilot_model_status = text
+    except Exception:
+        pass
+
+
+def _format_age(seconds):
+    if seconds is None:
+        return '?'
+    if seconds < 90:
+        return f"{seconds:.0f}s"
+    if seconds < 90 * 60:
+        return f"{seconds / 60:.0f}m"
+    if seconds < 36 * 3600:
+        return f"{seconds / 3600:.0f}h"
+    return f"{seconds / 86400:.0f}d"
+
+
 def init_props():
     # Clear any existing properties first
     clear_props()
@@ -258,6 +679,11 @@ def init_props():
         description="Last proxy mode used (sdk/direct-http/fetch-models)",
         default="",
     )
+    bpy.types.Scene.copilot_last_context = bpy.props.StringProperty(
+        name="Last Context",
+        description="How much of the chat history the last request sent",
+        default="",
+    )
 
     # set an initial default value from the _default_model_items first item
     try:
@@ -268,26 +694,48 @@ def init_props():
     bpy.types.Scene.copilot_model = bpy.props.EnumProperty(
         name="AI Model",
         description="Select the AI model to use",
-        items=_default_model_items,
+        items=model_enum_items,
         default=default_model_index,
     )
+    bpy.types.Scene.copilot_model_status = bpy.props.StringProperty(
+        name="Model Catalogue Status",
+        description="Where the model list came from and how old it is",
+        default="",
+    )
     bpy.types.Scene.copilot_chat_input = bpy.props.StringProperty(
         name="Message",
         description="Enter your message",
         default="",
     )
     bpy.types.Scene.copilot_button_pressed = bpy.props.BoolProperty(default=False)
+    bpy.types.Scene.copilot_suggestion_prompt = bpy.props.StringProperty(default="")
+    bpy.types.Scene.copilot_suggestion_code = bpy.props.StringProperty(default="")
+    bpy.types.Scene.copilot_suggestion_score = bpy.props.FloatProperty(default=0.0)
+    bpy.types.Scene.copilot_bypass_cache = bpy.props.BoolProperty(
+        name="Skip cache",
+        description="Send the next message to the model even if an identical request is cached",
+        default=False,
+    )
+    bpy.types.Scene.copilot_job_status = bpy.props.StringProperty(
+        name="Job Status",
+        description="State of the background Copilot requests for this scene",
+        default="",
+    )
 
     # Add properties to PropertyGroup for chat messages
     bpy.types.PropertyGroup.type = bpy.props.StringProperty()
     bpy.types.PropertyGroup.content = bpy.props.StringProperty()
+    # set on assistant messages whose code ran without an error
+    bpy.types.PropertyGroup.ok = bpy.props.BoolProperty(default=False)
+    # `code_fingerprint` of an assistant message, stored the first time it is sent summarised
+    bpy.types.PropertyGroup.fingerprint = bpy.props.StringProperty()
 
     print("BlenderCopilot: Properties initialized successfully")
 
 
 def clear_props():
     # Remove properties if they exist to support re-loading the addon
-    for prop in ("copilot_chat_history", "copilot_chat_input", "copilot_button_pressed", "copilot_model", "copilot_proxy_ip", "copilot_proxy_port", "copilot_proxy_api_key", "copilot_proxy_path"):
+    for prop in ("copilot_chat_history", "copilot_chat_input", "copilot_button_pressed", "copilot_bypass_cache", "copilot_suggestion_prompt", "copilot_suggestion_code", "copilot_suggestion_score", "copilot_job_status", "copilot_model", "copilot_model_status", "copilot_proxy_ip", "copilot_proxy_port", "copilot_proxy_api_key", "copilot_proxy_path"):
         try:
             if hasattr(bpy.types.Scene, prop):
                 delattr(bpy.types.Scene, prop)
@@ -310,279 +758,1101 @@ def split_area_to_text_editor(context):
     new_area.type = 'TEXT_EDITOR'
     return new_area
 
-def generate_blender_code(prompt, chat_history, context, system_prompt, addon_name):
-    """Build messages and call the LLM.
-
-    Behavior:
-    - Build a chat-style message list from history + prompt.
-    - If a proxy URL is configured and an API key is provided, use the OpenAI SDK
-      with api_base and api_key set.
-    - If a proxy URL is configured but no API key is provided, bypass the SDK
-      and try a set of common endpoints via direct HTTP POST (no Authorization
-      header). This helps with local OpenAI-compatible proxies that accept
-      unauthenticated requests under an /v1 path.
-
-    Returns: string (extracted code) or None on failure.
+def build_generation_request(prompt, chat_history, context, system_prompt, addon_name, bypass_cache=False,
+                             scene_blocks=None, request_blocks=None, scene_digest='', scene_tokens=None):
+    """Snapshot everything a generation needs from bpy into a plain dict.
+
+    Must be called on the main thread. The returned request can then be handed
+    to `run_generation_request` on a worker thread, which never touches bpy.
+    `bypass_cache` forces a round-trip to the proxy even if an identical
+    request was answered before. The chat history is packed newest-first
+    into the model's token budget; `request['context']` reports how much
+    of it was sent. With history compaction on, only the most recent script
+    is sent in full and earlier ones as `code_fingerprint` summaries. A
+    script is summarised once, when a newer one arrives, and the summary is
+    stored on its message, so it is sent as the same bytes from then on.
+
+    Messages are laid out for provider prompt caches: system prompt, then
+    the optional `scene_blocks` (strings, in a deterministic order), then
+    history, then the optional `request_blocks` chosen for this prompt,
+    then the prompt. `request['context']` also reports how much of that
+    prefix the previous request to the same proxy and model shared, and
+    whether it ended at the script summarised this turn.
+    `scene_digest` goes into the response cache key and `scene_tokens`,
+    the known size of `scene_blocks`, into the report.
     """
     # Build message list
-    messages = [{"role": "system", "content": system_prompt}]
-    for message in chat_history[-10:]:
+    compact = bool(get_copilot_option(context, addon_name, 'copilot_compact_history', True))
+    last_script = max((i for i, m in enumerate(chat_history) if getattr(m, 'type', '') == "assistant"), default=-1)
+    history = []
+    compacted = 0
+    # the script summarised for the first time; the shared prefix ends there
+    newly_compacted = None
+    for index, message in enumerate(chat_history):
         # property 'type' on message is expected to be 'assistant' or 'user'
         if getattr(message, 'type', '') == "assistant":
-            messages.append({"role": "assistant", "content": "```\n" + message.content + "\n```"})
+            if compact and index != last_script:
+                if not message.fingerprint:
+                    message.fingerprint = newly_compacted = code_fingerprint(message.content)
+                history.append({"role": "assistant", "content": message.fingerprint})
+                compacted += 1
+            else:
+                history.append({"role": "assistant", "content": "```\n" + message.content + "\n```"})
         else:
-            messages.append({"role": getattr(message, 'type', 'user').lower(), "content": message.content})
+            history.append({"role": getattr(message, 'type', 'user').lower(), "content": message.content})
+
+    proxy = get_copilot_proxy_settings(context, addon_name) or {}
+
+    # Prepare model selection
+    model_to_use = proxy.get('model') or getattr(context.scene, 'copilot_model', None) or getattr(context.scene, 'gpt4_model', None)
+    if isinstance(model_to_use, tuple) and len(model_to_use) > 0:
+        model_to_use = model_to_use[0]
+
+    budget = context_budget(model_to_use, get_copilot_option(context, addon_name, 'copilot_context_tokens', 8000))
+    head = layout_head(f"{system_prompt.strip()}\n\n{PROMPT_RULES}", scene_blocks)
+    messages, packing = pack_messages(head, history, {"role": "user", "content": prompt}, budget,
+                                      drop_step=HISTORY_DROP_STEP, tail=layout_tail(request_blocks))
+    packing['compacted'] = compacted
+    packing['scene_tokens'] = scene_tokens
+    shared = prefix_tracker.observe(latency_key(proxy.get('url'), model_to_use), messages)
+    packing['prefix_tokens'] = shared['tokens']
+    packing['prefix_bytes'] = shared['bytes']
+    if newly_compacted is not None and shared['messages'] < len(messages) and \
+            messages[shared['messages']]['content'] == newly_compacted:
+        packing['prefix_break'] = 'script summarised this turn'
+    print(f"BlenderCopilot: packed {len(messages)} messages, ~{packing['tokens']}/{budget} tokens "
+          f"({packing['dropped']} history messages left out); prefix shared with previous request: "
+          f"{shared['messages']} messages, {shared['bytes']} bytes, ~{shared['tokens']} tokens")
+
+    cache_mb = get_copilot_option(context, addon_name, 'copilot_response_cache_mb', 32)
+
+    return {
+        'prompt': prompt,
+        'messages': messages,
+        'model': model_to_use,
+        'context': packing,
+        'cache_key': response_cache_key(model_to_use, messages, scene_digest),
+        'use_cache': bool(cache_mb) and not bypass_cache,
+        'response_cache_bytes': int(cache_mb or 0) * 1024 * 1024,
+        'stream': bool(get_copilot_option(context, addon_name, 'copilot_stream', True)),
+        'stop_at_first_block': bool(get_copilot_option(context, addon_name, 'copilot_stop_at_first_block', True)),
+        'stop_sequences': bool(get_copilot_option(context, addon_name, 'copilot_stop_sequences', False)),
+        'pool_maxsize': get_copilot_option(context, addon_name, 'copilot_pool_maxsize', None),
+        'endpoint_ttl': get_copilot_option(context, addon_name, 'copilot_endpoint_cache_ttl', None),
+        'race_discovery': bool(get_copilot_option(context, addon_name, 'copilot_race_discovery', True)),
+        'async_transport': bool(get_copilot_option(context, addon_name, 'copilot_async_transport', False)),
+        'hedge': _hedge_settings(context, addon_name),
+        'retry': {
+            'total': get_copilot_option(context, addon_name, 'copilot_max_retries', 3),
+            'budget': get_copilot_option(context, addon_name, 'copilot_retry_budget', 30.0),
+        },
+        'proxy': {
+            # with a proxy pool, start at the fastest healthy endpoint
+            'url': proxy_pool.best(proxy['pool']) if proxy.get('pool') else (proxy.get('url') or ''),
+            'key': proxy.get('key') or '',
+            'path': proxy.get('path') or '',
+            'pool': list(proxy.get('pool') or []),
+        },
+    }
+
+
+def _hedge_settings(context, addon_name):
+    """Snapshot the hedging preferences, or None when hedging is off."""
+    if not get_copilot_option(context, addon_name, 'copilot_hedge', False):
+        return None
+    url = (get_copilot_option(context, addon_name, 'copilot_hedge_proxy_url', '') or '').strip()
+    if url and not url.startswith(('http://', 'https://')):
+        url = f"http://{url}"
+    return {
+        'model': (get_copilot_option(context, addon_name, 'copilot_hedge_model', '') or '').strip(),
+        'url': url,
+        'percentile': get_copilot_option(context, addon_name, 'copilot_hedge_percentile', 95),
+        'delay': get_copilot_option(context, addon_name, 'copilot_hedge_delay', 10.0),
+    }
 
-    messages.append({"role": "user", "content": wrap_prompt(prompt)})
 
-    # Attempt to import openai; if missing, report and return None
+def extract_code_block(text):
+    """Return the first fenced code block in `text`, or the whole text if there is none."""
+    blocks = re.findall(r'```(?:python\s*\n)?(.*?)```', text, re.DOTALL)
+    if blocks:
+        candidate = blocks[0]
+    else:
+        # a stop sequence may have swallowed the closing fence
+        unterminated = re.search(r'```(?:python\s*\n)?(.*)', text, re.DOTALL)
+        candidate = unterminated.group(1) if unterminated else text
+    candidate = re.sub(r'^python', '', candidate, flags=re.MULTILINE)
+    return candidate
+
+
+def _record_usage(status, usage):
+    """Keep the prompt token usage reported by the provider, including prompt-cache hits."""
+    if status is None or not isinstance(usage, dict):
+        return
+    details = usage.get('prompt_tokens_details')
+    cached = details.get('cached_tokens') if isinstance(details, dict) else None
+    if cached is None:
+        cached = usage.get('cache_read_input_tokens')
+    status['usage'] = {'prompt_tokens': usage.get('prompt_tokens'), 'cached_tokens': cached}
+
+
+def _extract_completion_text(resp):
+    """Pull the assistant text out of common OpenAI-style response shapes."""
     try:
-        import openai
+        choices = resp.get('choices') if isinstance(resp, dict) else None
+        if choices and isinstance(choices, list) and len(choices) > 0:
+            first = choices[0]
+            # chat models usually nest content under message.content
+            if isinstance(first, dict):
+                msg = first.get('message') or first.get('delta') or {}
+                if isinstance(msg, dict) and 'content' in msg:
+                    return msg.get('content')
+                return first.get('text') or ''
+            return ''
+        # Fallback: string-like resp
+        return str(resp)
     except Exception:
-        print("BlenderCopilot: 'openai' package not found in Blender's Python. Install it into Blender's Python environment to enable AI features.")
+        return ''
+
+
+def _record_status(status, mode=None, url=None, error=None):
+    """Record proxy debug info for later display; see `apply_proxy_status`."""
+    if status is None:
+        return
+    if mode is not None:
+        status['mode'] = mode
+    if url is not None:
+        status['url'] = url
+    if error is not None:
+        status['error'] = error
+
+
+def _record_retries(status, retry):
+    """Add the retry count and time spent waiting of a `RetryState` to `status`."""
+    if status is None or retry is None or not retry.retries:
+        return
+    status['retries'] = status.get('retries', 0) + retry.retries
+    status['retry_wait'] = status.get('retry_wait', 0.0) + retry.waited
+
+
+def _sdk_error_cause(openai, error):
+    """Retry cause for an openai SDK error without an HTTP status: 'connect', 'read' or None."""
+    errors = getattr(openai, 'error', None)
+    if errors is None:
         return None
+    if isinstance(error, getattr(errors, 'APIConnectionError', ())):
+        return 'connect'
+    if isinstance(error, getattr(errors, 'Timeout', ())):
+        return 'read'
+    return None
 
-    proxy = get_copilot_proxy_settings(context, addon_name) or {}
 
-    # Debug: show resolved proxy settings
+def apply_proxy_status(scene, status):
+    """Copy debug info recorded by a request onto the scene. Main thread only."""
+    if not status:
+        return
     try:
-        print(f"BlenderCopilot: resolved proxy -> url={proxy.get('url')!r} key_set={bool(proxy.get('key'))} model_hint={proxy.get('model')!r}")
+        if 'mode' in status:
+            mode = status['mode']
+            if status.get('retries'):
+                mode = f"{mode} ({status['retries']} retries, waited {status.get('retry_wait', 0.0):.1f}s)"
+            scene.copilot_last_proxy_mode = mode
+        if 'url' in status:
+            scene.copilot_last_proxy_url = status['url']
+        if 'error' in status:
+            scene.copilot_last_proxy_error = status['error']
+        usage = status.get('usage') or {}
+        if usage.get('cached_tokens') is not None:
+            # compare with the shared prefix estimated when the request was built
+            print(f"BlenderCopilot: provider cached {usage['cached_tokens']} of {usage.get('prompt_tokens')} prompt tokens")
+            scene.copilot_last_context = (f"{scene.copilot_last_context}, provider cached "
+                                          f"{usage['cached_tokens']} of {usage.get('prompt_tokens')}")
     except Exception:
         pass
 
-    # Save old settings so we can restore them
-    old_api_base = getattr(openai, 'api_base', None)
-    old_api_key = getattr(openai, 'api_key', None)
 
+# Sent when the 'stop sequences' preference is on. A bare fence cannot be used
+# because it would also match the opening fence; an untagged closing fence on
+# its own line is the closest safe marker.
+STOP_SEQUENCES = ["\n```\n"]
+
+
+_generation_flights = SingleFlight()
+
+
+def run_generation_request(request, status=None, on_text=None):
+    """Answer a request built by `build_generation_request`, from the response cache if possible.
+
+    Identical requests (same model, messages and scene digest) are served
+    from the on-disk response cache without contacting the proxy unless the
+    request was built with `bypass_cache`. Fresh answers are stored for next
+    time. Identical requests issued while one is already in flight wait for
+    that call instead of starting their own, and see its streamed text too.
+    Safe to call from a worker thread.
+
+    Returns: string (extracted code) or None on failure.
+    """
+    cache_key = request.get('cache_key')
+    if 'response_cache_bytes' in request:
+        response_cache.max_bytes = request['response_cache_bytes']
+    if cache_key and request.get('use_cache'):
+        cached = response_cache.get(cache_key)
+        if cached:
+            print(f"BlenderCopilot: response cache hit {cache_key[:12]}")
+            _record_status(status, mode='cache', error='')
+            if status is not None:
+                status['cache_hit'] = True
+            return cached
+
+    if not cache_key:
+        return _request_completion(request, status, on_text)
+
+    def call(publish):
+        flight_status = {}
+        code = _request_completion(request, flight_status, publish)
+        if code and request.get('response_cache_bytes'):
+            response_cache.put(cache_key, code, model=request.get('model') or '', prompt=request.get('prompt') or '')
+        return code, flight_status
+
+    # identical requests already in flight share that upstream call
+    (code, flight_status), shared = _generation_flights.do(cache_key, call, on_progress=on_text)
+    if status is not None:
+        status.update(flight_status)
+        if shared:
+            print(f"BlenderCopilot: joined in-flight request {cache_key[:12]}")
+            status['coalesced'] = True
+    return code
+
+
+def _request_completion(request, status=None, on_text=None):
+    """Call the LLM for a request built by `build_generation_request`.
+
+    Thin wrapper that builds a `ProxyClient` for this request and asks it for
+    a completion; see `ProxyClient.complete`. When `request['stream']` is set,
+    `on_text(text_so_far)` is called as tokens arrive. Safe to call from a
+    worker thread. Debug info (mode, url, error) is written into the optional
+    `status` dict instead of scene properties.
+
+    Returns: string (extracted code) or None on failure.
+    """
+    extra = {}
+    if request.get('stop_sequences'):
+        extra['stop'] = STOP_SEQUENCES
+    stream = bool(request.get('stream'))
+    stop_at_first_block = stream and bool(request.get('stop_at_first_block'))
+    client = ProxyClient.from_request(request)
+
+    # Debug: show resolved proxy settings
+    print(f"BlenderCopilot: resolved proxy -> url={client.base_url!r} key_set={bool(client.key)} model_hint={client.model!r}")
+
+    def attempt(client):
+        if request.get('hedge'):
+            return _hedged_completion(client, request, status, on_text, stop_at_first_block, extra)
+        return client.complete(request['messages'], status, stream=stream, on_text=on_text,
+                               stop_at_first_block=stop_at_first_block, extra=extra)
+
+    pool = (request.get('proxy') or {}).get('pool')
+    if not pool:
+        return attempt(client)
+
+    # proxy pool: fastest healthy endpoint first, fail over to the next one
+    last_err = None
+    for url in proxy_pool.ordered(pool):
+        client = ProxyClient.from_request(request)
+        client.base_url = url
+        try:
+            code = attempt(client)
+        except Exception as e:
+            last_err = e
+            code = None
+        if code:
+            proxy_pool.record_success(url, client.pool_latency)
+            return code
+        if client.first_byte_at is None:
+            # never answered: count against the endpoint's health
+            proxy_pool.record_failure(url, last_err or (status or {}).get('error', ''))
+        else:
+            # the proxy answered but produced no code; another one will not do better
+            break
+    if last_err is not None:
+        raise last_err
+    return None
+
+
+# Never hedge sooner than this, however fast the proxy has been recently
+HEDGE_MIN_DELAY = 1.0
+# Samples needed before the latency percentile is trusted over the fixed delay
+HEDGE_MIN_SAMPLES = 5
+
+
+def hedge_delay(client, hedge):
+    """Seconds to wait for the first byte before hedging, from recent latency of `client`'s proxy and model."""
+    metric = 'ttfb' if client.stream else 'body'
+    delay = latency_stats.percentile(client.latency_key, metric, hedge.get('percentile', 95), HEDGE_MIN_SAMPLES)
+    if delay is None:
+        delay = hedge.get('delay') or 10.0
+    return max(delay, HEDGE_MIN_DELAY)
+
+
+def _hedged_completion(primary, request, status=None, on_text=None, stop_at_first_block=False, extra=None):
+    """Run `primary`, and if it has not answered within `hedge_delay`, race an alternate request.
+
+    The alternate targets `request['hedge']['model']` and/or
+    `request['hedge']['url']` (each defaults to the primary's). Whichever
+    request completes first with usable code wins and the other is cancelled.
+    Streamed text is shown from whichever request produced text first.
+    """
+    hedge = request['hedge']
+    alternate = ProxyClient.from_request(request)
+    alternate.model = hedge.get('model') or primary.model
+    alternate.base_url = (hedge.get('url') or primary.base_url).rstrip('/')
+    delay = hedge_delay(primary, hedge)
+
+    stream = bool(request.get('stream'))
+    statuses = {'primary': {}, 'alternate': {}}
+    shown = []
+    shown_lock = threading.Lock()
+
+    def attempt(name, client):
+        def relay(text):
+            with shown_lock:
+                if not shown:
+                    shown.append(name)
+            if shown[0] == name and on_text is not None:
+                on_text(text)
+        return client.complete(request['messages'], statuses[name], stream=stream, on_text=relay,
+                               stop_at_first_block=stop_at_first_block, extra=extra)
+
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='BlenderCopilotHedge')
+    clients = {'primary': primary}
+    futures = {executor.submit(attempt, 'primary', primary): 'primary'}
+    winner, code, last_err = None, None, None
     try:
-        # Prepare model selection
-        model_to_use = proxy.get('model') or getattr(context.scene, 'copilot_model', None) or getattr(context.scene, 'gpt4_model', None)
-        if isinstance(model_to_use, tuple) and len(model_to_use) > 0:
-            model_to_use = model_to_use[0]
-
-        # If a proxy URL is configured, set api_base for SDK calls
-        proxy_url = proxy.get('url')
-        proxy_key = proxy.get('key')
-        if proxy_url:
-            openai.api_base = proxy_url
-
-        # If we have a proxy key, prefer SDK usage
-        if proxy_key:
-            # record SDK usage in scene properties for debugging
+        if not primary.responded.wait(delay):
+            print(f"BlenderCopilot: no answer from {primary.model} after {delay:.1f}s; "
+                  f"hedging with {alternate.model} at {alternate.base_url}")
+            clients['alternate'] = alternate
+            futures[executor.submit(attempt, 'alternate', alternate)] = 'alternate'
+        for future in as_completed(futures):
             try:
-                scene = context.scene
-                scene.copilot_last_proxy_mode = 'sdk'
-                scene.copilot_last_proxy_url = proxy_url or ''
-                scene.copilot_last_proxy_error = ''
-            except Exception:
-                pass
-            openai.api_key = proxy_key
+                result = future.result()
+            except Exception as e:
+                last_err = e
+                continue
+            if result:
+                winner, code = futures[future], result
+                break
+    finally:
+        for name, client in clients.items():
+            if name != winner:
+                client.cancel()
+        executor.shutdown(wait=False)
+
+    if status is not None:
+        status.update(statuses[winner or 'primary'])
+        if len(clients) > 1:
+            status['hedged'] = True
+            status['hedge_winner'] = winner or ''
+            status['mode'] = f"{status.get('mode') or 'hedged'} (hedged, {winner or 'no'} answer won)"
+    if winner is None and last_err is not None:
+        raise last_err
+    return code
+
+
+def _parse_completion_body(body, status=None):
+    """Extract the assistant text from a complete (non-streamed) proxy response body.
+
+    Token usage in the body is recorded into `status`; see `_record_usage`.
+    """
+    import json as _json
+    try:
+        data = _json.loads(body)
+    except Exception:
+        data = None
+    if isinstance(data, dict):
+        _record_usage(status, data.get('usage'))
+
+    # Extract text from common shapes
+    text = None
+    if isinstance(data, dict):
+        choices = data.get('choices') or data.get('result') or data.get('outputs')
+        if isinstance(choices, list) and len(choices) > 0:
+            first = choices[0]
+            if isinstance(first, dict):
+                msg = first.get('message') or first.get('delta') or first.get('output') or {}
+                if isinstance(msg, dict) and 'content' in msg:
+                    text = msg.get('content')
+                elif 'text' in first:
+                    text = first.get('text')
+        if text is None:
+            for key in ('output', 'result', 'text'):
+                if key in data and isinstance(data[key], str):
+                    text = data[key]
+
+    if text is None:
+        text = body
+    return text
+
+
+class _TextCollector:
+    """Accumulate streamed tokens, reporting the running text after each one.
+
+    With `stop_at_first_block`, `add` returns True as soon as the first
+    fenced code block has closed; `text` is then cut after that block and
+    the caller is expected to close the stream. `add` also returns True once
+    the optional `cancel` event is set.
+    """
+
+    def __init__(self, on_text=None, stop_at_first_block=False, status=None, cancel=None):
+        self.text = ''
+        self._on_text = on_text
+        self._status = status
+        self._cancel = cancel
+        self._detector = CodeFenceDetector() if stop_at_first_block else None
+
+    def add(self, token):
+        if self._cancel is not None and self._cancel.is_set():
+            return True
+        if not token:
+            return False
+        self.text += token
+        if self._on_text is not None:
+            self._on_text(self.text)
+        if self._detector is not None and self._detector.feed(token):
+            print(f"BlenderCopilot: first code block complete after {len(self.text)} chars; closing stream")
+            if self._status is not None:
+                self._status['early_cutoff'] = True
+            self.text = self._detector.text
+            return True
+        return False
+
+
+def _read_tokens(tokens, on_text=None, stop_at_first_block=False, status=None, cancel=None):
+    """Collect an iterable of streamed tokens; see `_TextCollector`."""
+    collector = _TextCollector(on_text, stop_at_first_block, status, cancel)
+    for token in tokens:
+        if collector.add(token):
+            break
+    return collector.text
+
+
+class ProxyClient:
+    """Connection settings for one request, plus the calls that use them.
+
+    Carries the proxy base URL, key, path prefix, model, timeouts and which
+    connection pool to use, so nothing request-specific lives in module
+    globals. Unless a fixed `timeout` is given, connect and read timeouts
+    are derived from the latency learned for this proxy and model.
+    SDK calls pass `api_base`/`api_key` per call instead of setting them on
+    the openai module, which lets any number of requests run in parallel.
+
+    - With a proxy URL and an API key, the OpenAI SDK is used.
+    - With a proxy URL but no key, the SDK is bypassed and a set of common
+      endpoints is tried via direct HTTP POST (no Authorization header). This
+      helps with local OpenAI-compatible proxies that accept unauthenticated
+      requests under an /v1 path.
+    - Without a proxy URL, the SDK's own defaults (e.g. OPENAI_API_KEY) apply.
+
+    Each `complete` call records its time to first token (or, when the
+    answer was not streamed, to the whole body) and total time in
+    `metrics.latency_stats`. `responded` is set once the first byte arrived
+    (or the call ended), and `cancel()` makes a streaming call stop early.
+    Transient failures are retried according to `retry_policy`; the budget
+    and retry count cover the whole call, across all candidate endpoints.
+    """
+
+    def __init__(self, base_url='', key='', path='', model=None, timeout=None, pool_maxsize=None,
+                 endpoint_ttl=None, race_discovery=False, retry_policy=None):
+        self.base_url = (base_url or '').rstrip('/')
+        self.key = key or ''
+        self.path = normalize_proxy_path(path)
+        self.model = model
+        self.timeout = timeout
+        self.endpoint_ttl = endpoint_ttl
+        self.race_discovery = race_discovery
+        self.pool_maxsize = pool_maxsize
+        self.retry_policy = retry_policy or RetryPolicy()
+        # RetryState of the running `complete` call
+        self.retry = None
+        self.responded = threading.Event()
+        self._cancel = threading.Event()
+        self.started_at = None
+        self.first_byte_at = None
+        # whether the running call asked for a stream, and whether it got one
+        self.stream = False
+        self.streamed = False
+        # seconds until the response headers of the last request that got through
+        self.header_latency = None
+
+    @property
+    def timeouts(self):
+        """(connect, read) timeout in seconds; see `metrics.adaptive_timeout`."""
+        return self.timeout or adaptive_timeout(self.base_url, self.model,
+                                                kind='chat' if self.stream else 'completion')
+
+    @property
+    def http(self):
+        """The shared keep-alive pool, sized for this request."""
+        return get_http_client(self.pool_maxsize)
+
+    @classmethod
+    def from_request(cls, request):
+        proxy = request.get('proxy') or {}
+        return cls(
+            base_url=proxy.get('url'),
+            key=proxy.get('key'),
+            path=proxy.get('path'),
+            model=request.get('model'),
+            pool_maxsize=request.get('pool_maxsize'),
+            endpoint_ttl=request.get('endpoint_ttl'),
+            race_discovery=bool(request.get('race_discovery')),
+            retry_policy=RetryPolicy.from_settings(request.get('retry')),
+        )
+
+    @property
+    def latency_key(self):
+        return latency_key(self.base_url, self.model)
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _mark_first_byte(self):
+        if self.first_byte_at is None:
+            self.first_byte_at = time.monotonic()
+            self.responded.set()
+
+    def _relay(self, on_text):
+        def forward(text):
+            # only streamed tokens are relayed; whole bodies are not
+            self.streamed = True
+            self._mark_first_byte()
+            if on_text is not None:
+                on_text(text)
+        return forward
+
+    def complete(self, messages, status=None, stream=False, on_text=None, stop_at_first_block=False, extra=None):
+        """Ask the model for a completion and return the extracted code, or None on failure.
+
+        With `stop_at_first_block` a streamed response is closed as soon as
+        the first fenced code block is complete, since only that block is used.
+        """
+        self._start(stream)
+        self.retry = self.retry_policy.start(self._cancel)
+        on_text = self._relay(on_text)
+        code = None
+        try:
+            if self.base_url and not self.key:
+                code = self._complete_http(messages, status, stream, on_text, stop_at_first_block, extra)
+            else:
+                code = self._complete_sdk(messages, status, stream, on_text, stop_at_first_block, extra)
+            return code
+        finally:
+            self.responded.set()
+            self._record_latency(code is not None)
+            _record_retries(status, self.retry)
+
+    def _start(self, stream):
+        self.started_at = time.monotonic()
+        self.first_byte_at = None
+        self.stream = stream
+        self.streamed = False
+        self.header_latency = None
+
+    @property
+    def pool_latency(self):
+        """Latency for `proxy_pool` after a successful call, comparable to a probe round trip; None if unknown.
+
+        Only a stream's headers arrive before the generation; a whole body
+        would rank the proxy by the model's answer time.
+        """
+        return self.header_latency if self.streamed else None
+
+    def _record_latency(self, succeeded):
+        elapsed = time.monotonic() - self.started_at
+        if self.first_byte_at is not None:
+            waited = self.first_byte_at - self.started_at
+        elif self.cancelled:
+            # abandoned before answering: the real wait is at least this long
+            waited = elapsed
+        else:
+            waited = None
+        # a whole body is not a first token: keep it out of the ttfb histogram
+        streamed = self.streamed or (self.stream and self.first_byte_at is None)
+        latency_stats.record(self.latency_key, ttfb=waited if streamed else None,
+                             body=None if streamed else waited, total=elapsed if succeeded else None)
+
+    def _complete_sdk(self, messages, status=None, stream=False, on_text=None, stop_at_first_block=False,
+                      extra=None):
+        # Attempt to import openai; if missing, report and return None
+        try:
+            import openai
+        except Exception:
+            print("BlenderCopilot: 'openai' package not found in Blender's Python. Install it into Blender's Python environment to enable AI features.")
+            return None
+
+        options = dict(extra or {}, request_timeout=self.timeouts)
+        if self.base_url:
+            options['api_base'] = self.base_url
+        if self.key:
+            options['api_key'] = self.key
+            # record SDK usage for debugging
+            _record_status(status, mode='sdk-stream' if stream else 'sdk', url=self.base_url, error='')
+        # the SDK has its own HTTP stack, so consult the proxy's breaker and
+        # apply the retry policy here
+        breaker = breaker_for(self.base_url) if self.base_url else None
+        while True:
+            if breaker is not None:
+                try:
+                    breaker.allow()
+                except CircuitOpenError as ce:
+                    _record_status(status, error=str(ce))
+                    raise
             try:
-                resp = openai.ChatCompletion.create(model=model_to_use, messages=messages, max_tokens=1500)
-            except Exception:
-                # let upper finally restore settings and return None
+                resp = openai.ChatCompletion.create(model=self.model, messages=messages,
+                                                    max_tokens=MAX_COMPLETION_TOKENS, stream=stream, **options)
+                break
+            except Exception as e:
+                # API errors carry an HTTP status; anything else means the proxy was unreachable
+                http_status = getattr(e, 'http_status', None)
+                if breaker is not None:
+                    if http_status is None or http_status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                retry_after = parse_retry_after((getattr(e, 'headers', None) or {}).get('Retry-After'))
+                delay = self.retry.next_delay(http_status or _sdk_error_cause(openai, e), e, retry_after)
+                if delay is not None and self.retry.sleep(delay):
+                    continue
+                if not self.key:
+                    # no proxy configured -> default SDK behavior, which needs a key of its own
+                    print(f"BlenderCopilot: OpenAI SDK request failed: {e}")
+                    return None
                 raise
+        if breaker is not None:
+            breaker.record_success()
+
+        if stream:
+            tokens = (delta_text(chunk) for chunk in resp)
+            text = _read_tokens(tokens, on_text, stop_at_first_block, status, self._cancel)
+            if hasattr(resp, 'close'):
+                # stop the SDK from reading the rest of a cut-off stream
+                resp.close()
+        else:
+            self._mark_first_byte()
+            text = _extract_completion_text(resp)
+            if isinstance(resp, dict):
+                _record_usage(status, resp.get('usage'))
+        if not text:
+            return None
+        return extract_code_block(text)
+
+    def _open_chat(self, url, payload, headers, retry=None):
+        """POST one chat request to `url` and return the response with its body still unread.
+
+        `retry` is the request's `RetryState`; racing attempts run on other
+        threads and pass None, as a state can not be shared between them.
+        """
+        print(f"BlenderCopilot: trying proxy endpoint: {url}")
+        start = time.monotonic()
+        resp = self.http.request('POST', url, headers=headers, json_body=payload, timeout=self.timeouts, stream=True,
+                                 retry=retry)
+        self.header_latency = time.monotonic() - start
+        return resp
+
+    def _probe_chat(self, url, headers):
+        """Send `chat_probe_payload` to `url`; True if it answered with a success status."""
+        with self._open_chat(url, chat_probe_payload(self.model), headers) as resp:
+            resp.read()
+        return True
+
+    def _consume_chat(self, resp, status=None, stream=False, on_text=None, stop_at_first_block=False):
+        """Read a chat response opened by `_open_chat` and return the extracted code (None if empty)."""
+        _record_status(status, mode='direct-http-stream' if stream else 'direct-http', url=resp.url, error='')
+        with resp:
+            content_type = resp.headers.get('Content-Type', '') or ''
+            if stream and 'event-stream' in content_type:
+                # leaving the `with` block before the stream ends closes the
+                # connection and tells the proxy to stop generating
+                text = _read_tokens(iter_completion_tokens(resp.iter_lines()), on_text, stop_at_first_block, status,
+                                    self._cancel)
+            else:
+                # proxy ignored stream=true (or streaming is off): read the whole body
+                text = _parse_completion_body(resp.text(), status)
+                self._mark_first_byte()
 
-            # Extract text from common SDK response shapes
+        candidate = extract_code_block(text)
+        if candidate and len(candidate.strip()) > 0:
+            return candidate
+        return None
+
+    def _complete_http(self, messages, status=None, stream=False, on_text=None, stop_at_first_block=False,
+                       extra=None):
+        model_to_use = self.model
+        payload = {'model': model_to_use, 'messages': messages, 'max_tokens': MAX_COMPLETION_TOKENS}
+        if stream:
+            payload['stream'] = True
+        payload.update(extra or {})
+        headers = {'Content-Type': 'application/json'}
+
+        base_url = self.base_url
+        proxy_path = self.path
+        candidate_urls = chat_candidate_urls(base_url, proxy_path, model_to_use)
+        cached_url = get_cached_endpoint(base_url, proxy_path, model_to_use, 'chat', self.endpoint_ttl)
+        if cached_url:
+            # steady state: go straight to the endpoint that worked last time
+            candidate_urls = [cached_url] + [u for u in candidate_urls if u != cached_url]
+
+        last_err = None
+        # for the failure report: endpoints sent a request, and ones the open breaker refused
+        tried = []
+        skipped = []
+        if not cached_url and self.race_discovery and len(candidate_urls) > 1:
+            # discovery: race a one-token probe against every candidate and send
+            # the real generation to the first endpoint that answers
+            url, _found, errors = race(candidate_urls, lambda u: self._probe_chat(u, headers))
+            for failed_url, err in errors.items():
+                print(f"BlenderCopilot: endpoint {failed_url} failed during discovery: {err}")
+            for raced_url in candidate_urls:
+                (skipped if isinstance(errors.get(raced_url), CircuitOpenError) else tried).append(raced_url)
+            if url is not None:
+                remember_endpoint(base_url, proxy_path, model_to_use, 'chat', url)
+                cached_url = url
+                candidate_urls = [url]
+            else:
+                # only fall through to sequential probing for endpoints that did not
+                # fail outright; rate-limited ones get another, paced attempt there
+                candidate_urls = [u for u in candidate_urls
+                                  if getattr(errors.get(u), 'status', None) in RETRY_STATUSES]
+                if errors:
+                    last_err = errors[list(errors)[-1]]
+                    _record_status(status, mode='direct-http', url=base_url, error=str(last_err))
+
+        for position, url in enumerate(candidate_urls):
+            if self.cancelled:
+                break
+            first_try = url not in tried
+            if first_try:
+                tried.append(url)
             try:
-                choices = resp.get('choices') if isinstance(resp, dict) else None
-                if choices and isinstance(choices, list) and len(choices) > 0:
-                    first = choices[0]
-                    # chat models usually nest content under message.content
-                    if isinstance(first, dict):
-                        msg = first.get('message') or first.get('delta') or {}
-                        if isinstance(msg, dict) and 'content' in msg:
-                            text = msg.get('content')
-                        else:
-                            text = first.get('text') or ''
-                    else:
-                        text = ''
-                else:
-                    # Fallback: string-like resp
-                    text = str(resp)
-            except Exception:
-                text = ''
+                candidate = self._consume_chat(self._open_chat(url, payload, headers, retry=self.retry), status,
+                                               stream, on_text, stop_at_first_block)
+                if candidate:
+                    remember_endpoint(base_url, proxy_path, model_to_use, 'chat', url)
+                    return candidate
+
+            except CircuitOpenError as ce:
+                # every remaining candidate lives on the same proxy: give up right away
+                if first_try:
+                    # refused before anything was sent
+                    tried.remove(url)
+                skipped.extend(u for u in candidate_urls[position:] if u not in skipped)
+                last_err = ce
+                print(f"BlenderCopilot: {ce}")
+                _record_status(status, mode='direct-http', url=url, error=str(ce))
+                break
+            except ProxyHTTPError as he:
+                last_err = he
+                body = he.body or str(he)
+                print(f"BlenderCopilot: endpoint {url} returned HTTPError: {he}; body: {body}")
+                _record_status(status, mode='direct-http', url=url, error=body)
+                if he.status in RETRY_STATUSES:
+                    # still rate limited or overloaded after retrying: the other
+                    # paths lead to the same proxy and would only add load
+                    break
+            except Exception as e:
+                last_err = e
+                print(f"BlenderCopilot: endpoint {url} failed: {e}")
+                _record_status(status, mode='direct-http', url=url, error=str(e))
+                if self.http.error_cause(e) == 'connect':
+                    # unreachable, whichever path is asked
+                    break
+
+            if url == cached_url:
+                # the remembered endpoint stopped working; fall back to probing
+                forget_endpoint(base_url, proxy_path, model_to_use, 'chat')
+
+        # If all attempts failed, surface last error for debugging
+        if last_err:
+            print(f"BlenderCopilot: proxy direct-HTTP attempts failed; last error: {last_err}")
+            _record_status(status, mode='direct-http', url=base_url, error=str(last_err))
+            print(f"BlenderCopilot: attempted endpoints: {tried or 'none'}")
+            if skipped:
+                print(f"BlenderCopilot: circuit open for {endpoint_of(base_url)} "
+                      f"({describe_breaker(base_url)}); skipped endpoints: {skipped}")
+        return None
 
-            if not text:
-                return None
 
-            # Extract code block
-            blocks = re.findall(r'```(?:python\s*\n)?(.*?)```', text, re.DOTALL)
-            candidate = blocks[0] if blocks else text
-            candidate = re.sub(r'^python', '', candidate, flags=re.MULTILINE)
-            return candidate
+# In-flight generations on the async transport, by cache key. Only touched
+# from the transport's loop thread, so no lock is needed.
+_async_flights = {}
 
-        # If we reach here and a proxy URL exists but no key was provided,
-        # try direct HTTP POSTs to several common endpoint paths without
-        # sending any Authorization header.
-        if proxy_url and not proxy_key:
-            import json as _json
-            from urllib import request as _request, error as _error
-
-            candidate_paths = [
-                '/v1/chat/completions',
-                '/chat/completions',
-                '/v1/completions',
-                '/completions',
-                f'/{model_to_use}/chat/completions' if model_to_use else None,
-                f'/{model_to_use}/completions' if model_to_use else None,
-            ]
-
-            # Filter out None entries
-            candidate_paths = [p for p in candidate_paths if p]
-
-            payload = {'model': model_to_use, 'messages': messages, 'max_tokens': 1500}
-            headers = {'User-Agent': 'BlenderCopilot/1.0', 'Content-Type': 'application/json'}
-
-            base_url = proxy_url.rstrip('/')
-            last_err = None
-            for path in candidate_paths:
-                # avoid duplicating version segments (e.g., base_url endswith '/v1' and path startswith '/v1')
-                if base_url.endswith('/v1') and path.startswith('/v1'):
-                    url = base_url + path[len('/v1'):]
-                else:
-                    url = base_url + path
 
-                try:
-                    print(f"BlenderCopilot: trying proxy endpoint: {url}")
-                    # update scene status before attempt
-                    try:
-                        scene = context.scene
-                        scene.copilot_last_proxy_url = url
-                        scene.copilot_last_proxy_mode = 'direct-http'
-                        scene.copilot_last_proxy_error = ''
-                    except Exception:
-                        pass
-                    req = _request.Request(url, data=_json.dumps(payload).encode('utf-8'), headers=headers, method='POST')
-                    with _request.urlopen(req, timeout=30) as resp:
-                        body = resp.read().decode('utf-8')
-                        try:
-                            data = _json.loads(body)
-                        except Exception:
-                            data = None
-
-                        # Extract text from common shapes
-                        text = None
-                        if isinstance(data, dict):
-                            choices = data.get('choices') or data.get('result') or data.get('outputs')
-                            if isinstance(choices, list) and len(choices) > 0:
-                                first = choices[0]
-                                if isinstance(first, dict):
-                                    msg = first.get('message') or first.get('delta') or first.get('output') or {}
-                                    if isinstance(msg, dict) and 'content' in msg:
-                                        text = msg.get('content')
-                                    elif 'text' in first:
-                                        text = first.get('text')
-                            if text is None:
-                                for key in ('output', 'result', 'text'):
-                                    if key in data and isinstance(data[key], str):
-                                        text = data[key]
-
-                        if text is None:
-                            text = body
-
-                        blocks = re.findall(r'```(?:python\s*\n)?(.*?)```', text, re.DOTALL)
-                        candidate = blocks[0] if blocks else text
-                        candidate = re.sub(r'^python', '', candidate, flags=re.MULTILINE)
-
-                        if candidate and ('import bpy' in candidate or 'bpy.' in candidate or 'def ' in candidate):
-                            return candidate
-                        if candidate and len(candidate.strip()) > 0:
-                            return candidate
-
-                except _error.HTTPError as he:
-                    last_err = he
-                    try:
-                        body = he.read().decode('utf-8')
-                    except Exception:
-                        body = str(he)
-                    print(f"BlenderCopilot: endpoint {url} returned HTTPError: {he}; body: {body}")
-                    try:
-                        scene = context.scene
-                        scene.copilot_last_proxy_error = body or str(he)
-                        scene.copilot_last_proxy_url = url
-                        scene.copilot_last_proxy_mode = 'direct-http'
-                    except Exception:
-                        pass
-                    continue
-                except Exception as e:
-                    last_err = e
-                    print(f"BlenderCopilot: endpoint {url} failed: {e}")
-                    try:
-                        scene = context.scene
-                        scene.copilot_last_proxy_error = str(e)
-                        scene.copilot_last_proxy_url = url
-                        scene.copilot_last_proxy_mode = 'direct-http'
-                    except Exception:
-                        pass
-                    continue
+async def run_generation_request_async(request, transport, status=None, on_text=None, cancel=None):
+    """Async counterpart of `run_generation_request` for the aiohttp transport.
 
-            # If all attempts failed, raise or return None
-            if last_err:
-                # surface last error for debugging and set scene props
-                print(f"BlenderCopilot: proxy direct-HTTP attempts failed; last error: {last_err}")
-                try:
-                    scene = context.scene
-                    scene.copilot_last_proxy_error = str(last_err)
-                    scene.copilot_last_proxy_mode = 'direct-http'
-                    scene.copilot_last_proxy_url = base_url
-                except Exception:
-                    pass
+    Runs on the loop thread of `transport`. Uses the same response cache and
+    endpoint cache, and coalesces identical in-flight requests the same way.
+    The proxy is always spoken to over plain HTTP, with a bearer token when
+    a key is configured, rather than through the blocking openai SDK.
+    A stream stops at the next chunk once the optional `cancel` event is set
+    (for a coalesced request, that of the job that started it).
+    """
+    cache_key = request.get('cache_key')
+    if 'response_cache_bytes' in request:
+        response_cache.max_bytes = request['response_cache_bytes']
+    if cache_key and request.get('use_cache'):
+        cached = response_cache.get(cache_key)
+        if cached:
+            print(f"BlenderCopilot: response cache hit {cache_key[:12]}")
+            _record_status(status, mode='cache', error='')
+            if status is not None:
+                status['cache_hit'] = True
+            return cached
+
+    if not cache_key:
+        return await _request_completion_async(request, transport, status, on_text, cancel)
+
+    flight = _async_flights.get(cache_key)
+    shared = flight is not None
+    if not shared:
+        listeners = []
+
+        def publish(text):
+            for listener in listeners:
                 try:
-                    print(f"BlenderCopilot: attempted endpoints: {candidate_paths}")
+                    listener(text)
                 except Exception:
                     pass
-            return None
 
-        # Otherwise, no proxy configured -> use default SDK behavior (requires api key)
+        async def call():
+            flight_status = {}
+            code = await _request_completion_async(request, transport, flight_status, publish, cancel)
+            if code and request.get('response_cache_bytes'):
+                response_cache.put(cache_key, code, model=request.get('model') or '',
+                                   prompt=request.get('prompt') or '')
+            return code, flight_status
+
+        flight = (asyncio.ensure_future(call()), listeners)
+        _async_flights[cache_key] = flight
+        flight[0].add_done_callback(lambda _t: _async_flights.pop(cache_key, None))
+
+    task, listeners = flight
+    if on_text is not None:
+        listeners.append(on_text)
+    # shielded so that cancelling one waiter does not fail the others
+    code, flight_status = await asyncio.shield(task)
+    if status is not None:
+        status.update(flight_status)
+        if shared:
+            print(f"BlenderCopilot: joined in-flight request {cache_key[:12]}")
+            status['coalesced'] = True
+    return code
+
+
+async def _request_completion_async(request, transport, status=None, on_text=None, cancel=None):
+    """Async counterpart of `_request_completion`, including fail-over across a proxy pool."""
+    client = ProxyClient.from_request(request)
+    if not client.base_url:
+        _record_status(status, mode='aiohttp', url='', error='No proxy configured')
+        return None
+
+    pool = (request.get('proxy') or {}).get('pool')
+    if not pool:
+        return await _complete_async(client, request, transport, status, on_text, cancel)
+
+    # proxy pool: fastest healthy endpoint first, fail over to the next one
+    last_err = None
+    for url in proxy_pool.ordered(pool):
+        client = ProxyClient.from_request(request)
+        client.base_url = url
         try:
-            resp = openai.ChatCompletion.create(model=model_to_use, messages=messages, max_tokens=1500)
+            code = await _complete_async(client, request, transport, status, on_text, cancel)
         except Exception as e:
-            print(f"BlenderCopilot: OpenAI SDK request failed: {e}")
-            return None
+            last_err = e
+            code = None
+        if code:
+            proxy_pool.record_success(url, client.pool_latency)
+            return code
+        if cancel is not None and cancel.is_set():
+            break
+        if client.first_byte_at is None:
+            # never answered: count against the endpoint's health
+            proxy_pool.record_failure(url, last_err or (status or {}).get('error', ''))
+        else:
+            # the proxy answered but produced no code; another one will not do better
+            break
+    if last_err is not None:
+        raise last_err
+    return None
 
-        # Parse response
-        try:
-            choices = resp.get('choices') if isinstance(resp, dict) else None
-            if choices and isinstance(choices, list) and len(choices) > 0:
-                first = choices[0]
-                if isinstance(first, dict):
-                    msg = first.get('message') or first.get('delta') or {}
-                    if isinstance(msg, dict) and 'content' in msg:
-                        text = msg.get('content')
-                    else:
-                        text = first.get('text') or ''
-                else:
-                    text = ''
-            else:
-                text = str(resp)
-        except Exception:
-            text = ''
 
-        if not text:
-            return None
+async def _complete_async(client, request, transport, status=None, on_text=None, cancel=None):
+    """One completion against `client.base_url` over the aiohttp transport; code or None.
 
-        blocks = re.findall(r'```(?:python\s*\n)?(.*?)```', text, re.DOTALL)
-        candidate = blocks[0] if blocks else text
-        candidate = re.sub(r'^python', '', candidate, flags=re.MULTILINE)
+    Records latency like `ProxyClient.complete`.
+    """
+    client._start(bool(request.get('stream')))
+    code = None
+    try:
+        code = await _complete_async_on(client, request, transport, status, client._relay(on_text), cancel)
+        return code
+    finally:
+        client._record_latency(code is not None)
+
+
+async def _complete_async_on(client, request, transport, status, on_text, cancel):
+    base_url = client.base_url
+    stream = client.stream
+    model_to_use = client.model
+    stop_at_first_block = stream and bool(request.get('stop_at_first_block'))
+
+    payload = {'model': model_to_use, 'messages': request['messages'], 'max_tokens': MAX_COMPLETION_TOKENS}
+    if stream:
+        payload['stream'] = True
+    if request.get('stop_sequences'):
+        payload['stop'] = STOP_SEQUENCES
+    headers = {'Content-Type': 'application/json'}
+    if client.key:
+        headers['Authorization'] = f"Bearer {client.key}"
+
+    proxy_path = client.path
+    candidate_urls = chat_candidate_urls(base_url, proxy_path, model_to_use)
+    cached_url = get_cached_endpoint(base_url, proxy_path, model_to_use, 'chat', client.endpoint_ttl)
+    if cached_url:
+        candidate_urls = [cached_url] + [u for u in candidate_urls if u != cached_url]
+
+    retry = client.retry_policy.start()
+
+    async def open_chat(url, retry=None, payload=payload):
+        print(f"BlenderCopilot: trying proxy endpoint (async): {url}")
+        start = time.monotonic()
+        resp = await transport.open('POST', url, headers=headers, json_body=payload, timeout=client.timeouts,
+                                    retry=retry)
+        client.header_latency = time.monotonic() - start
+        return resp
+
+    async def probe(url):
+        async with await open_chat(url, payload=chat_probe_payload(model_to_use)) as resp:
+            await resp.read()
+        return True
+
+    async def consume(url, resp):
+        candidate = await _consume_chat_async(resp, status, stream, on_text, stop_at_first_block, cancel)
+        # the whole body was read (streamed tokens mark the first byte as they arrive)
+        client._mark_first_byte()
+        if candidate:
+            remember_endpoint(base_url, proxy_path, model_to_use, 'chat', url)
         return candidate
 
+    last_err = None
+    if not cached_url and client.race_discovery and len(candidate_urls) > 1:
+        url, _found, errors = await transport.race(candidate_urls, probe)
+        if url is not None:
+            remember_endpoint(base_url, proxy_path, model_to_use, 'chat', url)
+            cached_url = url
+            candidate_urls = [url]
+        else:
+            candidate_urls = [u for u in candidate_urls if getattr(errors.get(u), 'status', None) in RETRY_STATUSES]
+            if errors:
+                last_err = errors[list(errors)[-1]]
+
+    try:
+        for url in candidate_urls:
+            try:
+                candidate = await consume(url, await open_chat(url, retry))
+                if candidate:
+                    return candidate
+            except ProxyHTTPError as he:
+                last_err = he
+                print(f"BlenderCopilot: endpoint {url} returned HTTPError: {he}; body: {he.body}")
+                if he.status in RETRY_STATUSES:
+                    break
+            except CircuitOpenError as ce:
+                last_err = ce
+                print(f"BlenderCopilot: {ce}")
+                break
+            except Exception as e:
+                last_err = e
+                print(f"BlenderCopilot: endpoint {url} failed: {e}")
+                if transport.error_cause(e) == 'connect':
+                    break
+            if url == cached_url:
+                forget_endpoint(base_url, proxy_path, model_to_use, 'chat')
     finally:
-        # restore previous openai client settings
-        try:
-            if old_api_base is None:
-                if hasattr(openai, 'api_base'):
-                    delattr(openai, 'api_base')
-            else:
-                openai.api_base = old_api_base
+        _record_retries(status, retry)
 
-            if old_api_key is None:
-                if hasattr(openai, 'api_key'):
-                    delattr(openai, 'api_key')
-            else:
-                openai.api_key = old_api_key
-        except Exception:
-            pass
+    if last_err:
+        print(f"BlenderCopilot: async proxy attempts failed; last error: {last_err}")
+        _record_status(status, mode='aiohttp', url=base_url,
+                       error=getattr(last_err, 'body', '') or str(last_err))
+    return None
+
+
+async def _consume_chat_async(resp, status=None, stream=False, on_text=None, stop_at_first_block=False,
+                              cancel=None):
+    """Async counterpart of `_consume_chat` for an aiohttp response; None once `cancel` is set."""
+    _record_status(status, mode='aiohttp-stream' if stream else 'aiohttp', url=str(resp.url), error='')
+    async with resp:
+        content_type = resp.headers.get('Content-Type', '') or ''
+        if stream and 'event-stream' in content_type:
+            collector = _TextCollector(on_text, stop_at_first_block, status, cancel)
+            decoder = SSEDecoder()
+            finished = cut = False
+            async for raw in resp.content:
+                if cancel is not None and cancel.is_set():
+                    cut = True
+                    break
+                data = decoder.feed(raw)
+                if data is None:
+                    continue
+                token = event_text(data)
+                if token is None:
+                    finished = True
+                    break
+                if collector.add(token):
+                    cut = True
+                    break
+            if not (finished or cut):
+                # like `iter_sse_data`: the last event may end without a blank line
+                data = decoder.flush()
+                token = event_text(data) if data is not None else None
+                if token:
+                    collector.add(token)
+            if cut:
+                # drop the connection rather than reading the rest of the answer
+                resp.close()
+            text = collector.text
+        else:
+            text = _parse_completion_body(await resp.text(), status)
+
+    if cancel is not None and cancel.is_set():
+        # a cut-off answer must not be run or cached
+        return None
+
+    candidate = extract_code_block(text)
+    if candidate and len(candidate.strip()) > 0:
+        return candidate
+    return None
+
+
+def generate_blender_code(prompt, chat_history, context, system_prompt, addon_name):
+    """Build messages and call the LLM synchronously.
+
+    Convenience wrapper around `build_generation_request` and
+    `run_generation_request` for callers that are fine with blocking the
+    main thread. The Execute operator uses the background engine instead.
+
+    Returns: string (extracted code) or None on failure.
+    """
+    request = build_generation_request(prompt, chat_history, context, system_prompt, addon_name)
+    status = {}
+    try:
+        return run_generation_request(request, status)
+    finally:
+        apply_proxy_status(context.scene, status)
 
 
 def resolve_addon_key(preferences, candidate_name):